@@ -18,7 +18,9 @@ def get_generation_process_df(regions=None, **kwargs):
     """
     Create a dataframe of emissions from power generation by fuel type in each
     region. kwargs would include the upstream emissions dataframe (upstream_df) if
-    upstream emissions are being included.
+    upstream emissions are being included, or the facility-level dataframe
+    (facility_df) from get_generation_facility_df if it has already been
+    created.
 
     Parameters
     ----------
@@ -39,6 +41,59 @@ def get_generation_process_df(regions=None, **kwargs):
        'Emission_factor', 'Reliability_Score', 'GeographicalCorrelation',
        'GeomMean', 'GeomSD', 'Maximum', 'Minimum'
     """
+    gen_plus_fuels = kwargs.get("facility_df")
+    if gen_plus_fuels is None:
+        gen_plus_fuels = get_generation_facility_df(**kwargs)
+    if regions is None:
+        regions = config.model_specs.regional_aggregation
+    if regions in ["BA","FERC","US"]:
+        generation_process_df = aggregate_gen(
+            gen_plus_fuels, subregion="BA"
+        )
+    else:
+        generation_process_df = aggregate_gen(
+            gen_plus_fuels, subregion=regions
+        )
+    return generation_process_df
+
+
+def get_monthly_generation_process_df(facility_df, regions=None):
+    """
+    Create a dataframe of monthly emission factors from power generation by
+    fuel type in each region.
+
+    Parameters
+    ----------
+    facility_df : dataframe
+        Facility-level emissions as generated by get_generation_facility_df
+    regions : str, optional
+        Regions to include in the analysis (the default is None, which uses the value
+        read from a settings YAML file).
+
+    Returns
+    -------
+    DataFrame
+        Same columns as get_generation_process_df with an added "Month"
+        column (1-12).
+    """
+    from electricitylci.generation import create_monthly_generation_process_df
+
+    monthly_df = create_monthly_generation_process_df(
+        facility_df, config.model_specs.eia_gen_year
+    )
+    return get_generation_process_df(regions, facility_df=monthly_df)
+
+
+def get_generation_facility_df(**kwargs):
+    """
+    Create the facility-level dataframe of emissions (and fuel inputs if
+    upstream processes are included) used to build the generation processes.
+    kwargs are the same as for get_generation_process_df.
+
+    Returns
+    -------
+    DataFrame
+    """
     from electricitylci.generation import create_generation_process_df
     from electricitylci.combinator import concat_clean_upstream_and_plant
     if config.model_specs.include_renewable_generation is True:
@@ -82,17 +137,7 @@ def get_generation_process_df(regions=None, **kwargs):
 #        generation_process_df = aggregate_gen(
 #            gen_plus_fuels, subregion=regions
 #        )
-    if regions is None:
-        regions = config.model_specs.regional_aggregation
-    if regions in ["BA","FERC","US"]:
-        generation_process_df = aggregate_gen(
-            gen_plus_fuels, subregion="BA"
-        )
-    else:
-        generation_process_df = aggregate_gen(
-            gen_plus_fuels, subregion=regions
-        )
-    return generation_process_df
+    return gen_plus_fuels
 
 
 def get_generation_mix_process_df(regions=None):
@@ -194,52 +239,52 @@ def write_generation_process_database_to_dict(gen_database, regions=None):
 
 
 def write_generation_mix_database_to_dict(
-    genmix_database, gen_dict, regions=None
+    genmix_database, gen_dict, regions=None, providers=None
 ):
     from electricitylci.generation_mix import olcaschema_genmix
     if regions is None:
         regions = config.model_specs.regional_aggregation
     if regions in ["FERC","US","BA"]:
         genmix_dict = olcaschema_genmix(
-                genmix_database, gen_dict, subregion="BA"
+                genmix_database, gen_dict, subregion="BA", providers=providers
         )
     else:
         genmix_dict = olcaschema_genmix(
-            genmix_database, gen_dict, subregion=regions
+            genmix_database, gen_dict, subregion=regions, providers=providers
         )
     return genmix_dict
 
 
 def write_fuel_mix_database_to_dict(
-    genmix_database, gen_dict, regions=None
+    genmix_database, gen_dict, regions=None, providers=None
 ):
     from electricitylci.generation_mix import olcaschema_usaverage
     if regions is None:
         regions = config.model_specs.regional_aggregation
     if regions in ["FERC","US","BA"]:
         usaverage_dict = olcaschema_usaverage(
-                genmix_database, gen_dict, subregion="BA"
+                genmix_database, gen_dict, subregion="BA", providers=providers
         )
     else:
         usaverage_dict = olcaschema_usaverage(
-            genmix_database, gen_dict, subregion=regions
+            genmix_database, gen_dict, subregion=regions, providers=providers
         )
     return usaverage_dict
 
 
 def write_international_mix_database_to_dict(
-    genmix_database, usfuelmix_dict, regions=None
+    genmix_database, usfuelmix_dict, regions=None, providers=None
 ):
     from electricitylci.generation_mix import olcaschema_international;
     if regions is None:
         regions = config.model_specs.regional_aggregation
     if regions in ["FERC","US","BA"]:
         international_dict = olcaschema_international(
-                genmix_database, usfuelmix_dict, subregion="BA"
+                genmix_database, usfuelmix_dict, subregion="BA", providers=providers
         )
     else:
         international_dict = olcaschema_international(
-            genmix_database, usfuelmix_dict, subregion=regions
+            genmix_database, usfuelmix_dict, subregion=regions, providers=providers
         )
     return international_dict
 
@@ -268,10 +313,13 @@ def write_distribution_dict():
     return distribution_mix_dictionary()
 
 
-def write_process_dicts_to_jsonld(*process_dicts):
+def write_process_dicts_to_jsonld(*process_dicts, providers=None):
     """
     Send one or more process dictionaries to be written to json-ld
 
+    If an index of providers is given (see utils.index_processes), the
+    written processes are added to it, for linking the processes written
+    after them.
     """
     from electricitylci.olca_jsonld_writer import write
     
@@ -280,6 +328,10 @@ def write_process_dicts_to_jsonld(*process_dicts):
         all_process_dicts = {**all_process_dicts, **d}
 
     olca_dicts = write(all_process_dicts, config.model_specs.namestr)
+    if providers is not None:
+        from electricitylci.utils import index_processes
+
+        index_processes(olca_dicts, index=providers)
     return olca_dicts
 
 
@@ -529,13 +581,15 @@ def get_distribution_mix_df(combined_df, subregion=None):
     return td_loss_df
 
 
-def write_distribution_mix_to_dict(dist_mix_df, gen_mix_dict, subregion=None):
+def write_distribution_mix_to_dict(
+    dist_mix_df, gen_mix_dict, subregion=None, providers=None
+):
     import electricitylci.eia_trans_dist_grid_loss as tnd
     if subregion is None:
         subregion = config.model_specs.regional_aggregation
 
     dist_mix_dict = tnd.olca_schema_distribution_mix(
-        dist_mix_df, gen_mix_dict, subregion=subregion
+        dist_mix_df, gen_mix_dict, subregion=subregion, providers=providers
     )
     return dist_mix_dict
 
@@ -551,12 +605,68 @@ def get_consumption_mix_df(subregion=None, regions_to_keep=None):
     return io_trade_df
 
 
-def write_consumption_mix_to_dict(cons_mix_df, dist_mix_dict, subregion=None):
+def write_consumption_mix_to_dict(
+    cons_mix_df, dist_mix_dict, subregion=None, providers=None
+):
     import electricitylci.eia_io_trading as trade
     if subregion is None:
         subregion = config.model_specs.regional_aggregation
 
     cons_mix_dict = trade.olca_schema_consumption_mix(
-        cons_mix_df, dist_mix_dict, subregion=subregion
+        cons_mix_df, dist_mix_dict, subregion=subregion, providers=providers
     )
     return cons_mix_dict
+
+
+def get_hourly_emission_intensity_df(year=None):
+    """
+    Create a dataframe of hourly emission intensities for each balancing
+    authority from EPA CEMS emissions and EIA hourly net generation.
+
+    Parameters
+    ----------
+    year : int, optional
+        Data year (the default is None, which uses eia_gen_year from the
+        model configuration).
+
+    Returns
+    -------
+    DataFrame
+        One row per balancing authority and UTC hour.
+    """
+    from electricitylci.hourly_emissions import (
+        generate_hourly_emission_intensity,
+    )
+
+    if year is None:
+        year = config.model_specs.eia_gen_year
+    return generate_hourly_emission_intensity(year)
+
+
+def get_cumulative_inventory_df(*process_dicts, targets=None):
+    """
+    Calculate cumulative inventories from the process dictionaries of a
+    model run by solving their technosphere matrix.
+
+    Parameters
+    ----------
+    *process_dicts: dictionary
+        Dictionaries of openLCA schema processes, e.g. the upstream,
+        generation, mix and distribution dictionaries
+    targets : list, optional
+        Names of the processes to calculate (the default is None, which
+        calculates every process).
+
+    Returns
+    -------
+    DataFrame
+        One row per flow and one column per target process, per unit of
+        its reference product.
+    """
+    from electricitylci.technosphere import (
+        build_matrices,
+        cumulative_inventory,
+    )
+
+    matrices = build_matrices(*process_dicts)
+    return cumulative_inventory(matrices, targets=targets)
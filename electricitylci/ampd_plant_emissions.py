@@ -1,3 +1,7 @@
+import hashlib
+import os
+from os.path import join
+
 import pandas as pd
 import numpy as np
 from electricitylci.globals import data_dir, output_dir
@@ -9,6 +13,147 @@ import fedelemflowlist
 from electricitylci.model_config import model_specs
 
 import logging
+import electricitylci.dataset_cache as dataset_cache
+
+MONTHS = [
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+]
+
+# Version of the saved plant emissions artifact. Increase it whenever
+# generate_plant_emissions changes its output so old artifacts are not used.
+PLANT_EMISSIONS_VERSION = 1
+
+# Pollutants with measured monthly CEMS masses, mapped to their flow names.
+CEMS_PROFILE_FLOWS = {
+    "co2_mass_tons": "Carbon dioxide",
+    "so2_mass_tons": "Sulfur dioxide",
+    "nox_mass_tons": "Nitrogen oxides",
+}
+
+
+# The boiler fuel content is used on the SO2 path of every run and by
+# anything else needing fuel quality, so it is only calculated once per year.
+@dataset_cache.cached_dataset("eia923")
+def eia_boiler_fuel_content(year):
+    """
+    Calculate the annual, quantity-weighted sulfur and ash content of the fuel
+    burned in each boiler reported in EIA-923 Page 3 (Boiler Fuel Data).
+
+    Parameters
+    ----------
+    year : int
+        Year of EIA-923 data to use
+
+    Returns
+    -------
+    dataframe
+        One row per plant, boiler, prime mover and fuel code with the
+        monthly quantity-weighted sulfur and ash content summed over the year
+        ("Sulfur Weighted", "Ash Weighted"), the annual fuel quantity and the
+        resulting average contents in percent.
+    """
+    eia923_boiler = eia923.eia923_boiler_fuel(year)
+    fuel_quantity_monthly = [
+        f"quantity_of_fuel_consumed_{month}" for month in MONTHS
+    ]
+    sulfur_content_monthly = [f"sulfur_content_{month}" for month in MONTHS]
+    ash_content_monthly = [f"ash_content_{month}" for month in MONTHS]
+
+    quantity = (
+        eia923_boiler[fuel_quantity_monthly]
+        .apply(pd.to_numeric, errors="coerce")
+        .values
+    )
+    boiler_content = eia923_boiler[
+        [
+            "plant_id",
+            "boiler_id",
+            "reported_prime_mover",
+            "reported_fuel_type_code",
+        ]
+    ].copy()
+    boiler_content["total_fuel_consumption_quantity"] = pd.to_numeric(
+        eia923_boiler["total_fuel_consumption_quantity"], errors="coerce"
+    )
+    boiler_content["Sulfur Weighted"] = np.nansum(
+        quantity
+        * eia923_boiler[sulfur_content_monthly]
+        .apply(pd.to_numeric, errors="coerce")
+        .values,
+        axis=1,
+    )
+    boiler_content["Ash Weighted"] = np.nansum(
+        quantity
+        * eia923_boiler[ash_content_monthly]
+        .apply(pd.to_numeric, errors="coerce")
+        .values,
+        axis=1,
+    )
+    boiler_content["Avg Sulfur Content (%)"] = (
+        boiler_content["Sulfur Weighted"]
+        / boiler_content["total_fuel_consumption_quantity"]
+    )
+    boiler_content["Avg Ash Content (%)"] = (
+        boiler_content["Ash Weighted"]
+        / boiler_content["total_fuel_consumption_quantity"]
+    )
+    return boiler_content
+
+
+def eia_wtd_sulfur_content(year):
+    """
+    Determine the weighted average sulfur content of all fuel types reported
+    in EIA-923 Monthly Boiler Fuel Consumption and Emissions Time Series File.
+
+    The weighted average is derived from the monthly fuel quantities and
+    sulfur content of every boiler in a single grouped calculation. This
+    approach implicitly assumes that the composition of fuels consumed in
+    steam boilers are representative of their respective fuel class, and
+    can be applied to thermal generation without loss of generality. For
+    example, the sulfur content of bituminous coal consumed for steam
+    generators is assumed to be representative of bituminous coal consumed
+    across other prime movers technologies and/or thermal generation
+    technologies.
+
+    Parameters
+    ----------
+    year : int
+        Year of EIA-923 data to use
+
+    Returns
+    -------
+    dataframe
+        One row for each unique reported fuel type code with columns
+        "reported_fuel_type_code" and "Avg Sulfur Content (%)".
+    """
+    boiler_content = eia_boiler_fuel_content(year)
+    sulfur_content_agg = (
+        boiler_content.dropna(subset=["reported_fuel_type_code"])
+        .groupby(["reported_fuel_type_code"], as_index=False)[
+            ["Sulfur Weighted", "total_fuel_consumption_quantity"]
+        ]
+        .sum()
+    )
+    sulfur_content_agg["Avg Sulfur Content (%)"] = (
+        sulfur_content_agg["Sulfur Weighted"]
+        / sulfur_content_agg["total_fuel_consumption_quantity"]
+    )
+    sulfur_content_agg = sulfur_content_agg[
+        ["reported_fuel_type_code", "Avg Sulfur Content (%)"]
+    ]
+
+    return sulfur_content_agg
 
 
 def generate_plant_emissions(year):
@@ -186,114 +331,94 @@ def generate_plant_emissions(year):
 
         return emissions_check
 
-    def eia_gen_fuel_co2_ch4_n2o_emissions(eia923_gen_fuel):
-
-        emissions = pd.DataFrame()
-
-        for row in ef_co2_ch4_n2o.itertuples():
-
-            fuel_type = eia923_gen_fuel_sub.loc[
-                eia923_gen_fuel_sub["reported_fuel_type_code"].astype(str)
-                == str(row.EIA_Fuel_Type_Code)
-            ].copy()
-
-            fuel_type["CO2 (Tons)"] = (row.ton_CO2_mmBtu) * fuel_type[
-                "total_fuel_consumption_mmbtu"
-            ].astype(float, errors="ignore")
-            fuel_type["CH4 (lbs)"] = (row.pound_methane_per_mmbtu) * fuel_type[
-                "total_fuel_consumption_mmbtu"
-            ].astype(float, errors="ignore")
-            fuel_type["N2O (lbs)"] = (row.pound_n2o_per_mmBtu) * fuel_type[
-                "total_fuel_consumption_mmbtu"
-            ].astype(float, errors="ignore")
-
-            emissions = pd.concat([emissions, fuel_type])
+    def co2_ch4_n2o_from_fuel_use(fuel_use):
+        """Applies the CO2, CH4 and N2O emission factors to plant fuel use.
 
+        Fuel use is first summed per plant and reported fuel code, joined once
+        to the normalized factor table and multiplied against the heat input
+        for all three pollutants at the same time.
+        """
+        plant_fuel_cols = [
+            "plant_id",
+            "plant_name",
+            "operator_name",
+            "reported_fuel_type_code",
+        ]
+        fuel_use = fuel_use.copy()
+        fuel_use["reported_fuel_type_code"] = fuel_use[
+            "reported_fuel_type_code"
+        ].astype(str)
+        fuel_use = fuel_use.groupby(plant_fuel_cols, as_index=False)[
+            ["total_fuel_consumption_mmbtu", "total_fuel_consumption_quantity"]
+        ].sum()
+        emissions = fuel_use.merge(
+            ef_co2_ch4_n2o_norm, on=["reported_fuel_type_code"], how="inner"
+        )
+        emissions[co2_ch4_n2o_cols] = emissions[co2_ch4_n2o_cols].values * (
+            emissions[["total_fuel_consumption_mmbtu"]].values
+        )
         emissions_agg = emissions.groupby(
-            ["plant_id", "plant_name", "operator_name"]
+            ["plant_id", "plant_name", "operator_name"], as_index=False
         )[
-            "CO2 (Tons)",
-            "CH4 (lbs)",
-            "N2O (lbs)",
-            "total_fuel_consumption_mmbtu",
-            "total_fuel_consumption_quantity",
+            co2_ch4_n2o_cols
+            + [
+                "total_fuel_consumption_mmbtu",
+                "total_fuel_consumption_quantity",
+            ]
         ].sum()
-        emissions_agg = emissions_agg.reset_index()
         emissions_agg["plant_id"] = emissions_agg["plant_id"].astype(str)
 
         return emissions_agg
 
-    def eia_boiler_co2_ch4_n2o_emissions(eia923_boiler):
-
-        emissions = pd.DataFrame()
+    def eia_gen_fuel_co2_ch4_n2o_emissions(eia923_gen_fuel):
 
-        for row in ef_co2_ch4_n2o.itertuples():
-
-            fuel_type = eia923_boiler_sub.loc[
-                eia923_boiler_sub["reported_fuel_type_code"].astype(str)
-                == str(row.EIA_Fuel_Type_Code)
-            ].copy()
-
-            fuel_heating_value_monthly = [
-                "mmbtu_per_unit_january",
-                "mmbtu_per_unit_february",
-                "mmbtu_per_unit_march",
-                "mmbtu_per_unit_april",
-                "mmbtu_per_unit_may",
-                "mmbtu_per_unit_june",
-                "mmbtu_per_unit_july",
-                "mmbtu_per_unit_august",
-                "mmbtu_per_unit_september",
-                "mmbtu_per_unit_october",
-                "mmbtu_per_unit_november",
-                "mmbtu_per_unit_december",
-            ]
-            fuel_quantity_monthly = [
-                "quantity_of_fuel_consumed_january",
-                "quantity_of_fuel_consumed_february",
-                "quantity_of_fuel_consumed_march",
-                "quantity_of_fuel_consumed_april",
-                "quantity_of_fuel_consumed_may",
-                "quantity_of_fuel_consumed_june",
-                "quantity_of_fuel_consumed_july",
-                "quantity_of_fuel_consumed_august",
-                "quantity_of_fuel_consumed_september",
-                "quantity_of_fuel_consumed_october",
-                "quantity_of_fuel_consumed_november",
-                "quantity_of_fuel_consumed_december",
+        fuel_use = eia923_gen_fuel_sub[
+            [
+                "plant_id",
+                "plant_name",
+                "operator_name",
+                "reported_fuel_type_code",
+                "total_fuel_consumption_mmbtu",
+                "total_fuel_consumption_quantity",
             ]
+        ].copy()
+        fuel_use["total_fuel_consumption_mmbtu"] = pd.to_numeric(
+            fuel_use["total_fuel_consumption_mmbtu"], errors="coerce"
+        )
 
-            fuel_type["total_fuel_consumption_mmbtu"] = (
-                np.multiply(
-                    fuel_type[fuel_heating_value_monthly],
-                    fuel_type[fuel_quantity_monthly],
-                )
-            ).sum(axis=1, skipna=True)
-
-            fuel_type["CO2 (Tons)"] = (row.ton_CO2_mmBtu) * fuel_type[
-                "total_fuel_consumption_mmbtu"
-            ].astype(float, errors="ignore")
-            fuel_type["CH4 (lbs)"] = (row.pound_methane_per_mmbtu) * fuel_type[
-                "total_fuel_consumption_mmbtu"
-            ].astype(float, errors="ignore")
-            fuel_type["N2O (lbs)"] = (row.pound_n2o_per_mmBtu) * fuel_type[
-                "total_fuel_consumption_mmbtu"
-            ].astype(float, errors="ignore")
+        return co2_ch4_n2o_from_fuel_use(fuel_use)
 
-            emissions = pd.concat([emissions, fuel_type])
+    def eia_boiler_co2_ch4_n2o_emissions(eia923_boiler):
 
-        emissions_agg = emissions.groupby(
-            ["plant_id", "plant_name", "operator_name"], as_index=False
-        )[
-            "CH4 (lbs)",
-            "N2O (lbs)",
-            "CO2 (Tons)",
-            "total_fuel_consumption_mmbtu",
-            "total_fuel_consumption_quantity",
-        ].sum()
-        emissions_agg["plant_id"] = emissions_agg["plant_id"].astype(str)
+        fuel_heating_value_monthly = [
+            f"mmbtu_per_unit_{month}" for month in MONTHS
+        ]
+        fuel_quantity_monthly = [
+            f"quantity_of_fuel_consumed_{month}" for month in MONTHS
+        ]
+        fuel_use = eia923_boiler_sub[
+            [
+                "plant_id",
+                "plant_name",
+                "operator_name",
+                "reported_fuel_type_code",
+                "total_fuel_consumption_quantity",
+            ]
+        ].copy()
+        # One multiply over the (boilers x months) arrays rather than per
+        # fuel type. The heating value and quantity columns are paired by
+        # month position, not by column label.
+        fuel_use["total_fuel_consumption_mmbtu"] = np.nansum(
+            eia923_boiler_sub[fuel_heating_value_monthly]
+            .apply(pd.to_numeric, errors="coerce")
+            .values
+            * eia923_boiler_sub[fuel_quantity_monthly]
+            .apply(pd.to_numeric, errors="coerce")
+            .values,
+            axis=1,
+        )
 
-        return emissions_agg
+        return co2_ch4_n2o_from_fuel_use(fuel_use)
 
     def eia_gen_fuel_net_gen(eia923_gen_fuel):
 
@@ -690,91 +815,6 @@ def generate_plant_emissions(year):
         emissions_agg = emissions_agg.rename(columns={"NOx_lbs": "NOx (lbs)"})
         return emissions_agg
 
-    def eia_wtd_sulfur_content(eia923_boiler):
-        """This function determines the weighted average sulfur content of all reported fuel types
-    reported in EIA-923 Monthly Boiler Fuel Consumption and Emissions Time Series File.
-    Weighted average fuel sulfur content is derived via monthly fuel quantities and sulfur content reported
-    in 'EIA-923 Monthly Boiler Fuel Consumption and Emissions Time Series File'. This approach implicitly
-    assumes that the composition of fuels consumed in steam boilers are representative of their respective fuel class,
-    and can be applied to thermal generation without loss of generality. For example, the sulfur content of bitumiunous coal
-    consumed for steam generators is assumed to be representative of bituminious coal consumed across other prime movers technologies
-    and/or thermal generation technologies.
-
-    Arguments:
-        eia923_boiler {[Dataframe]} -- This dataframe contains all information in 'EIA-923 Monthly Boiler Fuel
-        Consumption and Emissions Time Series File'
-
-    Returns:
-        [sulfur_content_agg] -- A 39x1 dataframe, the index represents all unqiue EIA reported fuel
-        code types in the 'EIA-923 Monthly Boiler Fuel Consumption and Emissions Time Series File'.
-        The rows represent the weigthed average sulfur fuel content for the select fuel.
-        """
-
-        sulfur_content = pd.DataFrame()
-        eia923_boiler_drop_na = eia923_boiler.dropna(
-            subset=["reported_fuel_type_code"]
-        )
-        eia923_boiler_unique_fuel_codes = (
-            eia923_boiler[["reported_fuel_type_code"]]
-            .drop_duplicates()
-            .dropna()
-        )
-        eia923_boiler_unique_fuel_codes.columns = ["reported_fuel_type_code"]
-
-        for row in eia923_boiler_unique_fuel_codes.itertuples():
-            fuel_type = eia923_boiler_drop_na.loc[
-                eia923_boiler_drop_na["reported_fuel_type_code"].astype(str)
-                == str(row.reported_fuel_type_code)
-            ].copy()
-            fuel_quantity_monthly = [
-                "quantity_of_fuel_consumed_january",
-                "quantity_of_fuel_consumed_february",
-                "quantity_of_fuel_consumed_march",
-                "quantity_of_fuel_consumed_april",
-                "quantity_of_fuel_consumed_may",
-                "quantity_of_fuel_consumed_june",
-                "quantity_of_fuel_consumed_july",
-                "quantity_of_fuel_consumed_august",
-                "quantity_of_fuel_consumed_september",
-                "quantity_of_fuel_consumed_october",
-                "quantity_of_fuel_consumed_november",
-                "quantity_of_fuel_consumed_december",
-            ]
-            sulfur_content_monthly = [
-                "sulfur_content_january",
-                "sulfur_content_february",
-                "sulfur_content_march",
-                "sulfur_content_april",
-                "sulfur_content_may",
-                "sulfur_content_june",
-                "sulfur_content_july",
-                "sulfur_content_august",
-                "sulfur_content_september",
-                "sulfur_content_october",
-                "sulfur_content_november",
-                "sulfur_content_december",
-            ]
-            fuel_type["Sulfur Weighted"] = (
-                np.multiply(
-                    fuel_type[fuel_quantity_monthly],
-                    fuel_type[sulfur_content_monthly],
-                )
-            ).sum(axis=1, skipna=True)
-            frames = [sulfur_content, fuel_type]
-            sulfur_content = pd.concat(frames)
-        sulfur_content_agg = sulfur_content.groupby(
-            ["reported_fuel_type_code"], as_index=False
-        )["Sulfur Weighted", "total_fuel_consumption_quantity"].sum()
-        sulfur_content_agg["Avg Sulfur Content (%)"] = (
-            sulfur_content_agg["Sulfur Weighted"]
-            / sulfur_content_agg["total_fuel_consumption_quantity"]
-        )
-        sulfur_content_agg = sulfur_content_agg[
-            ["reported_fuel_type_code", "Avg Sulfur Content (%)"]
-        ]
-
-        return sulfur_content_agg
-
     def eia_primary_fuel(row):
         if row["Primary Fuel %"] < model_specs.min_plant_percent_generation_from_primary_fuel_category/100:
             return "Mixed Fuel Type"
@@ -873,6 +913,24 @@ def generate_plant_emissions(year):
     ef_co2_ch4_n2o = pd.read_excel(
         f"{data_dir}/EFs/eLCI EFs.xlsx", sheet_name="CO2,CH4,N2O"
     )
+    co2_ch4_n2o_cols = ["CO2 (Tons)", "CH4 (lbs)", "N2O (lbs)"]
+    ef_co2_ch4_n2o_norm = ef_co2_ch4_n2o[
+        [
+            "EIA_Fuel_Type_Code",
+            "ton_CO2_mmBtu",
+            "pound_methane_per_mmbtu",
+            "pound_n2o_per_mmBtu",
+        ]
+    ].copy()
+    ef_co2_ch4_n2o_norm.columns = [
+        "reported_fuel_type_code"
+    ] + co2_ch4_n2o_cols
+    ef_co2_ch4_n2o_norm["reported_fuel_type_code"] = ef_co2_ch4_n2o_norm[
+        "reported_fuel_type_code"
+    ].astype(str)
+    ef_co2_ch4_n2o_norm[co2_ch4_n2o_cols] = ef_co2_ch4_n2o_norm[
+        co2_ch4_n2o_cols
+    ].apply(pd.to_numeric, errors="coerce")
     ef_so2 = pd.read_csv(f"{data_dir}/EFs/eLCI EFs_SO2.csv", index_col=0)
     ef_nox = pd.read_csv(f"{data_dir}/EFs/eLCI EFs_NOx.csv", index_col=0)
     eia_nox_rate = eia923_aec[
@@ -940,8 +998,7 @@ def generate_plant_emissions(year):
         eia923_gen_fuel[["reported_fuel_type_code"]].drop_duplicates().dropna()
     )
     wtd_sulfur_content_fuel = eia923_gen_fuel_unique_fuel_codes.merge(
-        # Check this routine
-        eia_wtd_sulfur_content(eia923_boiler),
+        eia_wtd_sulfur_content(year),
         on=["reported_fuel_type_code"],
         how="outer",
     ).fillna(0)
@@ -1504,6 +1561,128 @@ def generate_plant_emissions(year):
     return netl_harmonized_melt
 
 
+def _plant_emissions_key():
+    """
+    Hash the emission factor files and the model settings used by
+    generate_plant_emissions so that saved results are only reused when
+    none of them have changed.
+    """
+    hasher = hashlib.sha1()
+    ef_dir = join(data_dir, "EFs")
+    for fn in sorted(os.listdir(ef_dir)):
+        hasher.update(fn.encode())
+        with open(join(ef_dir, fn), "rb") as f:
+            hasher.update(f.read())
+    primary_fuel_settings = (
+        model_specs.min_plant_percent_generation_from_primary_fuel_category,
+        model_specs.keep_mixed_plant_category,
+    )
+    hasher.update(str(primary_fuel_settings).encode())
+    return hasher.hexdigest()[:16]
+
+
+def load_plant_emissions(year):
+    """
+    Return the output of generate_plant_emissions for the given year, loading
+    it from a saved artifact when one exists.
+
+    Artifacts are stored in data/plant_emissions and named with the year,
+    PLANT_EMISSIONS_VERSION and a hash of the files in data/EFs (plus the
+    primary fuel settings from the model configuration). A change to any of
+    these creates a new artifact rather than reusing an old one. Artifacts
+    are pickled so column dtypes round-trip exactly.
+
+    Parameters
+    ----------
+    year : int
+        Year of data to use (Air Markets Program Data, EIA 923, etc.)
+
+    Returns
+    -------
+    dataframe
+        Same as generate_plant_emissions
+    """
+    artifact_dir = join(data_dir, "plant_emissions")
+    artifact_path = join(
+        artifact_dir,
+        f"plant_emissions_{year}_v{PLANT_EMISSIONS_VERSION}_"
+        f"{_plant_emissions_key()}.pkl",
+    )
+    if os.path.exists(artifact_path):
+        logging.info(f"Loading {year} plant emissions from {artifact_path}")
+        return pd.read_pickle(artifact_path)
+    netl_harmonized_melt = generate_plant_emissions(year)
+    os.makedirs(artifact_dir, exist_ok=True)
+    netl_harmonized_melt.to_pickle(artifact_path)
+    return netl_harmonized_melt
+
+
+def _monthly_fractions(monthly_values, profile):
+    """
+    Convert a plant x month table of values into the fraction of each plant's
+    annual total that falls in each month. Plants with no annual total are
+    dropped so that callers can fall back to another profile.
+    """
+    annual = monthly_values.sum(axis=1)
+    monthly_values = monthly_values.loc[(annual != 0) & annual.notna(), :]
+    fractions = monthly_values.div(annual[monthly_values.index], axis=0)
+    fractions.columns = list(range(1, 13))
+    fractions.index.name = "eGRID_ID"
+    fractions = fractions.reset_index()
+    fractions.insert(1, "profile", profile)
+    return fractions
+
+
+def generate_monthly_plant_profiles(year):
+    """
+    Build the monthly profiles used to spread annual plant emissions and
+    generation over the months of the year.
+
+    The "Electricity" and "Fuel" profiles come from the monthly net generation
+    and total fuel heat input in EIA-923 Page 1. A profile for each pollutant
+    in CEMS_PROFILE_FLOWS comes from the monthly CEMS mass emissions and is
+    meant for emissions whose source is "ampd".
+
+    Parameters
+    ----------
+    year : int
+        Year of data to use (Air Markets Program Data, EIA 923)
+
+    Returns
+    -------
+    dataframe
+        Columns are 'eGRID_ID', 'profile' and the months 1 through 12. Each
+        row holds the fraction of a plant's annual total that occurs in each
+        month.
+    """
+    net_gen_monthly = [f"netgen_{month}" for month in MONTHS]
+    fuel_heat_monthly = [f"tot_mmbtu_{month}" for month in MONTHS]
+    eia923_gen_fuel = eia923.eia923_generation_and_fuel(year)
+    plant_monthly = eia923_gen_fuel[
+        ["plant_id"] + net_gen_monthly + fuel_heat_monthly
+    ].copy()
+    plant_monthly = plant_monthly.apply(pd.to_numeric, errors="coerce")
+    plant_monthly = plant_monthly.dropna(subset=["plant_id"])
+    plant_monthly["plant_id"] = plant_monthly["plant_id"].astype(int)
+    plant_monthly = plant_monthly.groupby("plant_id").sum()
+    profiles = [
+        _monthly_fractions(plant_monthly[net_gen_monthly], "Electricity"),
+        _monthly_fractions(plant_monthly[fuel_heat_monthly], "Fuel"),
+    ]
+
+    ampd_monthly = cems.build_cems_monthly_df(year)
+    for cems_col, flow_name in CEMS_PROFILE_FLOWS.items():
+        cems_plant = ampd_monthly.pivot_table(
+            index="plant_id_eia",
+            columns="month",
+            values=cems_col,
+            aggfunc="sum",
+        ).reindex(columns=list(range(1, 13)), fill_value=0)
+        cems_plant.index = cems_plant.index.astype(int)
+        profiles.append(_monthly_fractions(cems_plant, flow_name))
+    return pd.concat(profiles, ignore_index=True)
+
+
 if __name__ == "__main__":
     netl_harmonized_melt = generate_plant_emissions(2016)
     netl_harmonized_melt.to_csv(f"{output_dir}/netl_harmonized.csv")
@@ -1,18 +1,22 @@
 """Extract hourly real-time EIA data from the bulk-download zip file."""
 
 import pandas as pd
+import numpy as np
 import json
 from os.path import join
 import os
+import re
 import zipfile
 import requests
 import logging
 from electricitylci.globals import data_dir
+from electricitylci.data_bundle import require_network
 
 
 def download_EBA():
     """Add docstring."""
     url = 'http://api.eia.gov/bulk/EBA.zip'
+    require_network(url)
     print(f"Downloading eia bulk data from {url}...", end="")
     r = requests.get(url)
     os.makedirs(join(data_dir, 'bulk_data'), exist_ok=True)
@@ -43,11 +47,6 @@ if __name__=="__main__":
 #    'Southwest', 'Tennessee Valley Authority'
 # ]
 #
-# REGION_ACRONYMS = [
-#    'TVA', 'MIDA', 'CAL', 'CAR', 'CENT', 'ERCO', 'FLA',
-#    'MIDW', 'ISNE', 'NYIS', 'NW', 'SE', 'SW',
-# ]
-#
 # TOTAL_INTERCHANGE_ROWS = [
 #    json.loads(row) for row in raw_txt if b'EBA.TI.H' in row
 # ]
@@ -70,7 +69,196 @@ if __name__=="__main__":
 # ]
 
 
-def row_to_df(rows, data_type):
+# The aggregate EIA regions. Interchange series reported by these regions
+# are not BA-to-BA trades.
+REGION_ACRONYMS = [
+    'TVA', 'MIDA', 'CAL', 'CAR', 'CENT', 'ERCO', 'FLA',
+    'MIDW', 'ISNE', 'NYIS', 'NW', 'SE', 'SW',
+]
+
+# geoset_id of the hourly UTC series of each type. All but one BA reports
+# in both UTC and local time (".HL"), so only the UTC series are used.
+EBA_GEOSETS = {
+    "net_gen": "EBA.NG.H",
+    "demand": "EBA.D.H",
+    "ba_to_ba": "EBA.ID.H",
+}
+
+_SERIES_ID_PATTERN = re.compile(rb'"series_id"\s*:\s*"([^"]+)"')
+_GEOSET_ID_PATTERN = re.compile(rb'"geoset_id"\s*:\s*"([^"]+)"')
+
+
+def _open_eba_zip():
+    try:
+        return zipfile.ZipFile(path, "r")
+    except FileNotFoundError:
+        logging.info("Downloading new bulk data")
+        download_EBA()
+        return zipfile.ZipFile(path, "r")
+
+
+def _eba_index_path():
+    """Name the index after the size and time of the zip it describes."""
+    stat = os.stat(path)
+    return join(
+        data_dir,
+        "bulk_data",
+        f"EBA_index_{stat.st_size}_{int(stat.st_mtime)}.csv",
+    )
+
+
+def _scan_eba(z, geosets=()):
+    """
+    Read EBA.txt from start to end once, indexing every series and keeping
+    the rows of the given geoset_ids.
+
+    Returns
+    -------
+    tuple
+        (index dataframe as in load_eba_index, dictionary of geoset_id: list
+        of rows)
+    """
+    logging.info("Indexing bulk data series")
+    series_ids = []
+    geoset_ids = []
+    offsets = []
+    lengths = []
+    rows = {geoset: [] for geoset in geosets}
+    offset = 0
+    with z.open("EBA.txt") as f:
+        for line in f:
+            match = _SERIES_ID_PATTERN.search(line)
+            if match:
+                series_ids.append(match.group(1).decode())
+                geoset = _GEOSET_ID_PATTERN.search(line)
+                geoset = geoset.group(1).decode() if geoset else ""
+                geoset_ids.append(geoset)
+                offsets.append(offset)
+                lengths.append(len(line))
+                if geoset in rows:
+                    rows[geoset].append(json.loads(line))
+            offset += len(line)
+    index = pd.DataFrame(
+        {
+            "series_id": series_ids,
+            "geoset_id": geoset_ids,
+            "offset": offsets,
+            "length": lengths,
+        }
+    )
+    index.to_csv(_eba_index_path(), index=False)
+    return index, rows
+
+
+def load_eba_index():
+    """
+    Return the byte offset and length of every series in EBA.txt.
+
+    The index is built with a single pass over the file the first time it is
+    needed and saved next to EBA.zip. A new download of EBA.zip gets a new
+    index.
+
+    Returns
+    -------
+    dataframe
+        Columns are "series_id", "geoset_id", "offset" and "length"
+    """
+    z = _open_eba_zip()
+    index_path = _eba_index_path()
+    if os.path.exists(index_path):
+        z.close()
+        return pd.read_csv(index_path)
+    index, _ = _scan_eba(z)
+    z.close()
+    return index
+
+
+def read_eba_rows(data_types):
+    """
+    Read the rows of the given types of hourly series from the bulk data
+    file in a single pass, without parsing any other rows.
+
+    With a saved series index (see load_eba_index), the reader seeks from
+    one wanted row to the next in file order. Seeking in the compressed
+    member still decompresses the skipped bytes, so all of the types are
+    read together rather than with one pass each. Without an index, the
+    index is built in the same pass.
+
+    Parameters
+    ----------
+    data_types : list
+        Keys of EBA_GEOSETS ("net_gen", "demand" and/or "ba_to_ba")
+
+    Returns
+    -------
+    dict
+        Data type: the matching rows of EBA.txt as dictionaries
+    """
+    geosets = {EBA_GEOSETS[data_type]: data_type for data_type in data_types}
+    z = _open_eba_zip()
+    index_path = _eba_index_path()
+    if not os.path.exists(index_path):
+        _, rows = _scan_eba(z, geosets)
+        z.close()
+        return {geosets[geoset]: r for geoset, r in rows.items()}
+    index = pd.read_csv(index_path)
+    index = index.loc[
+        index["geoset_id"].isin(geosets), :
+    ].sort_values("offset")
+    rows = {data_type: [] for data_type in data_types}
+    with z.open("EBA.txt") as f:
+        for offset, length, geoset in zip(
+            index["offset"], index["length"], index["geoset_id"]
+        ):
+            f.seek(offset)
+            rows[geosets[geoset]].append(json.loads(f.read(length)))
+    z.close()
+    return rows
+
+
+def _series_to_arrays(rows, year=None):
+    """
+    Flatten the "data" lists of bulk data rows into arrays, keeping only the
+    given year, and parse all timestamps in one call.
+
+    Returns
+    -------
+    tuple
+        (array of the index of the source row for each value, datetimes,
+        values)
+    """
+    row_idx = []
+    stamps = []
+    values = []
+    year_prefix = None if year is None else str(year)
+    for i, row in enumerate(rows):
+        # "data" is of form:
+        # [['20190214T04Z', -102],
+        # ['20190214T03Z', -107],
+        # ['20190214T02Z', -108],
+        # ['20190214T01Z', -103]]
+        data = row["data"]
+        if year_prefix is not None:
+            data = [x for x in data if x[0].startswith(year_prefix)]
+        row_idx.append(np.full(len(data), i))
+        stamps.extend(x[0] for x in data)
+        values.extend(x[1] for x in data)
+    if row_idx:
+        row_idx = np.concatenate(row_idx)
+    else:
+        row_idx = np.array([], dtype=int)
+    datetime = pd.to_datetime(
+        pd.Series(stamps, dtype=object),
+        utc=True,
+        format="%Y%m%dT%HZ",
+        errors="coerce",
+    )
+    values = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+    valid = datetime.notna().values
+    return row_idx[valid], datetime[valid].values, values[valid].values
+
+
+def row_to_df(rows, data_type, year=None):
     """
     Turn rows of a single type from the bulk data text file into a dataframe
     with the region, datetime, and data as columns
@@ -80,48 +268,28 @@ def row_to_df(rows, data_type):
         rows from the EBA.txt file
     data_type : str
         name to use for the data column (e.g. demand or total_interchange)
+    year : int, optional
+        Only keep data for this (UTC) year
     Returns
     -------
     dataframe
         Data for all regions in a single df with datatimes converted and UTC
     """
-    tuple_list = []
-    for row in rows:
-
-        # "data" is of form:
-        # [['20190214T04Z', -102],
-        # ['20190214T03Z', -107],
-        # ['20190214T02Z', -108],
-        # ['20190214T01Z', -103]]
-        try:
-            datetime = pd.to_datetime([x[0] for x in row['data']],
-                                      utc=True, format='%Y%m%dT%HZ')
-        except ValueError:
-            try:
-                datetime = pd.to_datetime([x[0]+":00" for x in row['data']],
-                                          format='%Y%m%dT%H%z')
-            except ValueError:
-                continue
-        data = [x[1] for x in row['data']]
-        region = row['series_id'].split('-')[0][4:]
-
-#        df_data = {
-#            'region': region,
-#            'datetime': datetime,
-#            data_type: data,
-#        }
-#        region_list=[region for x in datetime]
-#        _df = pd.DataFrame(df_data)
-#        tuple_list.append(_df)
-        tuple_data=[x for x in zip([region]*len(datetime), list(datetime), data)]
-        tuple_list.extend(tuple_data)
-    df=pd.DataFrame(tuple_list, columns=["region", "datetime", data_type])
-#    df = pd.concat(df_list).reset_index(drop=True)
-
+    regions = np.array(
+        [row["series_id"].split("-")[0][4:] for row in rows], dtype=object
+    )
+    row_idx, datetime, data = _series_to_arrays(rows, year)
+    df = pd.DataFrame(
+        {
+            "region": regions[row_idx],
+            "datetime": pd.to_datetime(datetime, utc=True),
+            data_type: data,
+        }
+    )
     return df
 
 
-def ba_exchange_to_df(rows, data_type='ba_to_ba'):
+def ba_exchange_to_df(rows, data_type="ba_to_ba", year=None):
     """
     Turn rows of a single type from the bulk data text file into a dataframe
     with the region, datetime, and data as columns
@@ -131,43 +299,156 @@ def ba_exchange_to_df(rows, data_type='ba_to_ba'):
         rows from the EBA.txt file
     data_type : str
         name to use for the data column (e.g. demand or total_interchange)
+    year : int, optional
+        Only keep data for this (UTC) year
     Returns
     -------
     dataframe
         Data for all regions in a single df with datatimes converted and UTC
     """
-    tuple_list = []
-    for row in rows:
-
-        # "data" is of form:
-        # [['20190214T04Z', -102],
-        # ['20190214T03Z', -107],
-        # ['20190214T02Z', -108],
-        # ['20190214T01Z', -103]]
-        try:
-            datetime = pd.to_datetime([x[0] for x in row['data']],
-                                      utc=True, format='%Y%m%dT%HZ')
-        except ValueError:
-            try:
-                datetime = pd.to_datetime([x[0]+"00" for x in row['data']],
-                                          format='%Y%m%dT%H%z')
-            except ValueError:
-                continue
-        data = [x[1] for x in row['data']]
-        from_region = row['series_id'].split('-')[0][4:]
-        to_region = row['series_id'].split('-')[1][:-5]
-
-#        df_data = {
-#            'from_region': from_region,
-#            'to_region': to_region,
-#            'datetime': datetime,
-#            data_type: data,
-#        }
-        tuple_data = [x for x in zip([from_region]*len(datetime), [to_region]*len(datetime), datetime, data)]
-        tuple_list.extend(tuple_data)
-#        _df = pd.DataFrame(df_data)
-#        df_list.append(_df)
-
-#    df = pd.concat(df_list).reset_index(drop=True)
-    df=pd.DataFrame(tuple_list, columns=["from_region", "to_region", "datetime", data_type])
+    from_regions = np.array(
+        [row["series_id"].split("-")[0][4:] for row in rows], dtype=object
+    )
+    to_regions = np.array(
+        [row["series_id"].split("-")[1][:-5] for row in rows], dtype=object
+    )
+    row_idx, datetime, data = _series_to_arrays(rows, year)
+    df = pd.DataFrame(
+        {
+            "from_region": from_regions[row_idx],
+            "to_region": to_regions[row_idx],
+            "datetime": pd.to_datetime(datetime, utc=True),
+            data_type: data,
+        }
+    )
     return df
+
+
+def eba_vintage():
+    """
+    Identify the download of EBA.zip in use by its size and modification
+    time, downloading it first if it is missing.
+
+    Returns
+    -------
+    str
+        "<zip size>_<zip mtime>"
+    """
+    _open_eba_zip().close()
+    stat = os.stat(path)
+    return f"{stat.st_size}_{int(stat.st_mtime)}"
+
+
+# Version of the saved hourly arrays. Increase it whenever their layout
+# changes so old arrays are not used.
+EBA_CUBE_VERSION = 2
+
+
+def _eba_cube_dir(year):
+    """Name the cube folder after the year and the zip it was built from."""
+    return join(
+        data_dir,
+        "bulk_data",
+        f"eba_cube_{year}_v{EBA_CUBE_VERSION}_{eba_vintage()}",
+    )
+
+
+def _build_eba_cube(year, cube_dir):
+    """Parse one year of hourly series from the bulk file into arrays."""
+    start = pd.Timestamp(year, 1, 1, tz="UTC")
+    n_hours = int(
+        (pd.Timestamp(year + 1, 1, 1, tz="UTC") - start)
+        / pd.Timedelta(hours=1)
+    )
+    rows = read_eba_rows(["net_gen", "demand", "ba_to_ba"])
+    net_gen_df = row_to_df(rows.pop("net_gen"), "net_gen", year=year)
+    demand_df = row_to_df(rows.pop("demand"), "demand", year=year)
+    trade_df = ba_exchange_to_df(rows.pop("ba_to_ba"), year=year)
+    trade_df = trade_df.loc[
+        ~trade_df["from_region"].isin(REGION_ACRONYMS), :
+    ]
+    bas = sorted(
+        set(net_gen_df["region"])
+        | set(demand_df["region"])
+        | set(trade_df["from_region"])
+        | set(trade_df["to_region"])
+    )
+    ba_idx = pd.Series(range(len(bas)), index=bas)
+
+    def _hour_idx(df):
+        return ((df["datetime"] - start) // pd.Timedelta(hours=1)).values
+
+    net_gen = np.full((len(bas), n_hours), np.nan, dtype=np.float32)
+    net_gen[
+        net_gen_df["region"].map(ba_idx).values, _hour_idx(net_gen_df)
+    ] = pd.to_numeric(net_gen_df["net_gen"], errors="coerce").values
+    demand = np.full((len(bas), n_hours), np.nan, dtype=np.float32)
+    demand[
+        demand_df["region"].map(ba_idx).values, _hour_idx(demand_df)
+    ] = pd.to_numeric(demand_df["demand"], errors="coerce").values
+    # Only the reported (from, to) pairs are stored
+    from_idx = trade_df["from_region"].map(ba_idx).values
+    to_idx = trade_df["to_region"].map(ba_idx).values
+    pair_codes, pair_idx = np.unique(
+        from_idx * len(bas) + to_idx, return_inverse=True
+    )
+    pairs = np.column_stack(np.divmod(pair_codes, len(bas)))
+    interchange = np.full((len(pairs), n_hours), np.nan, dtype=np.float32)
+    interchange[pair_idx, _hour_idx(trade_df)] = pd.to_numeric(
+        trade_df["ba_to_ba"], errors="coerce"
+    ).values
+
+    os.makedirs(cube_dir, exist_ok=True)
+    np.save(join(cube_dir, "bas.npy"), np.array(bas, dtype=str))
+    np.save(join(cube_dir, "net_gen.npy"), net_gen)
+    np.save(join(cube_dir, "demand.npy"), demand)
+    np.save(join(cube_dir, "pairs.npy"), pairs)
+    np.save(join(cube_dir, "interchange.npy"), interchange)
+
+
+def load_eba_cube(year):
+    """
+    Return one year of hourly net generation, demand and BA-to-BA
+    interchange from the bulk data as arrays.
+
+    The arrays are built from the bulk file the first time a year is
+    requested and saved as uncompressed float32 .npy files in
+    bulk_data/eba_cube_<year>_v<EBA_CUBE_VERSION>_<zip size>_<zip mtime>,
+    one folder per year and download of EBA.zip. Later calls memory-map the
+    saved arrays, so only the slices that are used are read from disk.
+    Interchange is kept only for the pairs of BAs that reported it, and
+    interchange reported by the aggregate regions in REGION_ACRONYMS is left
+    out.
+
+    Parameters
+    ----------
+    year : int
+        Year of data (UTC)
+
+    Returns
+    -------
+    dict
+        "bas": list of the BA codes that index the arrays,
+        "datetime": DatetimeIndex (UTC) of the hours of the year,
+        "net_gen" and "demand": BA x hour arrays (MWh),
+        "pairs": pair x 2 array of the indices in "bas" of the reporting BA
+        and the BA it traded with,
+        "interchange": pair x hour array of the interchange reported by the
+        first BA of each pair with the second (MWh, positive for exports).
+        Hours without data are NaN.
+    """
+    cube_dir = _eba_cube_dir(year)
+    if not os.path.exists(join(cube_dir, "interchange.npy")):
+        logging.info(f"Building {year} hourly bulk data arrays")
+        _build_eba_cube(year, cube_dir)
+    cube = {"bas": [str(ba) for ba in np.load(join(cube_dir, "bas.npy"))]}
+    cube["pairs"] = np.load(join(cube_dir, "pairs.npy"))
+    for name in ["net_gen", "demand", "interchange"]:
+        cube[name] = np.load(join(cube_dir, f"{name}.npy"), mmap_mode="r")
+    cube["datetime"] = pd.date_range(
+        start=f"{year}-01-01",
+        periods=cube["net_gen"].shape[1],
+        freq="60min",
+        tz="UTC",
+    )
+    return cube
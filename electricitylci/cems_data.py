@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 
 """
-Retrieve data from EPA CEMS daily zipped CSVs.
+Retrieve data from EPA CEMS daily and hourly zipped CSVs.
 
-This modules pulls data from EPA's published CSV files.
+This modules pulls data from EPA's published CSV files. The 'epacems' source
+is the daily data in quarterly files; 'epacems_hourly' is the hourly data in
+monthly files.
 
 Copyright 2017 Catalyst Cooperative and the Climate Policy Initiative
 
@@ -18,13 +20,28 @@ copies or substantial portions of the Software.
 """
 import os
 import pandas as pd
+import electricitylci.dataset_cache as dataset_cache
 # from pudl.settings import SETTINGS
 # import pudl.constants as pc
 from electricitylci.globals import data_dir, output_dir
+from electricitylci.data_bundle import require_network
 import logging
 
 data_years = {
     'epacems': tuple(range(1995, 2019)),
+    'epacems_hourly': tuple(range(1995, 2019)),
+}
+
+base_urls = {
+    'epacems': 'ftp://newftp.epa.gov/dmdnload/emissions/daily/quarterly/',
+    'epacems_hourly': 'ftp://newftp.epa.gov/dmdnload/emissions/hourly/monthly/',
+}
+
+# Each year of a source is published as one file per state and period:
+# quarters for the daily data and months for the hourly data.
+source_periods = {
+    'epacems': range(1, 5),
+    'epacems_hourly': range(1, 13),
 }
 
 epacems_columns_to_ignore = {
@@ -196,57 +213,74 @@ cems_col_names = {
         'COUNT_OP_TIME': 'count_op_time'
 }
 
+cems_cols_to_sum = [
+        'gross_load_mwh',
+        'steam_load_1000_lbs',
+        'so2_mass_tons',
+        'nox_mass_tons',
+        'co2_mass_tons',
+        'heat_content_mmbtu'
+]
+
 
-def get_epacems_dir(year):
+def get_epacems_dir(year, source='epacems'):
     """
     Data directory search for EPA CEMS hourly.
 
     Args:
         year (int): The year that we're trying to read data for.
+        source (str): 'epacems' (daily) or 'epacems_hourly'.
     Returns:
         path to appropriate EPA CEMS data directory.
     """
     # These are the only years we've got...
-    assert year in range(min(data_years['epacems']),
-                         max(data_years['epacems']) + 1)
+    assert year in range(min(data_years[source]),
+                         max(data_years[source]) + 1)
 
-    return os.path.join(data_dir, 'epacems{}'.format(year))
+    return os.path.join(data_dir, '{}{}'.format(source, year))
 
 
-def get_epacems_file(year, qtr, state):
+def get_epacems_file(year, qtr, state, source='epacems'):
     """
     Given a year, month, and state, return the appropriate EPA CEMS zipfile.
 
     Args:
         year (int): The year that we're trying to read data for.
-        month (int): The month we're trying to read data for.
+        qtr (int): The quarter (daily data) or month (hourly data) we're
+            trying to read data for.
         state (str): The state we're trying to read data for.
+        source (str): 'epacems' (daily) or 'epacems_hourly'.
     Returns:
         path to EPA CEMS zipfiles for that year, month, and state.
     """
     state = state.lower()
     month = str(qtr)
-    filename = f'epacems{year}{state}{qtr}.zip'
-    full_path = os.path.join(get_epacems_dir(year), filename)
+    filename = f'{source}{year}{state}{qtr}.zip'
+    full_path = os.path.join(get_epacems_dir(year, source), filename)
     assert os.path.isfile(full_path), (
         f"ERROR: Failed to find EPA CEMS file for {state}, {year}-{month}.\n" +
         f"Expected it here: {full_path}")
     return full_path
 
 
-def read_cems_csv(filename):
+def read_cems_csv(filename, chunksize=None):
     """
     Read one CEMS CSV file.
 
     Note that some columns are not read. See epacems_columns_to_ignores.
+    If chunksize is given, a generator of renamed dataframes with at most
+    chunksize rows each is returned instead of a single dataframe.
     """
-    df = pd.read_csv(
+    reader = pd.read_csv(
         filename,
         index_col=False,
         usecols=lambda col: col not in epacems_columns_to_ignore,
         dtype=epacems_csv_dtypes,
-    ).rename(columns=epacems_rename_dict)
-    return df
+        chunksize=chunksize,
+    )
+    if chunksize is None:
+        return reader.rename(columns=epacems_rename_dict)
+    return (chunk.rename(columns=epacems_rename_dict) for chunk in reader)
 
 
 def extract(epacems_years, states, verbose=True):
@@ -289,27 +323,26 @@ import warnings
 
 def assert_valid_param(source, year, qtr=None, state=None, check_month=None):
     """Add docstring."""
-    assert source in ('epacems'), \
+    assert source in ('epacems', 'epacems_hourly'), \
         f"Source '{source}' not found in valid data sources."
     assert source in data_years, \
         f"Source '{source}' not found in valid data years."
-    assert source in {
-            'epacems': 'ftp://newftp.epa.gov/dmdnload/emissions/daily/quarterly/'
-            }, \
+    assert source in base_urls, \
         f"Source '{source}' not found in valid base download URLs."
     assert year in data_years[source], \
         f"Year {year} is not valid for source {source}."
     if check_month is None:
-        check_month = source == 'epacems'
+        check_month = source in source_periods
 
-    if source == 'epacems':
+    if source in source_periods:
         valid_states = cems_states.keys()
     else:
         valid_states = us_states.keys()
 
     if check_month:
-        assert qtr in range(1, 5), \
-            f"Qtr {qtr} is not valid (must be 1-4)"
+        assert qtr in source_periods[source], \
+            (f"Period {qtr} is not valid (must be "
+             f"{min(source_periods[source])}-{max(source_periods[source])})")
         assert state.upper() in valid_states, \
             f"State '{state}' is not valid. It must be a US state abbreviation."
 
@@ -329,11 +362,12 @@ def source_url(source, year, qtr=None, state=None):
             - 'mshaops'
             - 'mshaprod'
             - 'epacems'
+            - 'epacems_hourly'
         year (int): the year for which data should be downloaded. Must be
             within the range of valid data years, which is specified for
             each data source in the pudl.constants module.
-        month (int): the month for which data should be downloaded.
-            Only used for EPA CEMS.
+        qtr (int): the quarter (daily data) or month (hourly data) for which
+            data should be downloaded. Only used for EPA CEMS.
         state (str): the state for which data should be downloaded.
             Only used for EPA CEMS.
     Returns:
@@ -342,12 +376,18 @@ def source_url(source, year, qtr=None, state=None):
     """
     assert_valid_param(source=source, year=year, qtr=qtr, state=state)
 
-    base_url = 'ftp://newftp.epa.gov/dmdnload/emissions/daily/quarterly/'
+    base_url = base_urls[source]
 
-    download_url = '{base_url}/{year}/DLY_{year}{state}Q{qtr}.zip'.format(
-            base_url=base_url, year=year,
-            state=state.lower(), qtr=str(qtr)
-    )
+    if source == 'epacems_hourly':
+        download_url = '{base_url}/{year}/{year}{state}{month:02d}.zip'.format(
+                base_url=base_url, year=year,
+                state=state.lower(), month=qtr
+        )
+    else:
+        download_url = '{base_url}/{year}/DLY_{year}{state}Q{qtr}.zip'.format(
+                base_url=base_url, year=year,
+                state=state.lower(), qtr=str(qtr)
+        )
     return download_url
 
 
@@ -371,6 +411,7 @@ def path(source, year=0, qtr=None, state=None, file=True, datadir=data_dir):
             - 'eia923'
             - 'eia860'
             - 'epacems'
+            - 'epacems_hourly'
         year (int): the year of data that the returned path should pertain to.
             Must be within the range of valid data years, which is specified
             for each data source in pudl.constants.data_years, unless year is
@@ -428,10 +469,10 @@ def path(source, year=0, qtr=None, state=None, file=True, datadir=data_dir):
         dstore_path = os.path.join(datadir, 'msha')
         if year != 0:
             dstore_path = os.path.join(dstore_path, 'MinesProdQuarterly.zip')
-    elif (source == 'epacems'):
+    elif source in source_periods:
         dstore_path = data_dir
         if(year != 0):
-            dstore_path = os.path.join(dstore_path, 'epacems{}'.format(year))
+            dstore_path = os.path.join(dstore_path, f'{source}{year}')
     else:
         # we should never ever get here because of the assert statement.
         assert False, \
@@ -464,13 +505,13 @@ def paths_for_year(source, year=0, states=cems_states.keys(),
     """Get all the paths for a given source and year. See path() for details."""
     # TODO: I'm not sure this is the best construction, since it relies on
     # the order being the same here as in the url list comprehension
-    if source == 'epacems':
+    if source in source_periods:
         paths = [path(source=source, year=year, qtr=qtr, state=state,
                       file=file, datadir=datadir)
                  # For consistency, it's important that this is state, then
                  # month
                  for state in states
-                 for qtr in range(1, 5)]
+                 for qtr in source_periods[source]]
     else:
         paths = [path(source=source, year=year, file=file, datadir=datadir)]
     return paths
@@ -501,6 +542,7 @@ def download(source, year, states, datadir=data_dir, verbose=True):
         outfile (str): path to the local downloaded file.
     """
     assert_valid_param(source=source, year=year, check_month=False)
+    require_network(f"{source} data for {year}")
 
     tmp_dir = os.path.join(datadir, 'tmp')
 
@@ -508,12 +550,12 @@ def download(source, year, states, datadir=data_dir, verbose=True):
     if not os.path.exists(tmp_dir):
         os.makedirs(tmp_dir)
 
-    if source == 'epacems':
+    if source in source_periods:
         src_urls = [source_url(source, year, qtr=qtr, state=state)
                     # For consistency, it's important that this is state, then
                     # month
                     for state in states
-                    for qtr in range(1, 5)]
+                    for qtr in source_periods[source]]
         tmp_files = [os.path.join(tmp_dir, os.path.basename(f))
                      for f in paths_for_year(source, year, states=states)]
     else:
@@ -521,7 +563,7 @@ def download(source, year, states, datadir=data_dir, verbose=True):
         tmp_files = [os.path.join(
             tmp_dir, os.path.basename(path(source, year)))]
     if(verbose):
-        if source != 'epacems':
+        if source not in source_periods:
             print(
                 f"Downloading {source} data for {year}...\n    {src_urls[0]}")
         else:
@@ -662,13 +704,11 @@ def organize(source, year, states, unzip=True,
 
     Returns: nothing
     """
-    assert source in ('epacems'), \
+    assert source in ('epacems', 'epacems_hourly'), \
         "Source '{}' not found in valid data sources.".format(source)
     assert source in data_years, \
         "Source '{}' not found in valid data years.".format(source)
-    assert source in {
-            'epacems': 'ftp://newftp.epa.gov/dmdnload/emissions/daily/quarterly/'
-            }, \
+    assert source in base_urls, \
         "Source '{}' not found in valid base download URLs.".format(source)
     assert year in data_years[source], \
         "Year {} is not valid for source {}.".format(year, source)
@@ -700,7 +740,7 @@ def organize(source, year, states, unzip=True,
     # If we're unzipping the downloaded file, then we may have some
     # reorganization to do. Currently all data sources will get unzipped,
     # except the CEMS, because they're really big and take up 92% less space.
-    if(unzip and source != 'epacems'):
+    if(unzip and source not in source_periods):
         # Unzip the downloaded file in its new home:
         zip_ref = zipfile.ZipFile(destfile, 'r')
         print(f"unzipping {destfile}")
@@ -793,8 +833,24 @@ def update(source, year, states, clobber=False, unzip=True, verbose=True,
                  verbose=verbose, no_download=no_download)
 
 
-def build_cems_df(year):
-    """Add docstring."""
+# The monthly plant totals feed both the annual summary and the monthly
+# emission profiles, so the daily files are only read once per year.
+@dataset_cache.cached_dataset("cems")
+def build_cems_monthly_df(year):
+    """
+    Sum the daily EPA CEMS data in the quarterly files to plant-level totals
+    for each month of the year.
+
+    Parameters
+    ----------
+    year : int
+        Year of CEMS data to use
+
+    Returns
+    -------
+    dataframe
+        One row per state, plant, facility and month ('month' is 1-12).
+    """
     states = cems_states.keys()
     update('epacems', year, states)
     raw_dfs = extract(
@@ -804,19 +860,23 @@ def build_cems_df(year):
         )
     df = pd.concat(raw_dfs)
     df.rename(columns=cems_col_names, inplace=True)
-    cols_to_sum = [
-            'gross_load_mwh',
-            'steam_load_1000_lbs',
-            'so2_mass_tons',
-            'nox_mass_tons',
-            'co2_mass_tons',
-            'heat_content_mmbtu'
-    ]
+    df["month"] = pd.to_datetime(df["op_date"], format="%m-%d-%Y").dt.month
     summary_df = df.groupby(
+            by=['state', 'plant_id_eia', 'facility_id', 'month'],
+            group_keys=False,
+            as_index=False
+            )[cems_cols_to_sum].sum()
+    return summary_df
+
+
+def build_cems_df(year):
+    """Sum the EPA CEMS data to annual plant-level totals."""
+    monthly_df = build_cems_monthly_df(year)
+    summary_df = monthly_df.groupby(
             by=['state', 'plant_id_eia', 'facility_id'],
             group_keys=False,
             as_index=False
-            )[cols_to_sum].sum()
+            )[cems_cols_to_sum].sum()
     return summary_df
 
 
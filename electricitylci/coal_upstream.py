@@ -4,12 +4,15 @@ if __name__=='__main__':
     import electricitylci.model_config as config
     config.model_specs = config.build_model_class()
 
+import hashlib
+import logging
 import pandas as pd
 from electricitylci.globals import data_dir, output_dir
-from electricitylci.eia923_generation import eia923_download
+from electricitylci.eia923_generation import eia923_page
 import os
 from os.path import join
 from electricitylci.utils import find_file_in_folder
+from electricitylci.data_bundle import require_network
 import requests
 import electricitylci.PhysicalQuantities as pq
 import numpy as np
@@ -35,6 +38,9 @@ basin_codes={'Central Appalachia': 'CA',
              'West/Northwest': 'WNW',
              'Import': 'IMP'}
 
+# Increase when generate_upstream_coal_map changes so saved maps are rebuilt.
+COAL_MAP_VERSION = 1
+
 transport_dict={'Avg Barge Ton*Miles': 'Barge',
                 'Avg Lake Vessel Ton*Miles': 'Lake Vessel',
                 'Avg Ocean Vessel Ton*Miles': 'Ocean Vessel',
@@ -46,6 +52,7 @@ def eia_7a_download(year, save_path):
     eia7a_base_url = 'http://www.eia.gov/coal/data/public/xls/'
     name = 'coalpublic{}.xls'.format(year)
     url = eia7a_base_url + name
+    require_network(url)
     try:
         os.makedirs(save_path)
         print('Downloading EIA 7-A data...')
@@ -68,66 +75,78 @@ def _clean_columns(df):
 
 
 def read_eia923_fuel_receipts(year):
-    expected_923_folder = join(data_dir, 'f923_{}'.format(year))
-    if not os.path.exists(expected_923_folder):
-        print('Downloading EIA-923 files')
-        eia923_download(year=year, save_path=expected_923_folder)
-
-        eia923_path, eia923_name = find_file_in_folder(
-            folder_path=expected_923_folder,
-            file_pattern_match=['2_3_4_5'],
-            return_name=True
-        )
-        eia_fuel_receipts_df = pd.read_excel(
-                eia923_path, sheet_name='Page 5 Fuel Receipts and Costs',
-                skiprows=4, usecols="A:E,H:M,P:Q")
-        csv_fn = eia923_name.split('.')[0] + '_page_5_reduced.csv'
-        csv_path = join(expected_923_folder, csv_fn)
-        eia_fuel_receipts_df.to_csv(csv_path, index=False)
-    else:
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        print('Loading data from previously downloaded excel file')
-        all_files = os.listdir(expected_923_folder)
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [f for f in all_files
-                    if '.csv' in f
-                    and '_page_5_reduced.csv' in f]
-        if csv_file:
-            csv_path = os.path.join(expected_923_folder, csv_file[0])
-            eia_fuel_receipts_df=pd.read_csv(csv_path, low_memory=False)
-        else:
-            eia923_path, eia923_name = find_file_in_folder(
-                    folder_path=expected_923_folder,
-                    file_pattern_match=['2_3_4_5'],
-                    return_name=True)
-            eia_fuel_receipts_df = pd.read_excel(
-                eia923_path, sheet_name='Page 5 Fuel Receipts and Costs',
-                skiprows=4, usecols="A:E,H:M,P:Q")
-            csv_fn = eia923_name.split('.')[0] + '_page_5_reduced.csv'
-            csv_path = join(expected_923_folder, csv_fn)
-            eia_fuel_receipts_df.to_csv(csv_path, index=False)
+    """Return EIA-923 Page 5 (fuel receipts) with snake case columns."""
+    eia_fuel_receipts_df = eia923_page(year, "5")
     _clean_columns(eia_fuel_receipts_df)
     return eia_fuel_receipts_df
 
 
-def _coal_code(row):
-    # _coal_code_str = basin_codes[basin] + '-' + coal_type_codes[coal_type] + '-' + mine_type
-    coal_code_str=(
-            f'{basin_codes[row["netl_basin"]]}-'
-            f'{coal_type_codes[row["energy_source"]]}-'
-            f'{row["coalmine_type"]}'
-    ).upper()
-    return coal_code_str
+def _coal_codes(df):
+    """
+    Build the coal source code (basin-coal type-mine type, e.g. "PRB-S-S")
+    for every row of the fuel receipts at once.
+    """
+    coal_codes = (
+        df["netl_basin"].map(basin_codes)
+        + "-"
+        + df["energy_source"].map(coal_type_codes)
+        + "-"
+        + df["coalmine_type"].astype(str)
+    ).str.upper()
+    unknown = coal_codes.isnull()
+    if unknown.any():
+        logging.warning(
+            f"{unknown.sum()} coal receipts have a basin or coal type "
+            f"without a code and are left out of the coal map"
+        )
+    return coal_codes
 
 
-def _transport_code(row):
-    transport_str=transport_dict[row['coal_source_code']]
-    return transport_str
+def _coal_map_key():
+    """Hash the basin mapping files used by the coal map."""
+    hasher = hashlib.sha1()
+    for fn in ["eia_to_netl_basin.csv", "coal_state_to_basin.csv",
+               "fips_codes.csv"]:
+        hasher.update(fn.encode())
+        with open(join(data_dir, fn), "rb") as f:
+            hasher.update(f.read())
+    return hasher.hexdigest()[:16]
 
 
 def generate_upstream_coal_map(year):
+    """
+    Return the quantity and heat input of each coal source (basin, coal type
+    and mine type) burned at each plant in the given year.
+
+    The table is built from the EIA-923 fuel receipts and EIA-7A once per
+    year and saved in data/coal_upstream, named with the year,
+    COAL_MAP_VERSION and a hash of the basin mapping files.
+
+    Parameters
+    ----------
+    year : int
+        Year of EIA-923 and EIA-7A data to use
+
+    Returns
+    -------
+    dataframe
+        Columns plant_id, coal_source_code, quantity and heat_input
+    """
+    artifact_dir = join(data_dir, "coal_upstream")
+    artifact_path = join(
+        artifact_dir,
+        f"coal_map_{year}_v{COAL_MAP_VERSION}_{_coal_map_key()}.pkl",
+    )
+    if os.path.exists(artifact_path):
+        logging.info(f"Loading {year} coal map from {artifact_path}")
+        return pd.read_pickle(artifact_path)
+    final_df = _build_upstream_coal_map(year)
+    os.makedirs(artifact_dir, exist_ok=True)
+    final_df.to_pickle(artifact_path)
+    return final_df
+
+
+def _build_upstream_coal_map(year):
     from electricitylci.globals import STATE_ABBREV
     from electricitylci.eia923_generation import eia923_generation_and_fuel
     eia_fuel_receipts_df=read_eia923_fuel_receipts(year)
@@ -224,8 +243,8 @@ def generate_upstream_coal_map(year):
 #    eia_fuel_receipts_df[['netl_basin','energy_source','coalmine_type']]
     eia_fuel_receipts_good.dropna(
         subset=['netl_basin', 'energy_source', 'coalmine_type'], inplace=True)
-    eia_fuel_receipts_good['coal_source_code']=eia_fuel_receipts_good.apply(
-            _coal_code, axis=1)
+    eia_fuel_receipts_good['coal_source_code']=_coal_codes(
+            eia_fuel_receipts_good)
     eia_fuel_receipts_good['heat_input']=eia_fuel_receipts_good['quantity']*eia_fuel_receipts_good['average_heat_content']
     eia_fuel_receipts_good.drop_duplicates(inplace=True)
     eia_fuel_receipts_good["coal_type"]=eia_fuel_receipts_good["energy_source"].map(coal_type_codes)
@@ -460,8 +479,8 @@ def generate_upstream_coal(year):
             id_vars = ['plant_id','coal_source_code','quantity'], 
             var_name = 'FlowName', 
             value_name = 'FlowAmount')
-    melted_database_transport['coal_source_code']=melted_database_transport.apply(
-            _transport_code,axis=1)
+    melted_database_transport['coal_source_code']=melted_database_transport[
+            'coal_source_code'].map(transport_dict)
     # Adding to new columns for the compartment (water) and 
     # The source of the emissisons (mining). 
     melted_database_transport['Compartment'] = 'emission/air'
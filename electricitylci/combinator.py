@@ -116,7 +116,10 @@ def fill_nans(df, eia_gen_year, key_column="FacilityID", target_columns=[], drop
 
 
 def concat_map_upstream_databases(eia_gen_year, *arg, **kwargs):
-    import fedelemflowlist as fedefl
+    from electricitylci.elementaryflows import (
+        load_flow_mapping_index,
+        lookup_flow_mapping,
+    )
 
     """
     Concatenates all of the databases given as args. Then all of the
@@ -164,9 +167,8 @@ def concat_map_upstream_databases(eia_gen_year, *arg, **kwargs):
                         )
             upstream_df_list.append(df)
     upstream_df = pd.concat(upstream_df_list, ignore_index=True, sort=False)
-    module_logger.info("Creating flow mapping database")
-    flow_mapping = fedefl.get_flowmapping('eLCI')
-    flow_mapping["SourceFlowName"] = flow_mapping["SourceFlowName"].str.lower()
+    module_logger.info("Loading flow mapping index")
+    flow_mapping_index = load_flow_mapping_index("eLCI", case_sensitive=False)
 
     module_logger.info("Preparing upstream df for merge")
     upstream_df["FlowName_orig"] = upstream_df["FlowName"]
@@ -194,7 +196,7 @@ def concat_map_upstream_databases(eia_gen_year, *arg, **kwargs):
         "Compartment_path_orig",
         "Unit_orig",
     ]
-    upstream_df["Unit"].fillna("<blank>", inplace=True)
+    upstream_df["Unit"] = upstream_df["Unit"].fillna("<blank>")
     module_logger.info("Grouping upstream database")
     if "Electricity" in upstream_df.columns:
         upstream_df_grp = upstream_df.groupby(
@@ -206,12 +208,15 @@ def concat_map_upstream_databases(eia_gen_year, *arg, **kwargs):
         ).agg({"FlowAmount": "sum", "quantity": "mean"})
     upstream_df=upstream_df[["FlowName_orig", "Compartment_path_orig", "stage_code"]]
     module_logger.info("Merging upstream database and flow mapping")
-    upstream_mapped_df = pd.merge(
-        left=upstream_df_grp,
-        right=flow_mapping,
-        left_on=["FlowName", "Compartment_path"],
-        right_on=["SourceFlowName", "SourceFlowContext"],
-        how="left",
+    upstream_mapped_df = upstream_df_grp.reset_index(drop=True)
+    flow_mapping = lookup_flow_mapping(
+        flow_mapping_index,
+        upstream_mapped_df["FlowName"],
+        upstream_mapped_df["Compartment_path"],
+        upstream_mapped_df["Unit_orig"],
+    )
+    upstream_mapped_df = pd.concat(
+        [upstream_mapped_df, flow_mapping], axis=1, sort=False
     )
     del(upstream_df_grp, flow_mapping)
     upstream_mapped_df.drop(
@@ -0,0 +1,344 @@
+"""
+Offline data bundle.
+
+prepare_bundle downloads every external input a model configuration needs
+(EIA-923, EIA-860, EPA CEMS daily data and, for hourly emission intensities,
+hourly data, the EIA bulk hourly data, the state T&D loss workbooks, EIA-7A,
+the stewi/stewicombo inventories and the Federal LCA Commons elementary flow
+list) in parallel, using the download functions of the modules that read
+them. It then writes a manifest with the size and sha256
+checksum of every downloaded file in the data directory, and of the data
+files that stewi, stewicombo, facilitymatcher and fedelemflowlist keep in
+their own package folders (see DATA_PACKAGES).
+
+When the offline_bundle model setting is True, verify_bundle checks the data
+directory against the manifest before the model runs. After that, any
+attempt to download data raises an error instead of going to the network.
+
+From the command line:
+
+    python -m electricitylci.data_bundle -c ELCI_1
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+
+from electricitylci.globals import data_dir
+import electricitylci.model_config as config
+from electricitylci.model_config import ConfigurationError
+
+module_logger = logging.getLogger("data_bundle.py")
+
+MANIFEST_PATH = join(data_dir, "bundle_manifest.json")
+
+# Packages that keep their downloads in their own folders. Their data files
+# are listed in the manifest as "<package>:<path in the package folder>".
+DATA_PACKAGES = ["stewi", "stewicombo", "facilitymatcher", "fedelemflowlist"]
+
+# Set by verify_bundle. While True, require_network raises instead of
+# letting a download start.
+OFFLINE = False
+
+
+def require_network(description):
+    """
+    Raise an error if the model is running from an offline bundle.
+
+    Called by the download functions before they make a network request.
+
+    Parameters
+    ----------
+    description : str
+        What was about to be downloaded, used in the error message
+    """
+    if OFFLINE:
+        raise ConfigurationError(
+            f"offline_bundle is set but {description} is not in the data "
+            f"bundle. Run 'python -m electricitylci.data_bundle' with this "
+            f"model configuration to add it."
+        )
+
+
+def _file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 ** 2), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _package_dir(package):
+    return os.path.dirname(importlib.import_module(package).__file__)
+
+
+def _manifest_name(path):
+    """
+    Name a file in the manifest: its path relative to the data directory,
+    or "<package>:<path>" for the data of DATA_PACKAGES.
+    """
+    path = os.path.abspath(path)
+    for package in DATA_PACKAGES:
+        root = os.path.abspath(_package_dir(package))
+        if os.path.commonpath([root, path]) == root:
+            return f"{package}:{os.path.relpath(path, root)}"
+    return os.path.relpath(path, data_dir)
+
+
+def _manifest_path(name):
+    """Return the full path of a file named as in _manifest_name."""
+    package, sep, path = name.partition(":")
+    if sep and package in DATA_PACKAGES:
+        return join(_package_dir(package), path)
+    return join(data_dir, name)
+
+
+def _files_under(path):
+    """
+    Return the manifest name of every file at or below path. Python source
+    files are skipped, so a package folder gives only its data files.
+    """
+    if os.path.isfile(path):
+        return [_manifest_name(path)]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if d != "__pycache__"]
+        files.extend(
+            _manifest_name(join(root, name))
+            for name in names
+            if not name.endswith((".py", ".pyc"))
+        )
+    return sorted(files)
+
+
+def _fetch_eia923(year):
+    from electricitylci.eia923_generation import eia923_download
+
+    folder = join(data_dir, f"f923_{year}")
+    if not os.path.exists(folder):
+        eia923_download(year=year, save_path=folder)
+    return [folder]
+
+
+def _fetch_eia860(year):
+    from electricitylci.eia860_facilities import eia860_download
+
+    folder = join(data_dir, f"eia860_{year}")
+    if not os.path.exists(folder):
+        eia860_download(year=year, save_path=folder)
+    return [folder]
+
+
+def _fetch_cems(year):
+    import electricitylci.cems_data as cems
+
+    states = cems.cems_states.keys()
+    cems.update("epacems", year, states)
+    return cems.paths_for_year("epacems", year, states=states)
+
+
+def _fetch_cems_hourly(year):
+    import electricitylci.cems_data as cems
+    from electricitylci.hourly_emissions import CEMS_STATE_UTC_OFFSET
+
+    states = [s for s in cems.cems_states.keys() if s in CEMS_STATE_UTC_OFFSET]
+    cems.update("epacems_hourly", year, states)
+    return cems.paths_for_year("epacems_hourly", year, states=states)
+
+
+def _fetch_eba(year):
+    import electricitylci.bulk_eia_data as bulk
+
+    if not os.path.exists(bulk.path):
+        bulk.download_EBA()
+    return [bulk.path]
+
+
+def _fetch_trans_dist(year):
+    from electricitylci.eia_trans_dist_grid_loss import (
+        eia_trans_dist_download_extract,
+    )
+
+    eia_trans_dist_download_extract(f"{year}")
+    return [join(data_dir, f"t_and_d_{year}")]
+
+
+def _fetch_eia7a(year):
+    from electricitylci.coal_upstream import eia_7a_download
+
+    folder = join(data_dir, f"f7a_{year}")
+    if not os.path.exists(folder):
+        eia_7a_download(year, folder)
+    return [folder]
+
+
+def _fetch_stewi(year):
+    # stewi, stewicombo, facilitymatcher and fedelemflowlist keep their
+    # downloads in their own package folders. Loading them here fills those
+    # folders, which are listed in the manifest with the combined inventory
+    # saved in the data directory.
+    import stewi
+    import fedelemflowlist
+    import electricitylci.egrid_emissions_and_waste_by_facility as egrid_ew
+
+    stewi.getInventoryFacilities("eGRID", config.model_specs.egrid_year)
+    stewi.getInventory("eGRID", config.model_specs.egrid_year)
+    fedelemflowlist.get_flows()
+    fedelemflowlist.get_flowmapping()
+    egrid_ew.get_emissions_and_wastes_by_facility()
+    return [join(data_dir, egrid_ew.stewicombo_cache_file())] + [
+        _package_dir(package) for package in DATA_PACKAGES
+    ]
+
+
+def bundle_inputs(model_specs):
+    """
+    List the inputs a model configuration needs.
+
+    Parameters
+    ----------
+    model_specs : ModelSpecs
+        The model configuration
+
+    Returns
+    -------
+    dict
+        Input name: (fetch function, year)
+    """
+    year = model_specs.eia_gen_year
+    inputs = {
+        "eia923": (_fetch_eia923, year),
+        "eia860": (_fetch_eia860, year),
+        "epacems": (_fetch_cems, year),
+        "eba": (_fetch_eba, year),
+        "trans_dist": (_fetch_trans_dist, year),
+        "stewi": (_fetch_stewi, model_specs.egrid_year),
+    }
+    if model_specs.include_upstream_processes:
+        inputs["eia7a"] = (_fetch_eia7a, year)
+    if model_specs.hourly_emission_intensity:
+        inputs["epacems_hourly"] = (_fetch_cems_hourly, year)
+    return inputs
+
+
+def prepare_bundle(max_workers=4):
+    """
+    Download every input of the current model configuration and write the
+    bundle manifest.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Number of inputs to download at once, by default 4
+
+    Returns
+    -------
+    dict
+        The manifest that was written to MANIFEST_PATH
+    """
+    if config.model_specs is None:
+        config.model_specs = config.build_model_class()
+    inputs = bundle_inputs(config.model_specs)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(fetch, year)
+            for name, (fetch, year) in inputs.items()
+        }
+        paths = {name: future.result() for name, future in futures.items()}
+
+    manifest = {
+        "model_name": config.model_specs.model_name,
+        "packages": DATA_PACKAGES,
+        "inputs": {},
+        "files": {},
+    }
+    for name, input_paths in paths.items():
+        files = []
+        for path in input_paths:
+            if os.path.exists(path):
+                files.extend(_files_under(path))
+            else:
+                module_logger.warning(f"{name}: {path} was not downloaded")
+        manifest["inputs"][name] = files
+        for file in files:
+            full_path = _manifest_path(file)
+            manifest["files"][file] = {
+                "size": os.path.getsize(full_path),
+                "sha256": _file_sha256(full_path),
+            }
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(
+        f"Data bundle for {manifest['model_name']}: "
+        f"{len(manifest['files'])} files, manifest saved to {MANIFEST_PATH}"
+    )
+    return manifest
+
+
+def verify_bundle(check_checksums=True):
+    """
+    Check the data directory against the bundle manifest and switch off
+    downloads for the rest of the run.
+
+    Parameters
+    ----------
+    check_checksums : bool, optional
+        Also compare sha256 checksums, not only file sizes, by default True
+
+    Raises
+    ------
+    ConfigurationError
+        If there is no manifest, or files are missing or changed, or the
+        manifest does not cover the data folders of DATA_PACKAGES
+    """
+    global OFFLINE
+    if not os.path.exists(MANIFEST_PATH):
+        raise ConfigurationError(
+            f"offline_bundle is set but there is no bundle manifest at "
+            f"{MANIFEST_PATH}. Run 'python -m electricitylci.data_bundle' "
+            f"first."
+        )
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+    problems = [
+        f"package data not in bundle: {package}"
+        for package in DATA_PACKAGES
+        if package not in manifest.get("packages", [])
+    ]
+    for file, expected in manifest["files"].items():
+        full_path = _manifest_path(file)
+        if not os.path.exists(full_path):
+            problems.append(f"missing: {file}")
+        elif os.path.getsize(full_path) != expected["size"]:
+            problems.append(f"size changed: {file}")
+        elif check_checksums and _file_sha256(full_path) != expected["sha256"]:
+            problems.append(f"checksum changed: {file}")
+    if problems:
+        raise ConfigurationError(
+            "The data bundle does not match its manifest:\n"
+            + "\n".join(problems)
+        )
+    module_logger.info(
+        f"Verified data bundle of {len(manifest['files'])} files"
+    )
+    OFFLINE = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c", "--model_config", help="specify model configuration", default=""
+    )
+    parser.add_argument(
+        "-w", "--workers", help="inputs to download at once", type=int,
+        default=4,
+    )
+    args = parser.parse_args()
+    if args.model_config != "":
+        config.model_specs = config.build_model_class(args.model_config)
+    prepare_bundle(max_workers=args.workers)
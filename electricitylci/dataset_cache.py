@@ -0,0 +1,219 @@
+"""
+In-memory cache for the large input datasets (EIA-923, EIA-860, CEMS and
+stewicombo inventories).
+
+Cached dataframes are never handed out directly. Every caller gets its own
+shallow copy that shares the cached data under pandas copy-on-write, so no
+data is copied on a hit, and renaming, casting or filtering in place cannot
+change what the next caller sees. Copy-on-write is always on from pandas
+3.0; with pandas 1.5 to 2.x this module switches it on
+(pd.options.mode.copy_on_write) when it is imported.
+
+The memory held by the cache is limited by the dataset_cache_memory_mb model
+setting. When the limit is exceeded, the least recently used dataframes are
+pickled to data/dataset_cache and read back the next time they are
+requested. Spilled files are removed when the process exits.
+
+The cache may be used from several threads at once.
+"""
+
+import atexit
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import threading
+from collections import OrderedDict
+from os.path import join
+
+import pandas as pd
+
+from electricitylci.globals import data_dir
+
+module_logger = logging.getLogger("dataset_cache.py")
+
+DEFAULT_MEMORY_MB = 2048
+SPILL_DIR = join(data_dir, "dataset_cache")
+
+# Dataframes held in memory, least recently used first, with their sizes in
+# bytes, and the spill files of dataframes that have been moved to disk.
+_frames = OrderedDict()
+_frame_bytes = {}
+_spilled = {}
+_lock = threading.RLock()
+
+
+def _copy_on_write():
+    """Return True if pandas copy-on-write is in effect."""
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    try:
+        return bool(pd.get_option("mode.copy_on_write"))
+    except KeyError:
+        return False
+
+
+# Cache hits only share data safely with copy-on-write.
+if not _copy_on_write():
+    pd.set_option("mode.copy_on_write", True)
+
+
+def _memory_budget():
+    """Return the memory budget in bytes from the model configuration."""
+    import electricitylci.model_config as config
+
+    memory_mb = getattr(
+        getattr(config, "model_specs", None), "dataset_cache_memory_mb", None
+    )
+    if memory_mb is None:
+        memory_mb = DEFAULT_MEMORY_MB
+    return memory_mb * 1024 ** 2
+
+
+def _spill_path(key):
+    key_hash = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return join(SPILL_DIR, f"{key[0]}_{key_hash}.pkl")
+
+
+def _enforce_budget():
+    """Spill least recently used dataframes until the budget is met."""
+    budget = _memory_budget()
+    with _lock:
+        # The most recently added dataframe always stays in memory, even if
+        # it is larger than the budget on its own.
+        while sum(_frame_bytes.values()) > budget and len(_frames) > 1:
+            key, df = _frames.popitem(last=False)
+            del _frame_bytes[key]
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            path = _spill_path(key)
+            df.to_pickle(path)
+            _spilled[key] = path
+            module_logger.info(f"Dataset cache over budget, spilled {key}")
+
+
+def put(key, df):
+    """
+    Store a dataframe in the cache.
+
+    Parameters
+    ----------
+    key : tuple
+        Hashable key. The first item names the dataset (e.g. "eia923") and
+        is used in the spill file name.
+    df : dataframe
+        The cache keeps this object, so the caller must not modify it
+        afterwards.
+    """
+    with _lock:
+        if key in _spilled:
+            os.remove(_spilled.pop(key))
+        _frames[key] = df
+        _frames.move_to_end(key)
+        _frame_bytes[key] = int(df.memory_usage(deep=True).sum())
+        _enforce_budget()
+
+
+def get(key):
+    """
+    Return a copy of a cached dataframe, or None if the key is not cached.
+
+    The copy is shallow and shares the cached data until it is modified
+    (see the module docstring).
+
+    Parameters
+    ----------
+    key : tuple
+        Key used with put
+
+    Returns
+    -------
+    dataframe or None
+    """
+    with _lock:
+        if key in _frames:
+            _frames.move_to_end(key)
+            return _frames[key].copy(deep=False)
+        if key in _spilled:
+            path = _spilled.pop(key)
+            df = pd.read_pickle(path)
+            os.remove(path)
+            put(key, df)
+            return df.copy(deep=False)
+        return None
+
+
+def clear():
+    """Remove every dataframe from the cache, including spilled ones."""
+    with _lock:
+        for path in _spilled.values():
+            if os.path.exists(path):
+                os.remove(path)
+        _spilled.clear()
+        _frames.clear()
+        _frame_bytes.clear()
+
+
+atexit.register(clear)
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def _normalized_arguments(signature, args, kwargs):
+    """
+    Bind a call to the loader's signature, with defaults filled in, so that
+    positional and keyword calls give the same key. Arguments named year
+    are compared as integers (2016 and "2016" are the same data).
+    """
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = []
+    for arg_name, value in bound.arguments.items():
+        if arg_name == "year" and isinstance(value, (int, str)):
+            value = int(value)
+        arguments.append((arg_name, _hashable(value)))
+    return tuple(arguments)
+
+
+def cached_dataset(name):
+    """
+    Decorator that caches the dataframe returned by a loader function,
+    keyed by its arguments, and returns a copy on every call.
+
+    It replaces lru_cache for loaders whose results callers modify. Calls
+    are keyed on their bound arguments (see _normalized_arguments).
+
+    Parameters
+    ----------
+    name : str
+        Name of the dataset (e.g. "eia923"), used in the cache key
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (
+                name,
+                func.__name__,
+                _normalized_arguments(signature, args, kwargs),
+            )
+            df = get(key)
+            if df is not None:
+                return df
+            df = func(*args, **kwargs)
+            if isinstance(df, pd.DataFrame):
+                put(key, df)
+                return get(key)
+            return df
+
+        return wrapper
+
+    return decorator
@@ -2,6 +2,7 @@ import pandas as pd
 import stewicombo
 import os
 from electricitylci.globals import data_dir
+import electricitylci.dataset_cache as dataset_cache
 from electricitylci.model_config import model_specs
 
 # Check to see if the stewicombo output of interest is stored as a csv
@@ -10,19 +11,131 @@ for k, v in model_specs.inventories_of_interest.items():
     stewicombooutputfile = stewicombooutputfile+"{}_{}_".format(k, v)
 stewicombooutputfile = stewicombooutputfile + 'fromstewicombo.csv'
 
-if os.path.exists(data_dir+"/"+stewicombooutputfile):
-    emissions_and_wastes_by_facility = pd.read_csv(data_dir+"/"+stewicombooutputfile, header=0, dtype={"FacilityID": "str", "Year": "int", "eGRID_ID": "str"})
-else:
-    emissions_and_wastes_by_facility = stewicombo.combineInventoriesforFacilitiesinOneInventory("eGRID", model_specs.inventories_of_interest, filter_for_LCI=True)
-    # drop SRS fields
-    emissions_and_wastes_by_facility = emissions_and_wastes_by_facility.drop(columns=['SRS_ID', 'SRS_CAS'])
-    # drop 'Electricity' flow
-    emissions_and_wastes_by_facility = emissions_and_wastes_by_facility[emissions_and_wastes_by_facility['FlowName'] != 'Electricity']
-    # Save it to a csv for the next call
-    emissions_and_wastes_by_facility.to_csv(data_dir+"/"+stewicombooutputfile, index=False)
-
-len(emissions_and_wastes_by_facility)
-# with egrid 2016, tri 2016, nei 2016, rcrainfo 2015: 106284
-
-# Get a list of unique years in the emissions data
-years_in_emissions_and_wastes_by_facility = list(pd.unique(emissions_and_wastes_by_facility['Year']))
+# The combined inventory is saved as a pickle of a typed dataframe, next to
+# where earlier versions saved the csv.
+STEWICOMBO_CACHE_VERSION = 1
+STEWICOMBO_CATEGORICAL_COLS = [
+    "FacilityID",
+    "FlowName",
+    "Compartment",
+    "Unit",
+    "Source",
+    "FRS_ID",
+    "eGRID_ID",
+]
+
+
+def stewicombo_cache_file(outputfile=stewicombooutputfile):
+    """Return the name of the typed inventory file for a csv file name."""
+    return outputfile.replace(
+        ".csv", f"_v{STEWICOMBO_CACHE_VERSION}.pkl"
+    )
+
+
+def _typed_inventory(df):
+    """Cast the combined inventory to compact dtypes."""
+    df = df.astype({"FacilityID": "str", "Year": "int", "eGRID_ID": "str"})
+    for col in STEWICOMBO_CATEGORICAL_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _read_typed_inventory(outputfile):
+    """Read the whole typed inventory, creating it on the first run."""
+    cache_path = data_dir + "/" + stewicombo_cache_file(outputfile)
+    if os.path.exists(cache_path):
+        return pd.read_pickle(cache_path)
+    if os.path.exists(data_dir+"/"+outputfile):
+        emissions_and_wastes_by_facility = pd.read_csv(data_dir+"/"+outputfile, header=0, dtype={"FacilityID": "str", "Year": "int", "eGRID_ID": "str"})
+    else:
+        emissions_and_wastes_by_facility = stewicombo.combineInventoriesforFacilitiesinOneInventory("eGRID", model_specs.inventories_of_interest, filter_for_LCI=True)
+        # drop SRS fields
+        emissions_and_wastes_by_facility = emissions_and_wastes_by_facility.drop(columns=['SRS_ID', 'SRS_CAS'])
+        # drop 'Electricity' flow
+        emissions_and_wastes_by_facility = emissions_and_wastes_by_facility[emissions_and_wastes_by_facility['FlowName'] != 'Electricity']
+    emissions_and_wastes_by_facility = _typed_inventory(
+        emissions_and_wastes_by_facility
+    )
+    # Save it for the next call
+    emissions_and_wastes_by_facility.to_pickle(cache_path)
+    return emissions_and_wastes_by_facility
+
+
+@dataset_cache.cached_dataset("stewicombo")
+def _load_typed_inventory(outputfile, columns=None, sources=None):
+    """
+    Return the typed inventory cut down to the given sources and columns.
+    Only the cut-down frame is kept in the dataset cache.
+    """
+    emissions_and_wastes_by_facility = _read_typed_inventory(outputfile)
+    if sources is not None:
+        emissions_and_wastes_by_facility = emissions_and_wastes_by_facility.loc[
+            emissions_and_wastes_by_facility["Source"].isin(sources), :
+        ]
+        emissions_and_wastes_by_facility["Source"] = (
+            emissions_and_wastes_by_facility["Source"]
+            .cat.remove_unused_categories()
+        )
+    if columns is not None:
+        emissions_and_wastes_by_facility = emissions_and_wastes_by_facility[
+            list(columns)
+        ]
+    return emissions_and_wastes_by_facility
+
+
+def get_emissions_and_wastes_by_facility(
+    outputfile=stewicombooutputfile, columns=None, sources=None
+):
+    """
+    Return the stewicombo facility inventories for the inventories of
+    interest, combining them with stewicombo on the first run.
+
+    The combined inventory is saved with categorical facility, flow,
+    compartment, unit and source columns (see STEWICOMBO_CATEGORICAL_COLS).
+    An existing csv from earlier versions is converted instead of calling
+    stewicombo again.
+
+    Parameters
+    ----------
+    outputfile : str, optional
+        Name of the csv file in the data directory that the typed file is
+        named after
+    columns : list, optional
+        Columns to return, by default all
+    sources : list, optional
+        Source inventories to keep (e.g. ["eGRID", "NEI"]), by default all
+
+    Returns
+    -------
+    dataframe
+        Each call returns a new copy from the dataset cache, which holds
+        one frame per combination of columns and sources.
+    """
+    return _load_typed_inventory(outputfile, columns, sources)
+
+
+def restore_object_columns(df, columns):
+    """
+    Convert the given categorical columns of the inventory back to object
+    dtype, so that values outside of their categories can be assigned to
+    them. The other columns stay categorical.
+    """
+    for col in columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    return df
+
+
+def __getattr__(name):
+    # The whole inventory is only loaded when these module attributes are
+    # used, not on import.
+    if name == "emissions_and_wastes_by_facility":
+        # with egrid 2016, tri 2016, nei 2016, rcrainfo 2015: 106284 rows
+        return get_emissions_and_wastes_by_facility()
+    if name == "years_in_emissions_and_wastes_by_facility":
+        # Get a list of unique years in the emissions data
+        return list(pd.unique(
+            get_emissions_and_wastes_by_facility(columns=["Year"])["Year"]
+        ))
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -7,7 +7,10 @@ warnings.filterwarnings("ignore")
 from electricitylci.model_config import model_specs
 from electricitylci.egrid_facilities import egrid_facilities, list_facilities_w_percent_generation_from_primary_fuel_category_greater_than_min
 from electricitylci.egrid_energy import list_egrid_facilities_with_positive_generation, list_egrid_facilities_in_efficiency_range, egrid_net_generation
-from electricitylci.egrid_emissions_and_waste_by_facility import emissions_and_wastes_by_facility
+from electricitylci.egrid_emissions_and_waste_by_facility import (
+    get_emissions_and_wastes_by_facility,
+    restore_object_columns,
+)
 from electricitylci.egrid_FRS_matches import list_FRS_ids_filtered_for_NAICS
 
 # Get lists of egrid facilities
@@ -52,7 +55,13 @@ electricity_for_selected_egrid_facilities = egrid_net_generation[egrid_net_gener
 len(electricity_for_selected_egrid_facilities)
 
 # Emissions and wastes filtering
-# Start with all emissions and wastes; these are in this file
+# Start with all emissions and wastes of the inventories of interest, with the
+# columns used here and in the generation code
+emissions_and_wastes_by_facility = get_emissions_and_wastes_by_facility(
+    columns=["FacilityID", "FlowName", "Compartment", "FlowAmount", "Unit",
+             "ReliabilityScore", "Source", "Year", "FRS_ID", "eGRID_ID"],
+    sources=list(model_specs.inventories_of_interest.keys()),
+)
 emissions_and_waste_for_selected_egrid_facilities = emissions_and_wastes_by_facility[emissions_and_wastes_by_facility['eGRID_ID'].isin(egrid_facilities_to_include)]
 
 len(pd.unique(emissions_and_wastes_by_facility['eGRID_ID']))
@@ -77,5 +86,9 @@ if model_specs.filter_non_egrid_emission_on_NAICS:
 
 # Join the datasets back together
 emissions_and_waste_for_selected_egrid_facilities = pd.concat([egrid_emissions_for_selected_egrid_facilities, nonegrid_emissions_and_waste_by_facility_for_selected_egrid_facilities])
+# The inventory is held with categorical columns. The flow names, compartments
+# and units are replaced with the mapped federal elementary flows in the
+# generation code, so they go back to object columns.
+emissions_and_waste_for_selected_egrid_facilities = restore_object_columns(emissions_and_waste_for_selected_egrid_facilities, ["FlowName", "Compartment", "Unit"])
 len(emissions_and_waste_for_selected_egrid_facilities)
 # for egrid 2016,TRI 2016,NEI 2016,RCRAInfo 2015: 90792
@@ -13,10 +13,12 @@ import os
 from os.path import join
 import requests
 from electricitylci.globals import data_dir, EIA860_BASE_URL
+import electricitylci.dataset_cache as dataset_cache
 from electricitylci.utils import (
     download_unzip,
     find_file_in_folder,
     create_ba_region_map,
+    type_columns,
 )
 
 
@@ -74,73 +76,97 @@ def load_eia860_excel(eia860_path, sheet="Plant", header=1):
     return eia
 
 
-def eia860_balancing_authority(year, regional_aggregation=None):
+# Schedules used by the model: name -> (workbook file match, sheet name).
+# Schedules that share a workbook are parsed together.
+EIA860_SCHEDULES = {
+    "plant": ("2___Plant", "Plant"),
+    "boiler_so2": ("6_1_EnviroAssoc", "Boiler SO2"),
+    "boiler_nox": ("6_1_EnviroAssoc", "Boiler NOx"),
+    "boiler_info": ("6_2_EnviroEquip", "Boiler Info & Design Parameters"),
+    "generator_operable": ("3_1_Generator", "Operable"),
+}
 
-    expected_860_folder = join(data_dir, "eia860_{}".format(year))
+# Version of the saved schedule tables. Increase it whenever the parsing or
+# the column types of the schedules change so old tables are not used.
+EIA860_TABLE_VERSION = 1
+
+
+def _eia860_schedule_path(folder, year, schedule):
+    return join(
+        folder, f"eia860_{year}_{schedule}_v{EIA860_TABLE_VERSION}.pkl"
+    )
+
+
+def eia860_schedule(year, schedule):
+    """
+    Return one EIA-860 schedule for a year, downloading the data if
+    necessary.
+
+    Schedules are kept in the dataset cache so each one is parsed only once.
+    When a schedule has no saved table yet, its workbook is opened once and
+    all of the schedules in EIA860_SCHEDULES that come from that workbook and
+    are not saved yet are parsed, given fixed column types ("Plant Id" is
+    text, see utils.type_columns) and pickled in the eia860_<year> folder.
+    Each call returns a new copy that the caller may modify.
 
+    Parameters
+    ----------
+    year : int or str
+        Year of data
+    schedule : str
+        Key of the schedule in EIA860_SCHEDULES (e.g. "plant", "boiler_so2")
+
+    Returns
+    -------
+    dataframe
+        The schedule with "Plant Code" renamed to "Plant Id"
+    """
+    key = ("eia860", int(year), schedule)
+    eia = dataset_cache.get(key)
+    if eia is not None:
+        return eia
+
+    expected_860_folder = join(data_dir, "eia860_{}".format(year))
     if not os.path.exists(expected_860_folder):
         print("Downloading EIA-860 files")
         eia860_download(year=year, save_path=expected_860_folder)
 
-        eia860_path, eia860_name = find_file_in_folder(
-            folder_path=expected_860_folder,
-            file_pattern_match=["2___Plant"],
-            return_name=True,
-        )
-        # eia860_files = os.listdir(expected_860_folder)
-
-        # # would be more elegent with glob but this works to identify the
-        # # Schedule_2_3_4_5 file
-        # for f in eia860_files:
-        #     if '2___Plant' in f:
-        #         plant_file = f
-
-        # eia860_path = join(expected_860_folder, plant_file)
-
-        # colstokeep = group_cols + sum_cols
-        eia = load_eia860_excel(eia860_path)
-
-        # Save as csv for easier access in future
-        csv_fn = eia860_name.split(".")[0] + ".csv"
-        csv_path = join(expected_860_folder, csv_fn)
-        eia.to_csv(csv_path, index=False)
-
-    else:
-        all_files = os.listdir(expected_860_folder)
-
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [
-            f
-            for f in all_files
-            if ".csv" in f and "Plant_Y{}".format(year) in f
-        ]
-
-        # Read and return the existing csv file if it exists
-        if csv_file:
-            print("Loading {} EIA-860 plant data from csv file".format(year))
-            fn = csv_file[0]
-            csv_path = join(expected_860_folder, fn)
-            eia = pd.read_csv(csv_path, dtype={"Plant Id": str},low_memory=False)
-
-        else:
-            print("Loading data from previously downloaded excel file")
-            eia860_path, eia860_name = find_file_in_folder(
-                folder_path=expected_860_folder,
-                file_pattern_match=["2___Plant"],
-                return_name=True,
+    schedule_path = _eia860_schedule_path(expected_860_folder, year, schedule)
+    if os.path.exists(schedule_path):
+        print(
+            "Loading {} EIA-860 {} data from saved table".format(
+                year, schedule
             )
-            # # would be more elegent with glob but this works to identify the
-            # # Schedule_2_3_4_5 file
-            # for f in all_files:
-            #     if '2___Plant' in f:
-            #         plant_file = f
-            # eia860_path = join(expected_860_folder, plant_file)
-            eia = load_eia860_excel(eia860_path)
-
-            csv_fn = eia860_name.split(".")[0] + ".csv"
-            csv_path = join(expected_860_folder, csv_fn)
-            eia.to_csv(csv_path, index=False)
+        )
+        dataset_cache.put(key, pd.read_pickle(schedule_path))
+        return dataset_cache.get(key)
+
+    file_match = EIA860_SCHEDULES[schedule][0]
+    eia860_path, eia860_name = find_file_in_folder(
+        folder_path=expected_860_folder,
+        file_pattern_match=[file_match, "xlsx"],
+        return_name=True,
+    )
+    print("Loading {} EIA-860 data from {}".format(year, eia860_name))
+    xls = pd.ExcelFile(eia860_path)
+    for workbook_schedule, (match, sheet) in EIA860_SCHEDULES.items():
+        if match != file_match:
+            continue
+        workbook_path = _eia860_schedule_path(
+            expected_860_folder, year, workbook_schedule
+        )
+        if workbook_schedule != schedule and os.path.exists(workbook_path):
+            continue
+        eia = type_columns(load_eia860_excel(xls, sheet, 1), ["Plant Id"])
+        eia.to_pickle(workbook_path)
+        dataset_cache.put(("eia860", int(year), workbook_schedule), eia)
+    xls.close()
+    return dataset_cache.get(key)
+
+
+@dataset_cache.cached_dataset("eia860")
+def eia860_balancing_authority(year, regional_aggregation=None):
+    eia = eia860_schedule(year, "plant")
 
     ba_cols = [
         "Plant Id",
@@ -167,280 +193,28 @@ def eia860_primary_capacity(year):
 
 
 def eia860_EnviroAssoc_so2(year):
-    expected_860_folder = join(data_dir, "eia860_{}".format(year))
-
-    if not os.path.exists(expected_860_folder):
-        print("Downloading EIA-860 files")
-        eia860_download(year=year, save_path=expected_860_folder)
-
-        eia860_path, eia860_name = find_file_in_folder(
-            folder_path=expected_860_folder,
-            file_pattern_match=["6_1_EnviroAssoc", "xlsx"],
-            return_name=True,
-        )
-        # eia860_files = os.listdir(expected_860_folder)
-
-        # # would be more elegent with glob but this works to identify the
-        # # Schedule_2_3_4_5 file
-        # for f in eia860_files:
-        #     if '2___Plant' in f:
-        #         plant_file = f
-
-        # eia860_path = join(expected_860_folder, plant_file)
-
-        # colstokeep = group_cols + sum_cols
-        eia = load_eia860_excel(eia860_path, "Boiler SO2", 1)
-
-        # Save as csv for easier access in future
-        csv_fn = eia860_name.split(".")[0] + "_boiler_so2.csv"
-        csv_path = join(expected_860_folder, csv_fn)
-        eia.to_csv(csv_path, index=False)
-
-    else:
-        all_files = os.listdir(expected_860_folder)
-
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [
-            f
-            for f in all_files
-            if "_boiler_so2.csv" in f
-            and "6_1_EnviroAssoc_Y{}".format(year) in f
-        ]
-
-        # Read and return the existing csv file if it exists
-        if csv_file:
-            print("Loading {} EIA-860 plant data from csv file".format(year))
-            fn = csv_file[0]
-            csv_path = join(expected_860_folder, fn)
-            eia = pd.read_csv(csv_path, dtype={"Plant Id": str},low_memory=False)
-
-        else:
-            print("Loading data from previously downloaded excel file")
-            eia860_path, eia860_name = find_file_in_folder(
-                folder_path=expected_860_folder,
-                file_pattern_match=["6_1_EnviroAssoc", "xlsx"],
-                return_name=True,
-            )
-            # # would be more elegent with glob but this works to identify the
-            # # Schedule_2_3_4_5 file
-            # for f in all_files:
-            #     if '2___Plant' in f:
-            #         plant_file = f
-            # eia860_path = join(expected_860_folder, plant_file)
-            eia = load_eia860_excel(eia860_path, "Boiler SO2", 1)
-
-            csv_fn = eia860_name.split(".")[0] + "_boiler_so2.csv"
-            csv_path = join(expected_860_folder, csv_fn)
-            eia.to_csv(csv_path, index=False)
-    eia = _clean_columns(eia)
-    return eia
+    """Return EIA-860 Schedule 6.1 Boiler SO2 with snake case columns."""
+    return _clean_columns(eia860_schedule(year, "boiler_so2"))
 
 
 def eia860_boiler_info_design(year):
-    expected_860_folder = join(data_dir, "eia860_{}".format(year))
-
-    if not os.path.exists(expected_860_folder):
-        print("Downloading EIA-860 files")
-        eia860_download(year=year, save_path=expected_860_folder)
-
-        eia860_path, eia860_name = find_file_in_folder(
-            folder_path=expected_860_folder,
-            file_pattern_match=["6_2_EnviroEquip", "xlsx"],
-            return_name=True,
-        )
-
-        eia = load_eia860_excel(
-            eia860_path, "Boiler Info & Design Parameters", 1
-        )
-
-        # Save as csv for easier access in future
-        csv_fn = eia860_name.split(".")[0] + "_boiler_info.csv"
-        csv_path = join(expected_860_folder, csv_fn)
-        eia.to_csv(csv_path, index=False)
-
-    else:
-        all_files = os.listdir(expected_860_folder)
-
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [
-            f
-            for f in all_files
-            if "_boiler_info.csv" in f
-            and "6_2_EnviroEquip_Y{}".format(year) in f
-        ]
-
-        # Read and return the existing csv file if it exists
-        if csv_file:
-            print("Loading {} EIA-860 plant data from csv file".format(year))
-            fn = csv_file[0]
-            csv_path = join(expected_860_folder, fn)
-            eia = pd.read_csv(csv_path, dtype={"Plant Id": str},low_memory=False)
-
-        else:
-            print("Loading data from previously downloaded excel file")
-            eia860_path, eia860_name = find_file_in_folder(
-                folder_path=expected_860_folder,
-                file_pattern_match=["6_2_EnviroEquip", "xlsx"],
-                return_name=True,
-            )
-            # # would be more elegent with glob but this works to identify the
-            # # Schedule_2_3_4_5 file
-            # for f in all_files:
-            #     if '2___Plant' in f:
-            #         plant_file = f
-            # eia860_path = join(expected_860_folder, plant_file)
-            eia = load_eia860_excel(
-                eia860_path, "Boiler Info & Design Parameters", 1
-            )
-
-            csv_fn = eia860_name.split(".")[0] + "_boiler_info.csv"
-            csv_path = join(expected_860_folder, csv_fn)
-            eia.to_csv(csv_path, index=False)
-    eia = _clean_columns(eia)
-    return eia
+    """
+    Return EIA-860 Schedule 6.2 Boiler Info & Design Parameters with snake
+    case columns.
+    """
+    return _clean_columns(eia860_schedule(year, "boiler_info"))
 
 
 def eia860_EnviroAssoc_nox(year):
-    expected_860_folder = join(data_dir, "eia860_{}".format(year))
+    """Return EIA-860 Schedule 6.1 Boiler NOx with snake case columns."""
+    return _clean_columns(eia860_schedule(year, "boiler_nox"))
 
-    if not os.path.exists(expected_860_folder):
-        print("Downloading EIA-860 files")
-        eia860_download(year=year, save_path=expected_860_folder)
-
-        eia860_path, eia860_name = find_file_in_folder(
-            folder_path=expected_860_folder,
-            file_pattern_match=["6_1_EnviroAssoc", "xlsx"],
-            return_name=True,
-        )
-        # eia860_files = os.listdir(expected_860_folder)
-
-        # # would be more elegent with glob but this works to identify the
-        # # Schedule_2_3_4_5 file
-        # for f in eia860_files:
-        #     if '2___Plant' in f:
-        #         plant_file = f
-
-        # eia860_path = join(expected_860_folder, plant_file)
-
-        # colstokeep = group_cols + sum_cols
-        eia = load_eia860_excel(eia860_path, "Boiler NOx", 1)
-
-        # Save as csv for easier access in future
-        csv_fn = eia860_name.split(".")[0] + "_boiler_nox.csv"
-        csv_path = join(expected_860_folder, csv_fn)
-        eia.to_csv(csv_path, index=False)
-
-    else:
-        all_files = os.listdir(expected_860_folder)
-
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [
-            f
-            for f in all_files
-            if "_boiler_nox.csv" in f
-            and "6_1_EnviroAssoc_Y{}".format(year) in f
-        ]
-
-        # Read and return the existing csv file if it exists
-        if csv_file:
-            print("Loading {} EIA-860 plant data from csv file".format(year))
-            fn = csv_file[0]
-            csv_path = join(expected_860_folder, fn)
-            eia = pd.read_csv(csv_path, dtype={"Plant Id": str},low_memory=False)
-
-        else:
-            print("Loading data from previously downloaded excel file")
-            eia860_path, eia860_name = find_file_in_folder(
-                folder_path=expected_860_folder,
-                file_pattern_match=["6_1_EnviroAssoc", "xlsx"],
-                return_name=True,
-            )
-            # # would be more elegent with glob but this works to identify the
-            # # Schedule_2_3_4_5 file
-            # for f in all_files:
-            #     if '2___Plant' in f:
-            #         plant_file = f
-            # eia860_path = join(expected_860_folder, plant_file)
-            eia = load_eia860_excel(eia860_path, "Boiler NOx", 1)
-
-            csv_fn = eia860_name.split(".")[0] + "_boiler_nox.csv"
-            csv_path = join(expected_860_folder, csv_fn)
-            eia.to_csv(csv_path, index=False)
-    eia = _clean_columns(eia)
-    return eia
 
 def eia860_generator_info(year):
-    expected_860_folder = join(data_dir, "eia860_{}".format(year))
-
-    if not os.path.exists(expected_860_folder):
-        print("Downloading EIA-860 files")
-        eia860_download(year=year, save_path=expected_860_folder)
-
-        eia860_path, eia860_name = find_file_in_folder(
-            folder_path=expected_860_folder,
-            file_pattern_match=["3_1_Generator", "xlsx"],
-            return_name=True,
-        )
-        # eia860_files = os.listdir(expected_860_folder)
-
-        # # would be more elegent with glob but this works to identify the
-        # # Schedule_2_3_4_5 file
-        # for f in eia860_files:
-        #     if '2___Plant' in f:
-        #         plant_file = f
-
-        # eia860_path = join(expected_860_folder, plant_file)
-
-        # colstokeep = group_cols + sum_cols
-        eia = load_eia860_excel(eia860_path, "Operable", 1)
-
-        # Save as csv for easier access in future
-        csv_fn = eia860_name.split(".")[0] + "_generator_operable.csv"
-        csv_path = join(expected_860_folder, csv_fn)
-        eia.to_csv(csv_path, index=False)
-
-    else:
-        all_files = os.listdir(expected_860_folder)
-
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [
-            f
-            for f in all_files
-            if "_generator_operable.csv" in f
-            and "3_1_Generator" in f
-        ]
-
-        # Read and return the existing csv file if it exists
-        if csv_file:
-            print("Loading {} EIA-860 plant data from csv file".format(year))
-            fn = csv_file[0]
-            csv_path = join(expected_860_folder, fn)
-            eia = pd.read_csv(csv_path, dtype={"Plant Id": str},low_memory=False)
-
-        else:
-            print("Loading data from previously downloaded excel file")
-            eia860_path, eia860_name = find_file_in_folder(
-                folder_path=expected_860_folder,
-                file_pattern_match=["3_1_Generator", "xlsx"],
-                return_name=True,
-            )
-            # # would be more elegent with glob but this works to identify the
-            # # Schedule_2_3_4_5 file
-            # for f in all_files:
-            #     if '2___Plant' in f:
-            #         plant_file = f
-            # eia860_path = join(expected_860_folder, plant_file)
-            eia = load_eia860_excel(eia860_path, "Operable", 1)
-
-            csv_fn = eia860_name.split(".")[0] + "_generator_operable.csv"
-            csv_path = join(expected_860_folder, csv_fn)
-            eia.to_csv(csv_path, index=False)
-    eia = _clean_columns(eia)
-    return eia
+    """
+    Return EIA-860 Schedule 3.1 operable generators with snake case columns.
+    """
+    return _clean_columns(eia860_schedule(year, "generator_operable"))
 
 
 if __name__ == "__main__":
@@ -5,11 +5,15 @@ import os
 from os.path import join
 import requests
 from electricitylci.globals import data_dir, EIA923_BASE_URL, FUEL_CAT_CODES
-from electricitylci.utils import download_unzip, find_file_in_folder
+from electricitylci.utils import (
+    download_unzip,
+    find_file_in_folder,
+    type_columns,
+)
 from electricitylci.model_config import model_specs
 
 from electricitylci.eia860_facilities import eia860_balancing_authority
-from functools import lru_cache
+import electricitylci.dataset_cache as dataset_cache
 
 EIA923_PAGES = {
     "1": "Page 1 Generation and Fuel Data",
@@ -38,6 +42,8 @@ EIA923_HEADER_ROWS = {
     "8c": 4,
 }
 
+EIA923_PAGE_DTYPES = {"Plant Id": str, "YEAR": str, "NAICS Code": str}
+
 
 def _clean_columns(df):
     "Remove special characters and convert column names to snake case"
@@ -82,7 +88,7 @@ def load_eia923_excel(eia923_path, page="1"):
         sheet_name=page_to_load,
         header=header_row,
         na_values=["."],
-        dtype={"Plant Id": str, "YEAR": str, "NAICS Code": str},
+        dtype=EIA923_PAGE_DTYPES,
     )
     # Get ride of line breaks. And apparently 2015 had 'Plant State'
     # instead of 'State'
@@ -105,9 +111,114 @@ def load_eia923_excel(eia923_path, page="1"):
     return eia
 
 
+# The pages used by the model, grouped by the workbook that holds them. The
+# keys are matched against the workbook file names in the f923_<year> folder.
+EIA923_WORKBOOK_PAGES = {
+    "2_3_4_5": ["1", "3", "5"],
+    "Schedule_8": ["8c"],
+}
+
+# Version of the saved page tables. Increase it whenever the parsing or the
+# column types of the pages change so old tables are not used.
+EIA923_TABLE_VERSION = 1
+
+
+def _parse_eia923_page(xls, page):
+    """Parse one page from an open EIA-923 workbook (pandas ExcelFile)."""
+    # Page 5 (fuel receipts) only keeps the columns needed for the upstream
+    # fuel models.
+    if page == "5":
+        return xls.parse(
+            EIA923_PAGES[page], skiprows=4, usecols="A:E,H:M,P:Q"
+        )
+    return load_eia923_excel(xls, page=page)
+
+
+def _typed_eia923_page(eia, page):
+    """
+    Give every column of a parsed page a fixed type (see utils.type_columns).
+    The identifier columns in EIA923_PAGE_DTYPES are text, except on page 5,
+    which keeps numeric plant ids.
+    """
+    return type_columns(eia, {} if page == "5" else EIA923_PAGE_DTYPES)
+
+
+def _eia923_page_path(folder, year, page):
+    return join(
+        folder, f"eia923_{year}_page_{page}_v{EIA923_TABLE_VERSION}.pkl"
+    )
+
+
+def eia923_page(year, page):
+    """
+    Return one page of the EIA-923 data for a year, downloading the data if
+    necessary.
+
+    Pages are kept in the dataset cache so each one is parsed only once. When
+    a page has no saved table yet, its workbook is opened once and every page
+    listed for that workbook in EIA923_WORKBOOK_PAGES that is not saved yet
+    is parsed, given fixed column types and pickled in the f923_<year>
+    folder at the same time, so the large Excel files are not re-opened for
+    each page. Each call returns a new copy that the caller may modify.
+
+    Parameters
+    ----------
+    year : int or str
+        Year of data
+    page : str
+        Key of the page in EIA923_PAGES (e.g. "1", "3", "5", "8c")
+
+    Returns
+    -------
+    dataframe
+        The page with its original column names
+    """
+    key = ("eia923", int(year), page)
+    eia = dataset_cache.get(key)
+    if eia is not None:
+        return eia
+
+    expected_923_folder = join(data_dir, "f923_{}".format(year))
+    if not os.path.exists(expected_923_folder):
+        print("Downloading EIA-923 files")
+        eia923_download(year=year, save_path=expected_923_folder)
+
+    page_path = _eia923_page_path(expected_923_folder, year, page)
+    if os.path.exists(page_path):
+        print("Loading {} EIA-923 page {} from saved table".format(year, page))
+        dataset_cache.put(key, pd.read_pickle(page_path))
+        return dataset_cache.get(key)
+
+    workbook_match = [
+        match
+        for match, pages in EIA923_WORKBOOK_PAGES.items()
+        if page in pages
+    ][0]
+    eia923_path, eia923_name = find_file_in_folder(
+        folder_path=expected_923_folder,
+        file_pattern_match=[workbook_match, "xlsx"],
+        return_name=True,
+    )
+    print("Loading {} EIA-923 data from {}".format(year, eia923_name))
+    xls = pd.ExcelFile(eia923_path)
+    for workbook_page in EIA923_WORKBOOK_PAGES[workbook_match]:
+        workbook_path = _eia923_page_path(
+            expected_923_folder, year, workbook_page
+        )
+        if workbook_page != page and os.path.exists(workbook_path):
+            continue
+        eia = _typed_eia923_page(
+            _parse_eia923_page(xls, workbook_page), workbook_page
+        )
+        eia.to_pickle(workbook_path)
+        dataset_cache.put(("eia923", int(year), workbook_page), eia)
+    xls.close()
+    return dataset_cache.get(key)
+
+
 # This function is called multiple times by the various upstream modules.
-# lru_cache allows us to only read from the csv only once.
-@lru_cache(maxsize=10)
+# The dataset cache keeps the result and hands each caller its own copy.
+@dataset_cache.cached_dataset("eia923")
 def eia923_download_extract(
     year,
     group_cols=[
@@ -135,76 +246,7 @@ def eia923_download_extract(
         generation and fuel consumption data.
 
     """
-    expected_923_folder = join(data_dir, "f923_{}".format(year))
-
-    if not os.path.exists(expected_923_folder):
-        print("Downloading EIA-923 files")
-        eia923_download(year=year, save_path=expected_923_folder)
-
-        eia923_path, eia923_name = find_file_in_folder(
-            folder_path=expected_923_folder,
-            file_pattern_match=["2_3_4_5"],
-            return_name=True,
-        )
-        # eia923_files = os.listdir(expected_923_folder)
-
-        # # would be more elegent with glob but this works to identify the
-        # # Schedule_2_3_4_5 file
-        # for f in eia923_files:
-        #     if '2_3_4_5' in f:
-        #         gen_file = f
-
-        # eia923_path = join(expected_923_folder, gen_file)
-
-        # colstokeep = group_cols + sum_cols
-        eia = load_eia923_excel(eia923_path)
-
-        # Save as csv for easier access in future
-        csv_fn = eia923_name.split(".")[0] + "page_1.csv"
-        csv_path = join(expected_923_folder, csv_fn)
-        eia.to_csv(csv_path, index=False)
-
-    else:
-        all_files = os.listdir(expected_923_folder)
-
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [
-            f
-            for f in all_files
-            if ".csv" in f and "{}_Final".format(year) in f and "page_1" in f
-        ]
-
-        # Read and return the existing csv file if it exists
-        if csv_file:
-            print("Loading {} EIA-923 data from csv file".format(year))
-            fn = csv_file[0]
-            csv_path = join(expected_923_folder, fn)
-            eia = pd.read_csv(
-                csv_path,
-                dtype={"Plant Id": str, "YEAR": str, "NAICS Code": str},
-                low_memory=False,
-            )
-
-        else:
-
-            eia923_path, eia923_name = find_file_in_folder(
-                folder_path=expected_923_folder,
-                file_pattern_match=["2_3_4_5", "xlsx"],
-                return_name=True,
-            )
-
-            # # would be more elegent with glob but this works to identify the
-            # # Schedule_2_3_4_5 file
-            # for f in all_files:
-            #     if '2_3_4_5' in f:
-            #         gen_file = f
-            # eia923_path = join(expected_923_folder, gen_file)
-            eia = load_eia923_excel(eia923_path)
-
-            csv_fn = eia923_name.split(".")[0] + "_page_1.csv"
-            csv_path = join(expected_923_folder, csv_fn)
-            eia.to_csv(csv_path, index=False)
+    eia = eia923_page(year, "1")
 
     # EIA_923 = eia
     # Grouping similar facilities together.
@@ -295,7 +337,9 @@ def eia923_primary_fuel(
         / primary_fuel["total_gen"]
         * 100
     )
-    primary_fuel["primary fuel percent gen"].fillna(value=0, inplace=True)
+    primary_fuel["primary fuel percent gen"] = primary_fuel[
+        "primary fuel percent gen"
+    ].fillna(value=0)
     primary_fuel["FuelCategory"] = group_fuel_categories(primary_fuel)
     if model_specs.keep_mixed_plant_category:
         primary_fuel.loc[
@@ -440,180 +484,21 @@ def build_generation_data(
 
 
 def eia923_generation_and_fuel(year):
-    expected_923_folder = join(data_dir, "f923_{}".format(year))
-
-    if not os.path.exists(expected_923_folder):
-        print("Downloading EIA-923 files")
-        eia923_download(year=year, save_path=expected_923_folder)
-
-        eia923_path, eia923_name = find_file_in_folder(
-            folder_path=expected_923_folder,
-            file_pattern_match=["2_3_4_5", "xlsx"],
-            return_name=True,
-        )
-        # Save as csv for easier access in future
-        csv_fn = eia923_name.split(".")[0] + "page_1.csv"
-        csv_path = join(expected_923_folder, csv_fn)
-        eia = load_eia923_excel(expected_923_folder, page="1")
-        eia.to_csv(csv_path, index=False)
-    else:
-        all_files = os.listdir(expected_923_folder)
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [
-            f
-            for f in all_files
-            if ".csv" in f and "{}_Final".format(year) in f and "page_1" in f
-        ]
-
-        # Read and return the existing csv file if it exists
-        if csv_file:
-            print("Loading {} EIA-923 data from csv file".format(year))
-            fn = csv_file[0]
-            csv_path = join(expected_923_folder, fn)
-            eia = pd.read_csv(
-                csv_path,
-                dtype={"Plant Id": str, "YEAR": str, "NAICS Code": str},
-                low_memory=False,
-            )
-        else:
-
-            eia923_path, eia923_name = find_file_in_folder(
-                folder_path=expected_923_folder,
-                file_pattern_match=["2_3_4_5", "xlsx"],
-                return_name=True,
-            )
-
-            # # would be more elegent with glob but this works to identify the
-            # # Schedule_2_3_4_5 file
-            # for f in all_files:
-            #     if '2_3_4_5' in f:
-            #         gen_file = f
-            # eia923_path = join(expected_923_folder, gen_file)
-            eia = load_eia923_excel(eia923_path, page="1")
-            csv_fn = eia923_name.split(".")[0] + "_page_1.csv"
-            csv_path = join(expected_923_folder, csv_fn)
-            eia.to_csv(csv_path, index=False)
-    eia = _clean_columns(eia)
-    return eia
+    """Return EIA-923 Page 1 (generation and fuel) with snake case columns."""
+    return _clean_columns(eia923_page(year, "1"))
 
 
 def eia923_boiler_fuel(year):
-    expected_923_folder = join(data_dir, "f923_{}".format(year))
-
-    if not os.path.exists(expected_923_folder):
-        print("Downloading EIA-923 files")
-        eia923_download(year=year, save_path=expected_923_folder)
-
-        eia923_path, eia923_name = find_file_in_folder(
-            folder_path=expected_923_folder,
-            file_pattern_match=["2_3_4_5", "xlsx"],
-            return_name=True,
-        )
-        # Save as csv for easier access in future
-        csv_fn = eia923_name.split(".")[0] + "page_3.csv"
-        csv_path = join(expected_923_folder, csv_fn)
-        eia = load_eia923_excel(expected_923_folder, page="3")
-        eia.to_csv(csv_path, index=False)
-    else:
-        all_files = os.listdir(expected_923_folder)
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [
-            f
-            for f in all_files
-            if ".csv" in f and "{}_Final".format(year) in f and "page_3" in f
-        ]
-
-        # Read and return the existing csv file if it exists
-        if csv_file:
-            print("Loading {} EIA-923 data from csv file".format(year))
-            fn = csv_file[0]
-            csv_path = join(expected_923_folder, fn)
-            eia = pd.read_csv(
-                csv_path,
-                dtype={"Plant Id": str, "YEAR": str, "NAICS Code": str},
-                low_memory=False,
-            )
-        else:
-
-            eia923_path, eia923_name = find_file_in_folder(
-                folder_path=expected_923_folder,
-                file_pattern_match=["2_3_4_5", "xlsx"],
-                return_name=True,
-            )
-
-            # # would be more elegent with glob but this works to identify the
-            # # Schedule_2_3_4_5 file
-            # for f in all_files:
-            #     if '2_3_4_5' in f:
-            #         gen_file = f
-            # eia923_path = join(expected_923_folder, gen_file)
-            eia = load_eia923_excel(eia923_path, page="3")
-            csv_fn = eia923_name.split(".")[0] + "_page_3.csv"
-            csv_path = join(expected_923_folder, csv_fn)
-            eia.to_csv(csv_path, index=False)
-    eia = _clean_columns(eia)
-    return eia
+    """Return EIA-923 Page 3 (boiler fuel) with snake case columns."""
+    return _clean_columns(eia923_page(year, "3"))
 
 
 def eia923_sched8_aec(year):
-    expected_923_folder = join(data_dir, "f923_{}".format(year))
-
-    if not os.path.exists(expected_923_folder):
-        print("Downloading EIA-923 files")
-        eia923_download(year=year, save_path=expected_923_folder)
-
-        eia923_path, eia923_name = find_file_in_folder(
-            folder_path=expected_923_folder,
-            file_pattern_match=["Schedule_8", "xlsx"],
-            return_name=True,
-        )
-        # Save as csv for easier access in future
-        csv_fn = eia923_name.split(".")[0] + "page_8c.csv"
-        csv_path = join(expected_923_folder, csv_fn)
-        eia = load_eia923_excel(expected_923_folder, page="8c")
-        eia.to_csv(csv_path, index=False)
-    else:
-        all_files = os.listdir(expected_923_folder)
-        # Check for both csv and year<_Final> in case multiple years
-        # or other csv files exist
-        csv_file = [
-            f
-            for f in all_files
-            if ".csv" in f and "{}_Final".format(year) in f and "page_8c" in f
-        ]
-
-        # Read and return the existing csv file if it exists
-        if csv_file:
-            print("Loading {} EIA-923 data from csv file".format(year))
-            fn = csv_file[0]
-            csv_path = join(expected_923_folder, fn)
-            eia = pd.read_csv(
-                csv_path,
-                dtype={"Plant Id": str, "YEAR": str, "NAICS Code": str},
-                low_memory=False,
-            )
-        else:
-
-            eia923_path, eia923_name = find_file_in_folder(
-                folder_path=expected_923_folder,
-                file_pattern_match=["Schedule_8", "xlsx"],
-                return_name=True,
-            )
-
-            # # would be more elegent with glob but this works to identify the
-            # # Schedule_2_3_4_5 file
-            # for f in all_files:
-            #     if '2_3_4_5' in f:
-            #         gen_file = f
-            # eia923_path = join(expected_923_folder, gen_file)
-            eia = load_eia923_excel(eia923_path, page="8c")
-            csv_fn = eia923_name.split(".")[0] + "_page_8c.csv"
-            csv_path = join(expected_923_folder, csv_fn)
-            eia.to_csv(csv_path, index=False)
-    eia = _clean_columns(eia)
-    return eia
+    """
+    Return EIA-923 Schedule 8C (air emissions control) with snake case
+    columns.
+    """
+    return _clean_columns(eia923_page(year, "8c"))
 
 
 if __name__ == "__main__":
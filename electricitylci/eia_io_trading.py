@@ -9,11 +9,21 @@ from os.path import join
 import zipfile
 import requests
 import logging
+from functools import lru_cache
+from scipy.sparse import csc_matrix, diags, identity
+from scipy.sparse.linalg import splu
 
 
 from electricitylci.globals import data_dir, output_dir
-from electricitylci.bulk_eia_data import download_EBA, row_to_df, ba_exchange_to_df
+from electricitylci.bulk_eia_data import (
+    EBA_GEOSETS,
+    REGION_ACRONYMS,
+    eba_vintage,
+    load_eba_cube,
+    load_eba_index,
+)
 from electricitylci.model_config import model_specs
+from electricitylci.utils import index_processes, settings_key
 import electricitylci.eia923_generation as eia923
 import electricitylci.eia860_facilities as eia860
 
@@ -51,87 +61,135 @@ from electricitylci.process_dictionary_writer import *
 """
 
 
-def ba_io_trading_model(year=None, subregion=None, regions_to_keep=None):
-    REGION_NAMES = [
-        'California', 'Carolinas', 'Central',
-        'Electric Reliability Council of Texas, Inc.', 'Florida',
-        'Mid-Atlantic', 'Midwest', 'New England ISO',
-        'New York Independent System Operator', 'Northwest', 'Southeast',
-        'Southwest', 'Tennessee Valley Authority'
-    ]
+REGION_NAMES = [
+    'California', 'Carolinas', 'Central',
+    'Electric Reliability Council of Texas, Inc.', 'Florida',
+    'Mid-Atlantic', 'Midwest', 'New England ISO',
+    'New York Independent System Operator', 'Northwest', 'Southeast',
+    'Southwest', 'Tennessee Valley Authority'
+]
 
-    REGION_ACRONYMS = [
-        'TVA', 'MIDA', 'CAL', 'CAR', 'CENT', 'ERCO', 'FLA',
-        'MIDW', 'ISNE', 'NYIS', 'NW', 'SE', 'SW',
-    ]
-    if year is None:
-        year = model_specs.NETL_IO_trading_year
-    if subregion is None:
-        subregion = model_specs.regional_aggregation
-    if subregion not in ['BA', 'FERC','US']:
-        raise ValueError(
-            f'subregion or regional_aggregation must have a value of "BA" or "FERC" '
-            f'when calculating trading with input-output, not {subregion}'
-        )
+# Trade between the eastern and western interconnections is not allowed.
+# Connections between them are through SWPP and WAUE.
+INTERCONNECT_BREAKS = {
+    'SWPP': ['EPE', 'PNM', 'PSCO', 'WACM'],
+    'WAUE': ['WAUW', 'WACM'],
+}
 
-    # Read in BAA file which contains the names and abbreviations
-    df_BA = pd.read_excel(data_dir + '/BA_Codes_930.xlsx', sheet_name = 'US', header = 4)
-    df_BA.rename(columns={'etag ID': 'BA_Acronym', 'Entity Name': 'BA_Name','NCR_ID#': 'NRC_ID', 'Region': 'Region'}, inplace=True)
-    BA = pd.np.array(df_BA['BA_Acronym'])
-    US_BA_acronyms = df_BA['BA_Acronym'].tolist()
 
-    # Read in BAA file which contains the names and abbreviations
-    # Original df_BAA does not include the Canadian balancing authorities
-    # Import them here, then concatenate to make a single df_BAA_NA (North America)
+def _read_canadian_imports(year):
+    """
+    Read the annual Canadian generation and trade with US BAs.
 
-    df_BA_CA = pd.read_excel(data_dir + '/BA_Codes_930.xlsx', sheet_name = 'Canada', header = 4)
-    df_BA_CA.rename(columns={'etag ID': 'BA_Acronym', 'Entity Name': 'BA_Name','NCR_ID#': 'NRC_ID', 'Region': 'Region'}, inplace=True)
-    df_BA_NA = pd.concat([df_BA, df_BA_CA])
-    ferc_list = df_BA_NA['FERC_Region_Abbr'].unique().tolist()
+    Returns
+    -------
+    tuple
+        (generation series indexed by Canadian BA, Canadian BA x US BA
+        exports, US BA x Canadian BA exports)
+    """
+    ca_gen = pd.read_csv(data_dir + '/CA_Imports_Gen.csv', index_col = 0)[str(year)]
+    ca_rows = pd.read_csv(data_dir + '/CA_Imports_Rows.csv', index_col = 0)
+    ca_rows = ca_rows.pivot(columns = 'us_ba', values = str(year))
+    ca_cols = pd.read_csv(data_dir + '/CA_Imports_Cols.csv', index_col = 0)
+    return ca_gen, ca_rows, ca_cols
+
+
+def _trading_ba_index(us_bas, ca_gen, ca_rows, ca_cols):
+    """Return the sorted BA index shared by all trading model arrays."""
+    return pd.Index(sorted(
+        set(us_bas) | set(ca_gen.index) | set(ca_rows.index)
+        | set(ca_cols.index) | set(ca_cols.columns)
+    ))
+
+
+def _reconcile_trade(exchange):
+    """
+    Reconcile the interchange reported by the two BAs of each pair.
+
+    exchange[i, j] is the interchange BA i reported with BA j, positive for
+    exports from i. Pairs where both BAs report as exporters, both as
+    importers, either reports zero or only one reports are dropped. If the
+    two reported amounts differ by less than 20% on average (relative to
+    each of them), the traded amount is their mean; otherwise it is the
+    amount reported by the exporting BA.
+
+    Parameters
+    ----------
+    exchange : numpy.array
+        BA x BA array of reported interchange, or BA x BA x hour, with NaN
+        where nothing was reported
+
+    Returns
+    -------
+    numpy.array
+        Array of the same shape with the traded amounts, exporting BAs in
+        rows and importing BAs in columns, and zero elsewhere
+    """
+    e_12 = exchange
+    e_21 = np.swapaxes(exchange, 0, 1)
+    keep = (e_12 > 0) & (e_21 < 0)
+    abs_12 = np.abs(np.where(keep, e_12, 1))
+    abs_21 = np.abs(np.where(keep, e_21, 1))
+    percent_diff_avg = (
+        np.abs(abs_12 / abs_21 - 1) + np.abs(abs_21 / abs_12 - 1)
+    ) / 2
+    final = np.where(percent_diff_avg < 0.2, (abs_12 + abs_21) / 2, abs_12)
+    return np.where(keep, final, 0)
+
+
+def _solve_consumption_matrix(T, x, c):
+    """
+    Solve the Qu et al. (2018) trading model for the consumption matrix
+    H = (I - B)^-1 c_hat, with B = T x_hat^-1.
+
+    x_hat is diagonal, so B is T with each column divided by the inflow of
+    its BA. I - B is factorized once with a sparse LU decomposition and
+    solved for the columns of c_hat, so no inverse is formed.
+
+    Parameters
+    ----------
+    T : numpy.array
+        BA x BA trade matrix, exporting BAs in rows
+    x : numpy.array
+        Total inflow (net generation plus imports) of each BA, non-zero
+    c : numpy.array
+        Consumption of each BA
+
+    Returns
+    -------
+    numpy.array
+        BA x BA matrix; column j is the generation in each BA consumed in j
+    """
+    n = len(x)
+    B = csc_matrix(T) @ diags(1 / x)
+    lu = splu((identity(n, format="csc") - B).tocsc())
+    return lu.solve(np.diag(c).astype(float))
+
+
+# Version of the saved trading model solution. Increase it whenever its
+# contents change so old solutions are not used.
+TRADING_SOLUTION_VERSION = 4
+
+# Default relative bounds of the uniform perturbations in
+# trading_sensitivity.
+SENSITIVITY_BOUNDS = {
+    "interchange": 0.2,
+    "net_gen": 0.05,
+    "canadian_imports": 0.2,
+}
+
+
+def _build_trading_solution(year):
+    """Solve the annual trading model; see load_trading_solution."""
+    df_BA = pd.read_excel(data_dir + '/BA_Codes_930.xlsx', sheet_name = 'US', header = 4)
+    US_BA_acronyms = df_BA['etag ID'].tolist()
 
     # Read in the bulk data
 
-#    download_EBA()
-    path = join(data_dir, 'bulk_data', 'EBA.zip')
-    NET_GEN_ROWS = []
-    BA_TO_BA_ROWS = []
-    DEMAND_ROWS=[]
-    TOTAL_INTERCHANGE_ROWS=[]
-    try:
-        logging.info("Using existing bulk data download")
-        z = zipfile.ZipFile(path, 'r')
-
-    except FileNotFoundError:
-        logging.info("Downloading new bulk data")
-        download_EBA()
-        z = zipfile.ZipFile(path, 'r')
-    logging.info("Loading bulk data to json")
-    with z.open('EBA.txt') as f:
-        for line in f:
-            # All but one BA is currently reporting net generation in UTC and local time
-            # for that one BA (GRMA) only UTC time is reported - so only pulling that
-            # for now.
-            if b'EBA.NG.H' in line and b'EBA.NG.HL' not in line:
-                NET_GEN_ROWS.append(json.loads(line))
-            # Similarly there are 5 interchanges that report interchange in UTC but not in
-            # local time.
-            elif b'EBA.ID.H' in line and b'EBA.ID.HL' not in line:
-                exchange_line=json.loads(line)
-                if exchange_line['series_id'].split('-')[0][4:] not in REGION_ACRONYMS:
-#                    try:
-                        # Adding this check here to hopefully save some time down the road.
-                        # dummy_date=datetime.strptime(exchange_line['data'][0][0],'%Y%m%dT%HZ')
-                        BA_TO_BA_ROWS.append(exchange_line)
-                        # good_date_count+=1
-#                    except ValueError:
-                        # bad_date_count+=1
-#                        continue
-            # Keeping these here just in case
-            elif b'EBA.D.H' in line and b'EBA.D.HL' not in line:
-                DEMAND_ROWS.append(json.loads(line))
-#            elif b'EBA.TI.H' in line:
-#                TOTAL_INTERCHANGE_ROWS.append(json.loads(line))
-    logging.info(f"Net gen rows: {len(NET_GEN_ROWS)}; BA to BA rows:{len(BA_TO_BA_ROWS)}; Demand rows:{len(DEMAND_ROWS)}")
+    logging.info("Loading bulk data series")
+    eba_cube = load_eba_cube(year)
+    eba_bas = np.array(eba_cube["bas"])
+    logging.info(f"Bulk data BAs: {len(eba_bas)}; hours: {len(eba_cube['datetime'])}")
     eia923_gen=eia923.build_generation_data(generation_years=[year])
     eia860_df=eia860.eia860_balancing_authority(year)
     eia860_df["Plant Id"]=eia860_df["Plant Id"].astype(int)
@@ -142,297 +200,201 @@ def ba_io_trading_model(year=None, subregion=None, regions_to_keep=None):
                                      how="left")
     eia_gen_ba=eia_combined_df.groupby(by=["Balancing Authority Code"],as_index=False)["Electricity"].sum()
 
-    # Subset for specified eia_gen_year
-    start_datetime = '{}-01-01 00:00:00+00:00'.format(year)
-    end_datetime = '{}-12-31 23:00:00+00:00'.format(year)
-
-    start_datetime = datetime.strptime(start_datetime, '%Y-%m-%d %H:%M:%S%z')
-    end_datetime = datetime.strptime(end_datetime, '%Y-%m-%d %H:%M:%S%z')
-
-    # Net Generation Data Import
-    logging.info("Generating df with datetime")
-    df_net_gen = row_to_df(NET_GEN_ROWS, 'net_gen')
-    del(NET_GEN_ROWS)
-    logging.info("Pivoting")
-    df_net_gen = df_net_gen.pivot(index = 'datetime', columns = 'region', values = 'net_gen')
+    # Canonical BA index of every trading model array: US BAs and the
+    # Canadian BAs that trade with them, in alphabetical order
+    ca_gen, ca_rows, ca_cols = _read_canadian_imports(year)
     ba_cols = US_BA_acronyms
-
-    gen_cols = list(df_net_gen.columns.values)
-
-    gen_cols_set = set(gen_cols)
-    ba_ref_set = set(ba_cols)
-
-    col_diff = list(ba_ref_set - gen_cols_set)
-    col_diff.sort(key = str.upper)
-    logging.info("Cleaning net_gen dataframe")
-
-    # Add in missing columns, then sort in alphabetical order
-    for i in col_diff:
-        df_net_gen[i] = 0
-
-    # Keep only the columns that match the balancing authority names, there are several other columns included in the dataset
-    # that represent states (e.g., TEX, NY, FL) and other areas (US48)
-
-    df_net_gen = df_net_gen[ba_cols]
-
-    # Resort columns so the headers are in alpha order
-    df_net_gen = df_net_gen.sort_index(axis=1)
-    df_net_gen = df_net_gen.fillna(value = 0)
-
-    df_net_gen = df_net_gen.loc[start_datetime:end_datetime]
-
-    # Sum values in each column
-    df_net_gen_sum = df_net_gen.sum(axis = 0).to_frame()
-    logging.info("Reading canadian import data")
-    # Add Canadian import data to the net generation dataset, concatenate and put in alpha order
-    df_CA_Imports_Gen = pd.read_csv(data_dir + '/CA_Imports_Gen.csv', index_col = 0)
-    df_CA_Imports_Gen = df_CA_Imports_Gen[str(year)]
-
+    bas = _trading_ba_index(ba_cols, ca_gen, ca_rows, ca_cols)
+    ba_idx = pd.Series(range(len(bas)), index=bas)
+
+    # Annual net generation of the US BAs. Keep only the BAs that match the
+    # balancing authority names, there are several other regions included in
+    # the dataset that represent states (e.g., TEX, NY, FL) and other areas
+    # (US48)
+    logging.info("Summing net generation")
+    eba_net_gen = pd.Series(
+        np.nansum(eba_cube["net_gen"], axis=1, dtype=np.float64), index=eba_bas
+    )
+    net_gen = eba_net_gen[eba_net_gen.index.isin(ba_cols)].reindex(bas, fill_value=0)
     logging.info("Combining US and Canadian net gen data")
-    df_net_gen_sum = pd.concat([df_net_gen_sum,df_CA_Imports_Gen]).sum(axis=1)
-    df_net_gen_sum = df_net_gen_sum.to_frame()
-    df_net_gen_sum = df_net_gen_sum.sort_index(axis=0)
+    net_gen += ca_gen.reindex(bas).fillna(0)
 
     # Check the net generation of each Balancing Authority against EIA 923 data.
     # If the percent change of a given area is greater than the mean absolute difference
     # of all of the areas, it will be treated as an error and replaced with the
     # value in EIA923.
     logging.info("Checking against EIA 923 generation data")
-    net_gen_check=df_net_gen_sum.merge(
-            right=eia_gen_ba,
-            left_index=True,
-            right_on=["Balancing Authority Code"],
-            how="left"
-            ).reset_index()
-    net_gen_check["diff"]=abs(net_gen_check["Electricity"]-net_gen_check[0])/net_gen_check[0]
-    diff_mad=net_gen_check["diff"].mad()
-    net_gen_swap=net_gen_check.loc[net_gen_check["diff"]>diff_mad,["Balancing Authority Code","Electricity"]].set_index("Balancing Authority Code")
-    df_net_gen_sum.loc[net_gen_swap.index,[0]]=np.nan
-    net_gen_swap.rename(columns={"Electricity":0},inplace=True)
-    df_net_gen_sum=df_net_gen_sum.combine_first(net_gen_swap)
-    # First work on the trading data from the 'df_trade_all_stack_2016' frame
-    # This cell does the following:
-    # 1. reformats the data to an annual basis
-    # 2. formats the BA names in the corresponding columns
-    # 3. evalutes the trade values from both BA perspectives
-    #  (e.g. BA1 as exporter and importer in a transaction with BA2)
-    # 4. evaluates the trading data for any results that don't make sense
-    #       a. both BAs designate as importers (negative value)
-    #       b. both BAs designate as exporters (postive value)
-    #       c. one of the BAs in the transation reports a zero value and the other is nonzero
-    # 5. calulate the percent difference in the transaction values reports by BAs
-    # 6. final exchange value based on logic;
-    #       a. if percent diff is less than 20%, take mean,
-    #       b. if not use the value as reported by the exporting BAA
-    #       c. designate each BA in the transaction either as the importer or exporter
-    # Output is a pivot with index (rows) representing exporting BAs,
-    #   columns representing importing BAs, and values for the traded amount
-
-    # Group and resample trading data so that it is on an annual basis
-
+    eia_gen = eia_gen_ba.set_index("Balancing Authority Code")["Electricity"].reindex(bas)
+    diff = (eia_gen - net_gen).abs() / net_gen
+    swap = diff > diff.mad()
+    net_gen[swap] = eia_gen[swap]
+
+    # Annual BA-to-BA interchange, reconciled between the two BAs of each
+    # pair (see _reconcile_trade). Output is a matrix with rows representing
+    # exporting BAs, columns representing importing BAs, and values for the
+    # traded amount.
     logging.info("Creating trading dataframe")
-    df_ba_trade = ba_exchange_to_df(BA_TO_BA_ROWS, data_type='ba_to_ba')
-    del(BA_TO_BA_ROWS)
-    df_ba_trade = df_ba_trade.set_index('datetime')
-    df_ba_trade['transacting regions'] = df_ba_trade['from_region'] + '-' + df_ba_trade['to_region']
-
-    logging.info("Filtering trading dataframe")
-    # Keep only the columns that match the balancing authority names, there are several other columns included in the dataset
-    # that represent states (e.g., TEX, NY, FL) and other areas (US48)
-    filt1 = df_ba_trade['from_region'].isin(ba_cols)
-    filt2 = df_ba_trade['to_region'].isin(ba_cols)
-    filt = filt1 & filt2
-    df_ba_trade = df_ba_trade[filt]
-
-    # Subset for eia_gen_year, need to pivot first because of non-unique datetime index
-    df_ba_trade_pivot = df_ba_trade.pivot(columns = 'transacting regions', values = 'ba_to_ba')
-
-    df_ba_trade_pivot = df_ba_trade_pivot.loc[start_datetime:end_datetime]
-
-    # Sum columns - represents the net transactced amount between the two BAs
-    df_ba_trade_sum = df_ba_trade_pivot.sum(axis = 0).to_frame()
-    df_ba_trade_sum = df_ba_trade_sum.reset_index()
-    df_ba_trade_sum.columns = ['BAAs','Exchange']
-
-    # Split BAA string into exporting and importing BAA columns
-    df_ba_trade_sum['BAA1'], df_ba_trade_sum['BAA2'] = df_ba_trade_sum['BAAs'].str.split('-', 1).str
-    df_ba_trade_sum = df_ba_trade_sum.rename(columns={'BAAs': 'Transacting BAAs'})
-
-    # Create two perspectives - import and export to use for comparison in selection of the final exchange value between the BAAs
-    df_trade_sum_1_2 = df_ba_trade_sum.groupby(['BAA1', 'BAA2','Transacting BAAs'], as_index=False)[['Exchange']].sum()
-    df_trade_sum_2_1 = df_ba_trade_sum.groupby(['BAA2', 'BAA1', 'Transacting BAAs'], as_index=False)[['Exchange']].sum()
-    df_trade_sum_1_2.columns = ['BAA1_1_2', 'BAA2_1_2','Transacting BAAs_1_2', 'Exchange_1_2']
-    df_trade_sum_2_1.columns = ['BAA2_2_1', 'BAA1_2_1','Transacting BAAs_2_1', 'Exchange_2_1']
-
-    # Combine two grouped tables for comparison for exchange values
-    df_concat_trade = pd.concat([df_trade_sum_1_2,df_trade_sum_2_1], axis = 1)
-    df_concat_trade['Exchange_1_2_abs'] = df_concat_trade['Exchange_1_2'].abs()
-    df_concat_trade['Exchange_2_1_abs'] = df_concat_trade['Exchange_2_1'].abs()
-
-    # Create new column to check if BAAs designate as either both exporters or both importers
-    # or if one of the entities in the transaction reports a zero value
-    # Drop combinations where any of these conditions are true, keep everything else
-    df_concat_trade['Status_Check'] = np.where(((df_concat_trade['Exchange_1_2'] > 0) & (df_concat_trade['Exchange_2_1'] > 0)) \
-                   |((df_concat_trade['Exchange_1_2'] < 0) & (df_concat_trade['Exchange_2_1'] < 0)) \
-                   | ((df_concat_trade['Exchange_1_2'] == 0) | (df_concat_trade['Exchange_2_1'] == 0)), 'drop', 'keep')
-
-    # Calculate the difference in exchange values
-    df_concat_trade['Delta'] = df_concat_trade['Exchange_1_2_abs'] - df_concat_trade['Exchange_2_1_abs']
-
-    # Calculate percent diff of exchange_abs values - this can be down two ways:
-    # relative to 1_2 exchange or relative to 2_1 exchange - perform the calc both ways
-    # and take the average
-    df_concat_trade['Percent_Diff_Avg']= ((abs((df_concat_trade['Exchange_1_2_abs']/df_concat_trade['Exchange_2_1_abs'])-1)) \
-        + (abs((df_concat_trade['Exchange_2_1_abs']/df_concat_trade['Exchange_1_2_abs'])-1)))/2
-
-    # Mean exchange value
-    df_concat_trade['Exchange_mean'] = df_concat_trade[['Exchange_1_2_abs', 'Exchange_2_1_abs']].mean(axis=1)
-
-    # Percent diff equations creats NaN where both values are 0, fill with 0
-    df_concat_trade['Percent_Diff_Avg'].fillna(0, inplace = True)
-
-    # Final exchange value based on logic; if percent diff is less than 20%, take mean,
-    # if not use the value as reported by the exporting BAA. First figure out which BAA is the exporter
-    # by checking the value of the Exchance_1_2
-    # If that value is positive, it indicates that BAA1 is exported to BAA2; if negative, use the
-    # value from Exchange_2_1
-    df_concat_trade['Final_Exchange'] = np.where((df_concat_trade['Percent_Diff_Avg'].abs() < 0.2),
-                   df_concat_trade['Exchange_mean'],np.where((df_concat_trade['Exchange_1_2'] > 0),
-                                  df_concat_trade['Exchange_1_2'],df_concat_trade['Exchange_2_1']))
-
-
-    # Assign final designation of BAA as exporter or importer based on logical assignment
-    df_concat_trade['Export_BAA'] = np.where((df_concat_trade['Exchange_1_2'] > 0), df_concat_trade['BAA1_1_2'],
-                   np.where((df_concat_trade['Exchange_1_2'] < 0), df_concat_trade['BAA2_1_2'],''))
-
-    df_concat_trade['Import_BAA'] = np.where((df_concat_trade['Exchange_1_2'] < 0), df_concat_trade['BAA1_1_2'],
-                   np.where((df_concat_trade['Exchange_1_2'] > 0), df_concat_trade['BAA2_1_2'],''))
-
-    df_concat_trade = df_concat_trade[df_concat_trade['Status_Check'] == 'keep']
-
-
-    # Create the final trading matrix; first grab the necessary columns, rename the columns and then pivot
-    df_concat_trade_subset = df_concat_trade[['Export_BAA', 'Import_BAA', 'Final_Exchange']]
-
-    df_concat_trade_subset.columns = ['Exporting_BAA', 'Importing_BAA', 'Amount']
-
-    df_trade_pivot = df_concat_trade_subset.pivot_table(index = 'Exporting_BAA', columns = 'Importing_BAA', values = 'Amount').fillna(0)
-
-
-    # This cell continues formatting the df_trade
-    # Find missing BAs - need to add them in so that we have a square matrix
-    # Not all BAs are involved in transactions
-
-    trade_cols = list(df_trade_pivot.columns.values)
-    trade_rows = list(df_trade_pivot.index.values)
-
-    trade_cols_set = set(trade_cols)
-    trade_rows_set = set(trade_rows)
-    trade_ba_ref_set = set(ba_cols)
-
-    trade_col_diff = list(trade_ba_ref_set - trade_cols_set)
-    trade_col_diff.sort(key = str.upper)
-
-    trade_row_diff = list(trade_ba_ref_set - trade_rows_set)
-    trade_row_diff.sort(key=str.upper)
-
-    # Add in missing columns, then sort in alphabetical order
-    for i in trade_col_diff:
-        df_trade_pivot[i] = 0
-
-    df_trade_pivot = df_trade_pivot.sort_index(axis=1)
-
-    # Add in missing rows, then sort in alphabetical order
-    for i in trade_row_diff:
-        df_trade_pivot.loc[i,:] = 0
-
-    df_trade_pivot = df_trade_pivot.sort_index(axis=0)
+    # Pairs of BAs that reported any interchange with each other this year
+    # (the bulk data arrays leave out the aggregate EIA regions).
+    pairs = eba_cube["pairs"]
+    interchange = eba_cube["interchange"]
+    has_trade = ~np.isnan(interchange).all(axis=1)
+    is_ba = np.isin(eba_bas, ba_cols)
+    has_trade &= is_ba[pairs[:, 0]] & is_ba[pairs[:, 1]]
+    from_idx, to_idx = pairs[has_trade, 0], pairs[has_trade, 1]
+
+    # Sum over the hours of the year - represents the net transactced amount
+    # between the two BAs. Pairs without any reported interchange stay NaN.
+    exchange = np.full((len(bas), len(bas)), np.nan)
+    exchange[
+        ba_idx[eba_bas[from_idx]].values, ba_idx[eba_bas[to_idx]].values
+    ] = np.nansum(interchange[has_trade, :], axis=1, dtype=np.float64)
+    df_trade = pd.DataFrame(_reconcile_trade(exchange), index=bas, columns=bas)
 
     # Add Canadian Imports to the trading matrix
-    # CA imports are specified in an external file
-    df_CA_Imports_Cols = pd.read_csv(data_dir + '/CA_Imports_Cols.csv', index_col = 0)
-
-    df_CA_Imports_Rows = pd.read_csv(data_dir + '/CA_Imports_Rows.csv', index_col = 0)
-    df_CA_Imports_Rows = df_CA_Imports_Rows[['us_ba', str(year)]]
-    df_CA_Imports_Rows = df_CA_Imports_Rows.pivot(columns = 'us_ba', values = str(year))
-
-    df_concat_trade_CA = pd.concat([df_trade_pivot, df_CA_Imports_Rows])
-    df_concat_trade_CA = pd.concat([df_concat_trade_CA, df_CA_Imports_Cols], axis = 1)
-    df_concat_trade_CA.fillna(0, inplace = True)
-    df_trade_pivot = df_concat_trade_CA
-    df_trade_pivot = df_trade_pivot.sort_index(axis=0)
-    df_trade_pivot = df_trade_pivot.sort_index(axis=1)
+    # CA imports are specified in external files
+    for ca_trade in [ca_rows, ca_cols]:
+        df_trade += ca_trade.reindex(index=bas, columns=bas).fillna(0)
 
     # Perform trading calculations as provided in Qu et al (2018) to
     # determine the composition of a BA consumption mix
 
-    # Create total inflow vector x and then convert to a diagonal matrix x-hat
-    logging.info("Inflow vector")
-    x = []
-    for i in range (len(df_net_gen_sum)):
-        x.append(df_net_gen_sum.iloc[i] + df_trade_pivot.sum(axis = 0).iloc[i])
-
-    x_np = np.array(x)
-
+    # Total inflow vector x and consumption vector c, calculated from the
+    # trade before the interconnections are split
+    logging.info("Inflow and consumption vectors")
+    inflow = net_gen + df_trade.sum(axis=0)
+    consumption = inflow - df_trade.sum(axis=1)
     # If values are zero, x_hat matrix will be singular, set BAAs with 0 to small value (1)
-    df_x = pd.DataFrame(data = x_np, index = df_trade_pivot.index)
-    df_x = df_x.rename(columns = {0:'inflow'})
-    df_x.loc[df_x['inflow'] == 0] = 1
-
-    x_np = df_x.values
-
-    x_hat = np.diagflat(x_np)
-
-
-    # Create consumption vector c and then convert to a digaonal matrix c-hat
-    # Calculate c based on x and T
-    logging.info("consumption vector")
-    c = []
-
-    for i in range(len(df_net_gen_sum)):
-        c.append(x[i] - df_trade_pivot.sum(axis = 1).iloc[i])
-
-    c_np = np.array(c)
-    c_hat = np.diagflat(c_np)
-
-    # Convert df_trade_pivot to matrix
-    T = df_trade_pivot.values
+    inflow[inflow == 0] = 1
 
     # Create matrix to split T into distinct interconnections - i.e., prevent trading between eastern and western interconnects
     # Connections between the western and eastern interconnects are through SWPP and WAUE
     logging.info("Matrix operations")
-    interconnect = df_trade_pivot.copy()
-    interconnect[:] = 1
-    interconnect.loc['SWPP',['EPE', 'PNM', 'PSCO', 'WACM']] = 0
-    interconnect.loc['WAUE',['WAUW', 'WACM']] = 0
-    interconnect_mat = interconnect.values
-    T_split = np.multiply(T, interconnect_mat)
+    interconnect = np.ones((len(bas), len(bas)))
+    for exporter, importers in INTERCONNECT_BREAKS.items():
+        interconnect[ba_idx[exporter], ba_idx[importers].values] = 0
+    T_split = df_trade.values * interconnect
 
     # Matrix trading math (see Qu et al. 2018 ES&T paper)
-    x_hat_inv = np.linalg.inv(x_hat)
+    H = _solve_consumption_matrix(T_split, inflow.values, consumption.values)
+    df_final_trade_out = pd.DataFrame(H, index=bas, columns=bas)
+
+    #Balancing authorities that are associated with specific plants in
+    #EIA860. Those that are not won't have any data in the emissions
+    #dataframes, so their quantities are set to 0 in the consumption mixes,
+    #which are made up of the rest of the incoming balancing authority areas.
+    eia860_bas = sorted(
+        set(eia860_df["Balancing Authority Code"].dropna()) | set(ca_cols.columns)
+    )
+    # BAs with a demand series in the bulk data, for any year
+    eba_index = load_eba_index()
+    demand_bas = sorted(set(
+        eba_index.loc[
+            eba_index["geoset_id"] == EBA_GEOSETS["demand"], "series_id"
+        ].str.split(".").str[1].str.split("-").str[0]
+    ))
+    vectors = pd.DataFrame(
+        {"net_gen": net_gen, "inflow": inflow, "consumption": consumption}
+    )
+    return {
+        "consumption": df_final_trade_out,
+        "trade": df_trade,
+        "vectors": vectors,
+        "demand_bas": demand_bas,
+        "eia860_bas": eia860_bas,
+    }
+
+
+def _trading_settings_key():
+    """Hash the model settings and inputs of the trading model solution."""
+    return settings_key(
+        input_files=[
+            join(data_dir, f"CA_Imports_{table}.csv")
+            for table in ["Gen", "Rows", "Cols"]
+        ],
+        extra=[eia860.EIA860_TABLE_VERSION, eia923.EIA923_TABLE_VERSION],
+    )
+
 
-    B = np.matmul(T_split, x_hat_inv)
+@lru_cache(maxsize=4)
+def load_trading_solution(year):
+    """
+    Return the solution of the annual BA trading model for a year.
 
-    I = np.identity(len(df_net_gen_sum))
+    The solution is calculated from the EIA bulk data, EIA-923 and EIA-860
+    once per year, download of the bulk data and model settings, and saved in
+    data/trading_model, named with the year, TRADING_SOLUTION_VERSION, the
+    bulk data vintage (bulk_eia_data.eba_vintage) and a hash of the
+    generation filter settings, the EIA-860 and EIA-923 table versions and
+    the Canadian import files (utils.settings_key). The BA, FERC and US
+    tables of ba_io_trading_model are built from it.
 
-    diff_I_B = I - B
+    Parameters
+    ----------
+    year : int
+        Year of data
 
-    G = np.linalg.inv(diff_I_B)
+    Returns
+    -------
+    dict
+        "consumption": BA x BA dataframe of the consumption matrix H; column
+        j is the generation in each BA (rows) consumed in BA j,
+        "trade": BA x BA dataframe of the reconciled trade matrix T with the
+        Canadian imports, before the interconnections are split (see
+        INTERCONNECT_BREAKS), exporting BAs in rows,
+        "vectors": dataframe indexed by BA with the annual net generation,
+        total inflow (x) and consumption (c) used in the solve,
+        "demand_bas": list of the BAs with a demand series in the bulk
+        data,
+        "eia860_bas": list of the BAs with plants in EIA-860, and the
+        Canadian BAs.
+        The same objects are returned on every call, so they must not be
+        modified.
+    """
+    artifact_dir = join(data_dir, "trading_model")
+    artifact_path = join(
+        artifact_dir,
+        f"trading_solution_{year}_v{TRADING_SOLUTION_VERSION}_"
+        f"{eba_vintage()}_{_trading_settings_key()}.pkl",
+    )
+    if os.path.exists(artifact_path):
+        logging.info(f"Loading {year} trading model solution from {artifact_path}")
+        return pd.read_pickle(artifact_path)
+    solution = _build_trading_solution(year)
+    os.makedirs(artifact_dir, exist_ok=True)
+    pd.to_pickle(solution, artifact_path)
+    return solution
 
-    c_hat_x_hat_inv = np.matmul(c_hat, x_hat_inv)
 
-    G_c = np.matmul(G, c_hat)
-    H = np.matmul(G,c_hat, x_hat_inv)
+def ba_io_trading_model(year=None, subregion=None, regions_to_keep=None):
+    if year is None:
+        year = model_specs.NETL_IO_trading_year
+    if subregion is None:
+        subregion = model_specs.regional_aggregation
+    if subregion not in ['BA', 'FERC','US']:
+        raise ValueError(
+            f'subregion or regional_aggregation must have a value of "BA" or "FERC" '
+            f'when calculating trading with input-output, not {subregion}'
+        )
+
+    # Read in BAA file which contains the names and abbreviations
+    df_BA = pd.read_excel(data_dir + '/BA_Codes_930.xlsx', sheet_name = 'US', header = 4)
+    df_BA.rename(columns={'etag ID': 'BA_Acronym', 'Entity Name': 'BA_Name','NCR_ID#': 'NRC_ID', 'Region': 'Region'}, inplace=True)
+    BA = pd.np.array(df_BA['BA_Acronym'])
+    US_BA_acronyms = df_BA['BA_Acronym'].tolist()
 
-    df_G = pd.DataFrame(G)
-    df_B = pd.DataFrame(B)
-    df_H = pd.DataFrame(H)
+    # Read in BAA file which contains the names and abbreviations
+    # Original df_BAA does not include the Canadian balancing authorities
+    # Import them here, then concatenate to make a single df_BAA_NA (North America)
 
-    # Convert H to pandas dataframe, populate index and columns
+    df_BA_CA = pd.read_excel(data_dir + '/BA_Codes_930.xlsx', sheet_name = 'Canada', header = 4)
+    df_BA_CA.rename(columns={'etag ID': 'BA_Acronym', 'Entity Name': 'BA_Name','NCR_ID#': 'NRC_ID', 'Region': 'Region'}, inplace=True)
+    df_BA_NA = pd.concat([df_BA, df_BA_CA])
+    ferc_list = df_BA_NA['FERC_Region_Abbr'].unique().tolist()
 
-    df_final_trade_out = df_H
-    df_final_trade_out.columns = df_net_gen_sum.index
-    df_final_trade_out.index = df_net_gen_sum.index
+    solution = load_trading_solution(year)
+    df_final_trade_out = solution["consumption"]
+    eia860_bas = solution["eia860_bas"]
 
     # Develop trading input for the eLCI code. Need to melt the dataframe to end up with a three column
     # dataframe:Repeat for both possible aggregation levels - BA and FERC market region
@@ -442,15 +404,8 @@ def ba_io_trading_model(year=None, subregion=None, regions_to_keep=None):
 
     df_final_trade_out_filt = df_final_trade_out.copy()
     col_list = df_final_trade_out.columns.tolist()
-    #Adding in a filter for balancing authorities that are not associated
-    #with any specific plants in EIA860 - there won't be any data for them in
-    #the emissions dataframes. We'll set their quantities to 0 so that the
-    #consumption mixes are made up of the rest of the incoming balancing
-    #authority areas.
-    eia860_bas=sorted(
-        list(eia860_df["Balancing Authority Code"].dropna().unique())
-        +list(df_CA_Imports_Cols.columns)
-        )
+    #Filter for balancing authorities that are not associated with any
+    #specific plants in EIA860 (see _build_trading_solution)
     keep_rows = [x for x in df_final_trade_out_filt.index if x in eia860_bas]
     keep_cols = [x for x in df_final_trade_out_filt.columns if x in eia860_bas]
     df_final_trade_out_filt=df_final_trade_out_filt.loc[keep_rows,keep_cols]
@@ -497,19 +452,24 @@ def ba_io_trading_model(year=None, subregion=None, regions_to_keep=None):
     # consumption mix to 100% from that BA. For those without demand,
     # fraction will be set to near 0 just to make sure systems can be built
     # in openLCA
-    BAA_zero_trade = [x for x in list(BAA_final_trade["import BAA"].unique()) if BAA_final_trade.loc[BAA_final_trade["import BAA"]==x,"fraction"].sum()==0]
-    BAAs_from_zero_trade_with_demand = []
-    for d_row in DEMAND_ROWS:
-        if d_row["series_id"].split('.')[1].split('-')[0] in BAA_zero_trade:
-            BAAs_from_zero_trade_with_demand.append(d_row["series_id"].split('.')[1].split('-')[0])
-    BAAs_from_zero_trade_with_demand = list(set(BAAs_from_zero_trade_with_demand))
-    del(DEMAND_ROWS)
-    for baa in BAAs_from_zero_trade_with_demand:
-        BAA_final_trade.at[(BAA_final_trade["import BAA"]==baa)&(BAA_final_trade["export BAA"]==baa),"fraction"]=1
-    for baa in list(set(BAA_zero_trade)-set(BAAs_from_zero_trade_with_demand)):
-        BAA_final_trade.at[(BAA_final_trade["import BAA"]==baa)&(BAA_final_trade["export BAA"]==baa),"fraction"]=1E-15
-        #Was later decided to not create consumption mixes for BAs that don't have imports.
-        BAA_final_trade.drop(BAA_final_trade[BAA_final_trade["import BAA"]==baa].index,inplace=True)
+    import_total = BAA_final_trade.groupby("import BAA")["fraction"].sum()
+    BAA_zero_trade = set(import_total.index[import_total == 0])
+    BAAs_from_zero_trade_with_demand = (
+        BAA_zero_trade & set(solution["demand_bas"])
+    )
+    self_trade = BAA_final_trade["import BAA"] == BAA_final_trade["export BAA"]
+    BAA_final_trade.loc[
+        self_trade
+        & BAA_final_trade["import BAA"].isin(BAAs_from_zero_trade_with_demand),
+        "fraction",
+    ] = 1
+    #Was later decided to not create consumption mixes for BAs that don't have imports.
+    BAA_final_trade = BAA_final_trade.loc[
+        ~BAA_final_trade["import BAA"].isin(
+            BAA_zero_trade - BAAs_from_zero_trade_with_demand
+        ),
+        :,
+    ]
     BAA_final_trade.to_csv(output_dir + '/BAA_final_trade_{}.csv'.format(year))
     BAA_final_trade["export_name"]=BAA_final_trade["export BAA"].map(df_BA_NA[["BA_Acronym","BA_Name"]].set_index("BA_Acronym")["BA_Name"])
     BAA_final_trade["import_name"]=BAA_final_trade["import BAA"].map(df_BA_NA[["BA_Acronym","BA_Name"]].set_index("BA_Acronym")["BA_Name"])
@@ -544,13 +504,328 @@ def ba_io_trading_model(year=None, subregion=None, regions_to_keep=None):
     return {'BA':BAA_final_trade,'FERC':ferc_final_trade,'US':us_final_trade}
 
 
+def _solve_consumption_matrices(T, x, c):
+    """
+    Solve the trading model for a batch of hours at once.
+
+    The systems I - B_h of all hours are stacked into one block-diagonal
+    sparse matrix, which is factorized and solved in a single call.
+
+    Parameters
+    ----------
+    T : numpy.array
+        BA x BA x hour trade matrices, exporting BAs in rows
+    x : numpy.array
+        BA x hour total inflows, non-zero
+    c : numpy.array
+        BA x hour consumption
+
+    Returns
+    -------
+    numpy.array
+        BA x BA x hour consumption matrices, as _solve_consumption_matrix
+    """
+    n, _, n_hours = T.shape
+    hour, row, col = np.nonzero(T.transpose(2, 0, 1))
+    diag = np.arange(n * n_hours)
+    A = csc_matrix(
+        (
+            np.concatenate([
+                np.ones(n * n_hours),
+                -T[row, col, hour] / x[col, hour],
+            ]),
+            (
+                np.concatenate([diag, hour * n + row]),
+                np.concatenate([diag, hour * n + col]),
+            ),
+        ),
+        shape=(n * n_hours, n * n_hours),
+    )
+    # Each hour's block of the right hand side is c_hat for that hour.
+    rhs = np.zeros((n * n_hours, n))
+    rhs[diag, np.tile(np.arange(n), n_hours)] = c.T.ravel()
+    H = splu(A).solve(rhs)
+    return H.reshape(n_hours, n, n).transpose(1, 2, 0)
+
+
+def ba_hourly_consumption_mix(year=None, hours_per_solve=744):
+    """
+    Calculate the consumption mix of each balancing authority for every hour
+    of a year.
+
+    Hourly net generation and BA-to-BA interchange come from the EIA bulk
+    data (see bulk_eia_data.load_eba_cube). The interchange of each hour is
+    reconciled between the BAs of each pair as in ba_io_trading_model.
+    Canadian imports and generation are the
+    annual values spread evenly over the hours, and the EIA-923 correction of
+    annual net generation in ba_io_trading_model is not applied. The trading
+    model is solved for hours_per_solve hours at a time as one stacked sparse
+    system.
+
+    Parameters
+    ----------
+    year : int, optional
+        Year of data, by default model_specs.NETL_IO_trading_year
+    hours_per_solve : int, optional
+        Number of hours stacked into each sparse solve, by default 744
+
+    Returns
+    -------
+    dict
+        "bas": BA codes of the trading model,
+        "datetime": DatetimeIndex (UTC) of the hours,
+        "pairs": dataframe with the "export BAA" and "import BAA" of every
+        pair with a non-zero share in any hour,
+        "shares": pair x hour float32 array; shares[p, h] is the fraction of
+        the electricity consumed in the import BAA of pair p in hour h that
+        was generated in its export BAA. Shares below 0.00001 are set to 0.
+        Shares of BAs with no consumption in an hour are NaN.
+    """
+    if year is None:
+        year = model_specs.NETL_IO_trading_year
+    df_BA = pd.read_excel(data_dir + '/BA_Codes_930.xlsx', sheet_name = 'US', header = 4)
+    us_bas = df_BA['etag ID'].dropna().tolist()
+    ca_gen, ca_rows, ca_cols = _read_canadian_imports(year)
+    bas = _trading_ba_index(us_bas, ca_gen, ca_rows, ca_cols).tolist()
+    ba_idx = pd.Series(range(len(bas)), index=bas)
+    n = len(bas)
+
+    eba_cube = load_eba_cube(year)
+    n_hours = len(eba_cube["datetime"])
+    cube_idx = pd.Series(range(len(eba_cube["bas"])), index=eba_cube["bas"])
+    in_cube = [ba for ba in bas if ba in cube_idx.index and ba in us_bas]
+    pos, cube_pos = ba_idx[in_cube].values, cube_idx[in_cube].values
+    # Reported pairs between the BAs of the model (the bulk data arrays leave
+    # out the aggregate EIA regions)
+    cube_bas = np.array(eba_cube["bas"])
+    pair_from = cube_bas[eba_cube["pairs"][:, 0]]
+    pair_to = cube_bas[eba_cube["pairs"][:, 1]]
+    use_pair = np.isin(pair_from, in_cube) & np.isin(pair_to, in_cube)
+    pair_rows = np.nonzero(use_pair)[0]
+    from_pos = ba_idx[pair_from[use_pair]].values
+    to_pos = ba_idx[pair_to[use_pair]].values
+
+    # Annual Canadian trade and generation, spread evenly over the hours
+    ca_trade = np.zeros((n, n))
+    ca_rows = ca_rows.fillna(0)
+    ca_trade[np.ix_(ba_idx[ca_rows.index].values,
+                    ba_idx[ca_rows.columns].values)] += ca_rows.values
+    ca_cols = ca_cols.fillna(0)
+    ca_trade[np.ix_(ba_idx[ca_cols.index].values,
+                    ba_idx[ca_cols.columns].values)] += ca_cols.values
+    ca_trade /= n_hours
+    ca_net_gen = np.zeros(n)
+    ca_net_gen[ba_idx[ca_gen.index].values] = ca_gen.fillna(0).values / n_hours
+
+    interconnect = np.ones((n, n))
+    for exporter, importers in INTERCONNECT_BREAKS.items():
+        interconnect[ba_idx[exporter], ba_idx[importers].values] = 0
+
+    # Shares are kept per batch only for the pairs that are non-zero in it
+    batch_shares = []
+    no_consumption = np.zeros((n, n_hours), dtype=bool)
+    for start in range(0, n_hours, hours_per_solve):
+        hours = slice(start, min(start + hours_per_solve, n_hours))
+        logging.info(f"Solving hours {hours.start} to {hours.stop}")
+        net_gen = np.repeat(ca_net_gen[:, None], hours.stop - hours.start, 1)
+        net_gen[pos, :] = np.nan_to_num(eba_cube["net_gen"][cube_pos, hours])
+        exchange = np.full((n, n, hours.stop - hours.start), np.nan)
+        exchange[from_pos, to_pos, :] = eba_cube["interchange"][pair_rows, hours]
+        T = _reconcile_trade(exchange) + ca_trade[:, :, None]
+        T *= interconnect[:, :, None]
+        x = net_gen + T.sum(axis=0)
+        x[x == 0] = 1
+        c = x - T.sum(axis=1)
+        H = np.abs(_solve_consumption_matrices(T, x, c))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            H[H / H.sum(axis=0, keepdims=True) < 0.00001] = 0
+            share = H / H.sum(axis=0, keepdims=True)
+        no_consumption[:, hours] = np.isnan(share).all(axis=0)
+        export_idx, import_idx = np.nonzero(
+            np.nan_to_num(share).max(axis=2) > 0
+        )
+        batch_shares.append((
+            hours,
+            export_idx * n + import_idx,
+            share[export_idx, import_idx, :].astype(np.float32),
+        ))
+
+    pair_codes = np.unique(
+        np.concatenate([codes for _, codes, _ in batch_shares])
+    )
+    shares = np.zeros((len(pair_codes), n_hours), dtype=np.float32)
+    for hours, codes, values in batch_shares:
+        shares[np.searchsorted(pair_codes, codes), hours] = values
+    export_idx, import_idx = np.divmod(pair_codes, n)
+    shares[no_consumption[import_idx]] = np.nan
+    return {
+        "bas": bas,
+        "datetime": eba_cube["datetime"],
+        "pairs": pd.DataFrame({
+            "export BAA": np.array(bas)[export_idx],
+            "import BAA": np.array(bas)[import_idx],
+        }),
+        "shares": shares,
+    }
+
+
+def trading_sensitivity(year=None, n_samples=1000, bounds=None,
+                        batch_size=250, seed=None):
+    """
+    Estimate the uncertainty of the BA consumption mixes by Monte Carlo
+    sampling of the trading model inputs.
+
+    Starting from the stored annual solution (load_trading_solution), every
+    sample scales each reconciled BA-to-BA trade (before the
+    interconnections are split), each BA's net generation
+    and each Canadian import (trade and generation of the Canadian BAs) by
+    its own factor drawn uniformly from [1 - bound, 1 + bound]. The samples
+    are solved batch_size at a time as one stacked sparse system, and the
+    consumption mix fractions are calculated as in ba_io_trading_model.
+
+    Parameters
+    ----------
+    year : int, optional
+        Year of data, by default model_specs.NETL_IO_trading_year
+    n_samples : int, optional
+        Number of samples, by default 1000
+    bounds : dict, optional
+        Relative bounds for "interchange", "net_gen" and "canadian_imports"
+        that replace the defaults in SENSITIVITY_BOUNDS
+    batch_size : int, optional
+        Number of samples stacked into each sparse solve, by default 250
+    seed : int, optional
+        Seed for the random number generator
+
+    Returns
+    -------
+    dict
+        "bas": BA codes indexing the first two axes of "samples",
+        "samples": BA x BA x sample array of consumption mix fractions;
+        samples[i, j, s] is the fraction of BA j's consumption generated in
+        BA i,
+        "summary": dataframe with one row per export BAA and import BAA
+        pair that is non-zero in any sample, with the fraction of the
+        unperturbed solution and the mean, standard deviation and 5th, 50th
+        and 95th percentiles over the samples.
+    """
+    if year is None:
+        year = model_specs.NETL_IO_trading_year
+    limits = dict(SENSITIVITY_BOUNDS)
+    limits.update(bounds or {})
+    solution = load_trading_solution(year)
+    bas = solution["trade"].index.tolist()
+    n = len(bas)
+    ba_idx = pd.Series(range(n), index=bas)
+    T_base = solution["trade"].values
+    gen_base = solution["vectors"]["net_gen"].values
+    ca_bas = pd.read_csv(data_dir + '/CA_Imports_Gen.csv', index_col = 0).index
+    is_ca = np.isin(bas, ca_bas)
+    trade_bound = np.where(
+        is_ca[:, None] | is_ca[None, :],
+        limits["canadian_imports"],
+        limits["interchange"],
+    )
+    gen_bound = np.where(is_ca, limits["canadian_imports"], limits["net_gen"])
+    # Same filter as ba_io_trading_model: only BAs with plants in EIA-860
+    keep = np.isin(bas, solution["eia860_bas"])
+
+    interconnect = np.ones((n, n))
+    for exporter, importers in INTERCONNECT_BREAKS.items():
+        interconnect[ba_idx[exporter], ba_idx[importers].values] = 0
+
+    def _fractions(H):
+        H = np.abs(H[keep][:, keep])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            H[H / H.sum(axis=0, keepdims=True) < 0.00001] = 0
+            return np.nan_to_num(H / H.sum(axis=0, keepdims=True))
+
+    def _solve(T, net_gen):
+        # Same steps as the annual solve: x and c come from the trade before
+        # the interconnections are split
+        x = net_gen + T.sum(axis=0)
+        c = x - T.sum(axis=1)
+        x[x == 0] = 1
+        return _fractions(
+            _solve_consumption_matrices(T * interconnect[:, :, None], x, c)
+        )
+
+    # The unperturbed inputs must reproduce the stored solution
+    base = _fractions(solution["consumption"].values)
+    unperturbed = _solve(T_base[:, :, None], gen_base[:, None])
+    if not np.allclose(unperturbed[:, :, 0], base, rtol=0, atol=1e-4):
+        raise ValueError(
+            f"The unperturbed trading model inputs of {year} do not give "
+            "the stored consumption mixes"
+        )
+
+    rng = np.random.default_rng(seed)
+    samples = np.zeros((keep.sum(), keep.sum(), n_samples))
+    for start in range(0, n_samples, batch_size):
+        batch = slice(start, min(start + batch_size, n_samples))
+        size = batch.stop - batch.start
+        logging.info(f"Solving samples {batch.start} to {batch.stop}")
+        T = T_base[:, :, None] * rng.uniform(
+            1 - trade_bound[:, :, None], 1 + trade_bound[:, :, None],
+            (n, n, size),
+        )
+        net_gen = gen_base[:, None] * rng.uniform(
+            1 - gen_bound[:, None], 1 + gen_bound[:, None], (n, size)
+        )
+        samples[:, :, batch] = _solve(T, net_gen)
+
+    kept_bas = [ba for ba, k in zip(bas, keep) if k]
+    export_idx, import_idx = np.nonzero(samples.max(axis=2) > 0)
+    pair_samples = samples[export_idx, import_idx, :]
+    percentiles = np.percentile(pair_samples, [5, 50, 95], axis=1)
+    summary = pd.DataFrame({
+        "export BAA": np.array(kept_bas)[export_idx],
+        "import BAA": np.array(kept_bas)[import_idx],
+        "fraction": base[export_idx, import_idx],
+        "mean": pair_samples.mean(axis=1),
+        "std": pair_samples.std(axis=1),
+        "p05": percentiles[0],
+        "p50": percentiles[1],
+        "p95": percentiles[2],
+    })
+    return {"bas": kept_bas, "samples": samples, "summary": summary}
+
+
 if __name__=='__main__':
     year=2016
     subregion = 'BA'
     mix_df_dict = ba_io_trading_model(year, subregion)
 
 
-def olca_schema_consumption_mix(database, gen_dict, subregion="BA"):
+def olca_schema_consumption_mix(
+    database, gen_dict, subregion="BA", year=None, providers=None
+):
+    """
+    Create the openLCA consumption mix processes for each region.
+
+    Parameters
+    ----------
+    database : dataframe or None
+        The subregion table returned by ba_io_trading_model. If None, it is
+        built from the stored trading model solution for year.
+    gen_dict : dict
+        Generation mix processes, used as the providers of the exchanges
+    subregion : str, optional
+        "BA", "FERC" or "US", by default "BA"
+    year : int, optional
+        Year of the trading model solution when database is None, by default
+        model_specs.NETL_IO_trading_year
+    providers : dict, optional
+        Index of the processes that have been written (see
+        utils.index_processes), by default built from gen_dict
+
+    Returns
+    -------
+    dict
+        Consumption mix processes keyed by "<region> - <subregion>"
+    """
+    if database is None:
+        database = ba_io_trading_model(year, subregion)[subregion]
     import numpy as np
     import pandas as pd
 
@@ -587,7 +862,9 @@ def olca_schema_consumption_mix(database, gen_dict, subregion="BA"):
     elif subregion == "US":
         export_column = "export_name"
         region=["US"]
-    
+    if providers is None:
+        providers = index_processes(gen_dict)
+
     for reg in region:
         if subregion =="US":
             database_reg = database
@@ -613,14 +890,9 @@ def olca_schema_consumption_mix(database, gen_dict, subregion="BA"):
                 )
                 ra["quantitativeReference"] = False
                 ra['amount'] = database_reg.loc[database_reg[export_column] == export_region,'fraction'].values[0]
-                matching_dict = None
-                for gen in gen_dict:
-                    if (
-                        gen_dict[gen]["name"]
-                        == 'Electricity; at grid; generation mix - ' + export_region
-                    ):
-                        matching_dict = gen_dict[export_region]
-                        break
+                matching_dict = providers.get(
+                    (export_region, "Electricity; at grid; generation mix")
+                )
                 if matching_dict is None:
                     logging.warning(
                         f"Trouble matching dictionary for {export_region} - {reg}"
@@ -5,25 +5,184 @@ import pandas as pd
 import numpy as np
 import os
 import urllib.request
+from urllib.error import HTTPError
 from electricitylci.globals import output_dir, data_dir
+from electricitylci.data_bundle import require_network
+from electricitylci.utils import index_processes, settings_key
 import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from xlrd import XLRDError
 from functools import lru_cache
 
-# %%
-# Set working directory, files downloaded from EIA will be saved to this location
-# os.chdir = 'N:/eLCI/Transmission and Distribution'
+# State electricity profiles are published at
+# <base url>/<state name>/xls/<state>.xlsx for the most recent year and under
+# <base url>/archive/<year>/ for earlier years.
+EIA_STATE_PROFILE_URL = "https://www.eia.gov/electricity/state/"
+
+STATE_ABBREV = {
+    "alabama": "al",
+    "alaska": "ak",
+    "arizona": "az",
+    "arkansas": "ar",
+    "california": "ca",
+    "colorado": "co",
+    "connecticut": "ct",
+    "delaware": "de",
+    "florida": "fl",
+    "georgia": "ga",
+    "hawaii": "hi",
+    "idaho": "id",
+    "illinois": "il",
+    "indiana": "in",
+    "iowa": "ia",
+    "kansas": "ks",
+    "kentucky": "ky",
+    "louisiana": "la",
+    "maine": "me",
+    "maryland": "md",
+    "massachusetts": "ma",
+    "michigan": "mi",
+    "minnesota": "mn",
+    "mississippi": "ms",
+    "missouri": "mo",
+    "montana": "mt",
+    "nebraska": "ne",
+    "nevada": "nv",
+    "newhampshire": "nh",
+    "newjersey": "nj",
+    "newmexico": "nm",
+    "newyork": "ny",
+    "northcarolina": "nc",
+    "northdakota": "nd",
+    "ohio": "oh",
+    "oklahoma": "ok",
+    "oregon": "or",
+    "pennsylvania": "pa",
+    "rhodeisland": "ri",
+    "southcarolina": "sc",
+    "southdakota": "sd",
+    "tennessee": "tn",
+    "texas": "tx",
+    "utah": "ut",
+    "vermont": "vt",
+    "virginia": "va",
+    "washington": "wa",
+    "westvirginia": "wv",
+    "wisconsin": "wi",
+    "wyoming": "wy",
+}
+
+# Columns that regional grid losses are aggregated by (see
+# aggregation_selector.subregion_col); None is the US total.
+GRID_LOSS_LEVELS = [
+    "Subregion",
+    "NERC",
+    "Balancing Authority Name",
+    "FERC_Region",
+    "EIA_Region",
+    None,
+]
+
+GRID_LOSS_VERSION = 1
 
 # %%
 # Define function to extract EIA state-wide electricity profiles and calculate
 # state-wide transmission and distribution losses for the user-specified year
 
 
+
+def _state_profile_losses(filename, state):
+    """
+    Calculate the gross grid loss for each year in a state electricity
+    profile workbook.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the state workbook
+    state : str
+        Two-letter state abbreviation, used as the column name
+
+    Returns
+    -------
+    dataframe
+        One column of loss fractions, indexed by year
+    """
+    df = pd.read_excel(
+        filename,
+        sheet_name="10. Source-Disposition",
+        header=3,
+        index_col=0,
+    )
+    df.columns = df.columns.astype(str).str.replace("Year\n", "")
+    df = df.loc["Estimated losses"] / (
+        df.loc["Total disposition"] - df.loc["Direct use"]
+    )
+    return df.to_frame(name=state)
+
+
+def _download_state_losses(year, state_name, folder, base_url):
+    """Download (if needed) and parse the profile workbook for one state."""
+    state = STATE_ABBREV[state_name]
+    filename = os.path.join(folder, f"{state}.xlsx")
+    if os.path.exists(filename):
+        logging.info(f"Using previously downloaded data for {state}")
+        return _state_profile_losses(filename, state)
+    require_network(f"the {state} state electricity profile")
+    print(f"Downloading data for {state}")
+    try:
+        urllib.request.urlretrieve(
+            f"{base_url}archive/{year}/{state_name}/xls/{state}.xlsx",
+            filename,
+        )
+        return _state_profile_losses(filename, state)
+    except (HTTPError, XLRDError, ValueError, zipfile.BadZipFile):
+        # The most current year has a different url - no "archive/year"
+        urllib.request.urlretrieve(
+            f"{base_url}{state_name}/xls/{state}.xlsx", filename
+        )
+        return _state_profile_losses(filename, state)
+
+
+@lru_cache(maxsize=10)
+def _state_loss_table(year, base_url=EIA_STATE_PROFILE_URL, max_workers=8):
+    """
+    Return the gross grid loss of every state for every year in the state
+    profiles published for year (year x state, see
+    eia_trans_dist_download_extract).
+    """
+    folder = os.path.join(data_dir, f"t_and_d_{year}")
+    os.makedirs(folder, exist_ok=True)
+    table_path = os.path.join(folder, f"t_and_d_losses_{year}.csv")
+    if os.path.exists(table_path):
+        logging.info(f"Reading parsed T&D losses from {table_path}")
+        eia_trans_dist_loss = pd.read_csv(
+            table_path, index_col=0, float_precision="round_trip"
+        )
+        eia_trans_dist_loss.index = eia_trans_dist_loss.index.astype(str)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            state_df_list = list(
+                executor.map(
+                    lambda key: _download_state_losses(
+                        year, key, folder, base_url
+                    ),
+                    STATE_ABBREV,
+                )
+            )
+        eia_trans_dist_loss = pd.concat(state_df_list, axis=1, sort=True)
+        eia_trans_dist_loss.to_csv(table_path)
+    return eia_trans_dist_loss
+
+
 @lru_cache(maxsize=10)
-def eia_trans_dist_download_extract(year):
+def eia_trans_dist_download_extract(
+    year, base_url=EIA_STATE_PROFILE_URL, max_workers=8
+):
 
     """[This function (1) downloads EIA state-level electricity profiles for all
-    50 states in the U.S. for a specified year to the working directory, and (2)
+    50 states in the U.S. for a specified year to data/t_and_d_<year>, and (2)
     calculates the transmission and distribution gross grid loss for each state
     based on statewide 'estimated losses', 'total disposition', and 'direct use'.
     The final output from this function is a [50x1] dimensional dataframe that
@@ -32,222 +191,210 @@ def eia_trans_dist_download_extract(year):
     grid loss is provided on the EIA website and can be accessed via
     URL: https://www.eia.gov/tools/faqs/faq.php?id=105&t=3]
 
+    The state workbooks are downloaded and parsed in parallel threads. The
+    parsed state x year table is saved to
+    data/t_and_d_<year>/t_and_d_losses_<year>.csv and read from there on
+    later runs.
+
     Arguments:
         year {[str]} -- [Analysis year]
+        base_url {[str]} -- [Location of the EIA state electricity profiles]
+        max_workers {[int]} -- [Number of states to download at once]
     """
-
-    eia_trans_dist_loss = pd.DataFrame()
-
-    state_abbrev = {
-        "alabama": "al",
-        "alaska": "ak",
-        "arizona": "az",
-        "arkansas": "ar",
-        "california": "ca",
-        "colorado": "co",
-        "connecticut": "ct",
-        "delaware": "de",
-        "florida": "fl",
-        "georgia": "ga",
-        "hawaii": "hi",
-        "idaho": "id",
-        "illinois": "il",
-        "indiana": "in",
-        "iowa": "ia",
-        "kansas": "ks",
-        "kentucky": "ky",
-        "louisiana": "la",
-        "maine": "me",
-        "maryland": "md",
-        "massachusetts": "ma",
-        "michigan": "mi",
-        "minnesota": "mn",
-        "mississippi": "ms",
-        "missouri": "mo",
-        "montana": "mt",
-        "nebraska": "ne",
-        "nevada": "nv",
-        "newhampshire": "nh",
-        "newjersey": "nj",
-        "newmexico": "nm",
-        "newyork": "ny",
-        "northcarolina": "nc",
-        "northdakota": "nd",
-        "ohio": "oh",
-        "oklahoma": "ok",
-        "oregon": "or",
-        "pennsylvania": "pa",
-        "rhodeisland": "ri",
-        "southcarolina": "sc",
-        "southdakota": "sd",
-        "tennessee": "tn",
-        "texas": "tx",
-        "utah": "ut",
-        "vermont": "vt",
-        "virginia": "va",
-        "washington": "wa",
-        "westvirginia": "wv",
-        "wisconsin": "wi",
-        "wyoming": "wy",
-    }
-    old_path = os.getcwd()
-    if os.path.exists(f"{data_dir}/t_and_d_{year}"):
-        os.chdir(f"{data_dir}/t_and_d_{year}")
-    else:
-        os.mkdir(f"{data_dir}/t_and_d_{year}")
-        os.chdir(f"{data_dir}/t_and_d_{year}")
-    state_df_list = list()
-    for key in state_abbrev:
-        filename = f"{state_abbrev[key]}.xlsx"
-        if not os.path.exists(filename):
-            url = (
-                "https://www.eia.gov/electricity/state/archive/"
-                + year
-                + "/"
-                + key
-                + "/xls/"
-                + filename
-            )
-            print(f"Downloading data for {state_abbrev[key]}")
-
-            try:
-                urllib.request.urlretrieve(url, filename)
-                df = pd.read_excel(
-                    filename,
-                    sheet_name="10. Source-Disposition",
-                    header=3,
-                    index_col=0,
-                )
-            except XLRDError:
-                # The most current year has a different url - no "archive/year"
-                url = (
-                    "https://www.eia.gov/electricity/state/"
-                    + key
-                    + "/xls/"
-                    + filename
-                )
-                urllib.request.urlretrieve(url, filename)
-                df = pd.read_excel(
-                    filename,
-                    sheet_name="10. Source-Disposition",
-                    header=3,
-                    index_col=0,
-                )
-        else:
-            logging.info(
-                f"Using previously downloaded data for {state_abbrev[key]}"
-            )
-            df = pd.read_excel(
-                filename,
-                sheet_name="10. Source-Disposition",
-                header=3,
-                index_col=0,
-            )
-
-        df.columns = df.columns.str.replace("Year\n", "")
-        df = df.loc["Estimated losses"] / (
-            df.loc["Total disposition"] - df.loc["Direct use"]
-        )
-        df = df.to_frame(name=state_abbrev[key])
-        state_df_list.append(df)
-    eia_trans_dist_loss = pd.concat(state_df_list, axis=1, sort=True)
+    eia_trans_dist_loss = _state_loss_table(year, base_url, max_workers)
     max_year = max(eia_trans_dist_loss.index.astype(int))
     if max_year < int(year):
         print(f'The most recent T&D loss data is from {max_year}')
         year = str(max_year)
 
+    eia_trans_dist_loss = eia_trans_dist_loss.copy()
     eia_trans_dist_loss.columns = eia_trans_dist_loss.columns.str.upper()
     eia_trans_dist_loss = eia_trans_dist_loss.transpose()
     eia_trans_dist_loss = eia_trans_dist_loss[[year]]
     eia_trans_dist_loss.columns = ["t_d_losses"]
-    os.chdir(old_path)
     return eia_trans_dist_loss
 
 
-def generate_regional_grid_loss(final_database, year, subregion="all"):
-    """This function generates transmission and distribution losses for the
-    provided generation data and given year, aggregated by subregion.
+def _grid_loss_key():
+    """Hash the model settings and inputs that change the plant generation."""
+    from electricitylci.model_config import model_specs
+    from electricitylci.eia860_facilities import EIA860_TABLE_VERSION
+    from electricitylci.eia923_generation import EIA923_TABLE_VERSION
+    return settings_key(
+        extra=[
+            model_specs.egrid_year,
+            EIA860_TABLE_VERSION,
+            EIA923_TABLE_VERSION,
+        ]
+    )
 
-    Arguments:
-        final_database: dataframe
-            The database containing plant-level emissions.
-        year: int
-            Analysis year for the transmission and distribution loss data.
-            Ideally this should match the year of your final_database.
-    Returns:
-        td_by_region: dataframe
-            A dataframe of transmission and distribution loss rates as a
-            fraction. This dataframe can be used to generate unit processes
-            for transmission and distribution to match the regionally-
-            aggregated emissions unit processes.
+
+def _grid_loss_path(year, source_year):
+    """Name the losses of a year after the state profiles they come from."""
+    return os.path.join(
+        data_dir,
+        f"t_and_d_{year}",
+        f"regional_grid_loss_{year}_from_{source_year}_"
+        f"v{GRID_LOSS_VERSION}_{_grid_loss_key()}.csv",
+    )
+
+
+def _calculate_grid_loss(years, source_year):
+    """
+    Aggregate state losses to every level in GRID_LOSS_LEVELS, using the
+    state profiles published for source_year.
     """
-    print("Generating factors for transmission and distribution losses")
     from electricitylci.eia923_generation import build_generation_data
     from electricitylci.combinator import ba_codes
     from electricitylci.egrid_facilities import egrid_facilities
-    td_calc_columns = [
-        "State",
-        "NERC",
-        "FuelCategory",
-        "PrimaryFuel",
-        "NERC",
-        "Balancing Authority Name",
-        "Electricity",
-        "Year",
-        "Subregion",
-        "FRS_ID",
-        "eGRID_ID",
-    ]
-#    plant_generation = final_database[td_calc_columns].drop_duplicates()
+
+    # Stacked state x year losses, from the most recent state profiles.
+    # Years after the most recent data use the most recent year.
+    state_losses = _state_loss_table(f"{source_year}")
+    available = state_losses.index.astype(int)
+    if min(years) < min(available):
+        raise ValueError(
+            f"The {source_year} EIA state electricity profiles have T&D loss "
+            f"data from {min(available)} on, not for {min(years)}"
+        )
+    data_years = [min(y, max(available)) for y in years]
+    if max(available) < max(years):
+        print(f'The most recent T&D loss data is from {max(available)}')
+    td_rates = state_losses.loc[[str(y) for y in data_years], :]
+    td_rates.index = pd.Index(years, name="Year")
+    td_rates.columns = td_rates.columns.str.upper()
+    td_rates = td_rates.rename_axis(columns="State").stack().rename(
+        "t_d_losses"
+    ).reset_index()
+
     egrid_facilities_w_fuel_region = egrid_facilities[
         [
         "FacilityID",
         "Subregion",
-        "PrimaryFuel",
-        "FuelCategory",
         "NERC",
-        "PercentGenerationfromDesignatedFuelCategory",
-        "Balancing Authority Name",
         "Balancing Authority Code",
         "State"
         ]
-    ]
+    ].copy()
     egrid_facilities_w_fuel_region["FacilityID"]=egrid_facilities_w_fuel_region["FacilityID"].astype(int)
-    plant_generation = build_generation_data(generation_years=[year])
+    plant_generation = build_generation_data(generation_years=list(years))
     plant_generation["FacilityID"]=plant_generation["FacilityID"].astype(int)
     plant_generation = plant_generation.merge(egrid_facilities_w_fuel_region,on=["FacilityID"],how="left")
     plant_generation["Balancing Authority Name"]=plant_generation["Balancing Authority Code"].map(ba_codes["BA_Name"])
     plant_generation["FERC_Region"]=plant_generation["Balancing Authority Code"].map(ba_codes["FERC_Region"])
     plant_generation["EIA_Region"]=plant_generation["Balancing Authority Code"].map(ba_codes["EIA_Region"])
-    td_rates = eia_trans_dist_download_extract(f"{year}")
-    td_by_plant = pd.merge(
-        left=plant_generation,
-        right=td_rates,
-        left_on="State",
-        right_index=True,
-        how="left",
+    td_by_plant = plant_generation.merge(
+        td_rates, on=["State", "Year"], how="inner"
     )
-    td_by_plant.dropna(subset=["t_d_losses"], inplace=True)
+    td_by_plant = td_by_plant.dropna(subset=["t_d_losses"])
     td_by_plant["t_d_losses"] = td_by_plant["t_d_losses"].astype(float)
+    td_by_plant["Region"] = "US"
+    td_by_plant["weighted_losses"] = (
+        td_by_plant["t_d_losses"] * td_by_plant["Electricity"]
+    )
+
+    # Generation-weighted average of the state losses in each region
+    level_dfs = []
+    for level in GRID_LOSS_LEVELS:
+        region_column = "Region" if level is None else level
+        level_df = td_by_plant.groupby(
+            ["Year", region_column], as_index=False
+        )[["weighted_losses", "Electricity"]].sum()
+        level_df["t_d_losses"] = (
+            level_df["weighted_losses"] / level_df["Electricity"]
+        )
+        level_df = level_df.rename(columns={region_column: "Region"})
+        level_df.insert(1, "Aggregation", "US" if level is None else level)
+        level_dfs.append(level_df[["Year", "Aggregation", "Region", "t_d_losses"]])
+    return pd.concat(level_dfs, ignore_index=True)
+
+
+def generate_regional_grid_loss_by_year(years):
+    """This function generates transmission and distribution losses for
+    several years at once, aggregated to every subregion level.
+
+    Plant generation for all of the years is built and weighted against a
+    single stacked state x year table of losses, taken from the state
+    profiles published for the latest of the years. The results of each
+    year are saved to data/t_and_d_<year>, named with that profile year,
+    GRID_LOSS_VERSION and a hash of the plant filter settings, and read
+    from there on later runs.
+
+    Arguments:
+        years: list
+            Analysis years for the transmission and distribution loss data.
+    Returns:
+        td_by_region: dataframe
+            Columns "Year", "Aggregation" (the subregion column, e.g.
+            "Subregion" or "Balancing Authority Name", or "US"), "Region"
+            and "t_d_losses" (loss rate as a fraction).
+    """
+    years = sorted({int(y) for y in years})
+    source_year = max(years)
+    year_dfs = {}
+    for year in years:
+        if os.path.exists(_grid_loss_path(year, source_year)):
+            logging.info(f"Reading {year} regional grid losses")
+            year_dfs[year] = pd.read_csv(
+                _grid_loss_path(year, source_year),
+                dtype={"Aggregation": str, "Region": str},
+                float_precision="round_trip",
+            )
+    missing = [y for y in years if y not in year_dfs]
+    if missing:
+        logging.info(
+            "Calculating regional grid losses for "
+            f"{', '.join(str(y) for y in missing)}"
+        )
+        td_by_region = _calculate_grid_loss(missing, source_year)
+        for year, year_df in td_by_region.groupby("Year"):
+            year_path = _grid_loss_path(year, source_year)
+            os.makedirs(os.path.dirname(year_path), exist_ok=True)
+            year_df.to_csv(year_path, index=False)
+            year_dfs[year] = year_df
+    return pd.concat(
+        [year_dfs[y] for y in years], ignore_index=True
+    )
+
 
+def generate_regional_grid_loss(final_database, year, subregion="all"):
+    """This function generates transmission and distribution losses for the
+    provided generation data and given year, aggregated by subregion.
+
+    Arguments:
+        final_database: dataframe
+            The database containing plant-level emissions.
+        year: int
+            Analysis year for the transmission and distribution loss data.
+            Ideally this should match the year of your final_database.
+    Returns:
+        td_by_region: dataframe
+            A dataframe of transmission and distribution loss rates as a
+            fraction. This dataframe can be used to generate unit processes
+            for transmission and distribution to match the regionally-
+            aggregated emissions unit processes.
+    """
+    print("Generating factors for transmission and distribution losses")
     from electricitylci.aggregation_selector import subregion_col
+    td_by_year = generate_regional_grid_loss_by_year([year])
     aggregation_column=subregion_col(subregion)
-    wm = lambda x: np.average(
-        x, weights=td_by_plant.loc[x.index, "Electricity"]
-    )
     if aggregation_column is not None:
-        td_by_region = td_by_plant.groupby(
-            aggregation_column, as_index=False
-        ).agg({"t_d_losses": wm})
+        td_by_region = td_by_year.loc[
+            td_by_year["Aggregation"] == aggregation_column[0],
+            ["Region", "t_d_losses"],
+        ].rename(columns={"Region": aggregation_column[0]})
+        td_by_region = td_by_region.reset_index(drop=True)
     else:
-        td_by_region = pd.DataFrame(
-            td_by_plant.agg({"t_d_losses": wm}), columns=["t_d_losses"]
-        )
-        td_by_region["Region"] = "US"
+        td_by_region = td_by_year.loc[
+            td_by_year["Aggregation"] == "US", ["t_d_losses", "Region"]
+        ]
+        td_by_region.index = ["t_d_losses"]
     return td_by_region
 
 
-def olca_schema_distribution_mix(td_by_region, cons_mix_dict, subregion="BA"):
+def olca_schema_distribution_mix(
+    td_by_region, cons_mix_dict, subregion="BA", providers=None
+):
     from electricitylci.process_dictionary_writer import (
         exchange_table_creation_ref,
         exchange,
@@ -273,6 +420,8 @@ def olca_schema_distribution_mix(td_by_region, cons_mix_dict, subregion="BA"):
     else:
         aggregation_column = None
         region = ["US"]
+    if providers is None:
+        providers = index_processes(cons_mix_dict)
     for reg in region:
         if aggregation_column is None:
             database_reg = td_by_region
@@ -293,14 +442,9 @@ def olca_schema_distribution_mix(td_by_region, cons_mix_dict, subregion="BA"):
         exchanges_list[1]["input"] = True
         exchanges_list[1]["quantitativeReference"] = False
         exchanges_list[1]["amount"] = 1 + database_reg["t_d_losses"].values[0]
-        matching_dict = None
-        for cons_mix in cons_mix_dict:
-            if (
-                cons_mix_dict[cons_mix]["name"]
-                == f"Electricity; at grid; consumption mix - {reg} - {subregion}"
-            ):
-                matching_dict = cons_mix_dict[cons_mix]
-                break
+        matching_dict = providers.get(
+            (f"{reg} - {subregion}", "Electricity; at grid; consumption mix")
+        )
         if matching_dict is None:
             logging.warning(
                 f"Trouble matching dictionary for {reg}. "
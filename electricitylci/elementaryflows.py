@@ -1,45 +1,192 @@
+import os
+import logging
+from functools import lru_cache
+from os.path import join
+
+import numpy as np
 import pandas as pd
 import fedelemflowlist
 
-# flowlist = fedelemflowlist.get_flowlist()
-mapping_to_fedelemflows = fedelemflowlist.get_flowmapping()
-mapping_to_fedelemflows = mapping_to_fedelemflows[
-    [
-        "SourceListName",
-        "SourceFlowName",
-        "SourceFlowContext",
-        "SourceUnit",
-        "TargetFlowName",
-        "TargetFlowUUID",
-        "TargetFlowContext",
-        "TargetUnit",
-    ]
+from electricitylci.globals import data_dir
+
+module_logger = logging.getLogger("elementaryflows.py")
+
+FLOW_MAPPING_INDEX_VERSION = 2
+FLOW_MAPPING_TARGET_COLS = [
+    "SourceListName",
+    "TargetFlowName",
+    "TargetFlowUUID",
+    "TargetFlowContext",
+    "TargetUnit",
+    "ConversionFactor",
 ]
 
 
+def _fedelemflowlist_version():
+    try:
+        import pkg_resources
+
+        return pkg_resources.get_distribution("fedelemflowlist").version
+    except Exception:
+        return getattr(fedelemflowlist, "__version__", "unknown")
+
+
+def _mapping_key_hash(names, contexts, units=None):
+    """Hash (flow name, context[, unit]) rows to uint64 keys."""
+    keys = {
+        "name": pd.Series(names, dtype=object).values,
+        "context": pd.Series(contexts, dtype=object).values,
+    }
+    if units is not None:
+        keys["unit"] = pd.Series(units, dtype=object).values
+    return pd.util.hash_pandas_object(
+        pd.DataFrame(keys), index=False
+    ).values
+
+
+@lru_cache(maxsize=4)
+def load_flow_mapping_index(source_list=None, case_sensitive=True):
+    """
+    Return a hash index of the Federal LCA Commons flow mapping.
+
+    The index is built from fedelemflowlist.get_flowmapping once per source
+    list and fedelemflowlist version and saved in data/flow_mapping. Each
+    mapping row is keyed by a hash of (source flow name, source context,
+    source unit) and by a hash of (source flow name, source context).
+
+    Parameters
+    ----------
+    source_list : str, optional
+        Mapping source list (e.g. "eLCI"), by default all lists
+    case_sensitive : bool, optional
+        If False, source flow names are lower-cased and stripped, and
+        lookups should pass names normalized the same way. By default True.
+
+    Returns
+    -------
+    dataframe
+        Target name, UUID, context, unit and conversion factor and the
+        source unit of each mapping row, with "key_hash" and
+        "name_context_hash" columns.
+        "first_for_key" and "first_for_name_context" mark the first row for
+        each key.
+    """
+    index_path = join(
+        data_dir,
+        "flow_mapping",
+        f"flow_mapping_index_{source_list or 'all'}_"
+        f"{'cs' if case_sensitive else 'ci'}_"
+        f"{_fedelemflowlist_version()}_v{FLOW_MAPPING_INDEX_VERSION}.pkl",
+    )
+    if os.path.exists(index_path):
+        return pd.read_pickle(index_path)
+    mapping = fedelemflowlist.get_flowmapping(source_list)
+    names = mapping["SourceFlowName"]
+    if not case_sensitive:
+        names = names.str.lower().str.rstrip()
+    index_df = mapping.reindex(
+        columns=FLOW_MAPPING_TARGET_COLS + ["SourceUnit"]
+    ).reset_index(drop=True)
+    index_df["key_hash"] = _mapping_key_hash(
+        names, mapping["SourceFlowContext"], mapping["SourceUnit"]
+    )
+    index_df["name_context_hash"] = _mapping_key_hash(
+        names, mapping["SourceFlowContext"]
+    )
+    index_df["first_for_key"] = ~index_df["key_hash"].duplicated()
+    index_df["first_for_name_context"] = ~index_df[
+        "name_context_hash"
+    ].duplicated()
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    index_df.to_pickle(index_path)
+    return index_df
+
+
+def lookup_flow_mapping(index_df, names, contexts, units=None):
+    """
+    Look up the mapping of many flows at once.
+
+    Flows are matched on the first mapping row for (name, context). When
+    units are given, they are matched on (name, context, unit) first, and the
+    (name, context) row is only used if its source unit is the flow's unit
+    apart from case and spacing, so that its conversion factor applies.
+    Flows whose unit is not in the mapping are logged and left unmapped.
+
+    Parameters
+    ----------
+    index_df : dataframe
+        Index from load_flow_mapping_index
+    names, contexts : array-like
+        Source flow names and contexts
+    units : array-like, optional
+        Source units
+
+    Returns
+    -------
+    dataframe
+        FLOW_MAPPING_TARGET_COLS for each flow, in the order given, with
+        NaN for flows without a mapping
+    """
+
+    def _first_match(hash_col, first_col, query_hash):
+        first_rows = np.flatnonzero(index_df[first_col].values)
+        pos = pd.Index(index_df[hash_col].values[first_rows]).get_indexer(
+            query_hash
+        )
+        return np.where(pos >= 0, first_rows[pos], -1)
+
+    row = _first_match(
+        "name_context_hash",
+        "first_for_name_context",
+        _mapping_key_hash(names, contexts),
+    )
+    if units is not None:
+        unit_row = _first_match(
+            "key_hash", "first_for_key", _mapping_key_hash(names, contexts, units)
+        )
+        def _unit(values):
+            return pd.Series(values, dtype=object).astype(str).str.strip(
+            ).str.lower().values
+
+        same_unit = _unit(
+            index_df["SourceUnit"].values[np.where(row >= 0, row, 0)]
+        ) == _unit(units)
+        other_unit = (unit_row < 0) & (row >= 0) & ~same_unit
+        if other_unit.any():
+            unmapped = pd.DataFrame({
+                "name": pd.Series(names, dtype=object).values[other_unit],
+                "context": pd.Series(contexts, dtype=object).values[other_unit],
+                "unit": pd.Series(units, dtype=object).values[other_unit],
+            }).drop_duplicates()
+            module_logger.warning(
+                f"{other_unit.sum()} flows have a mapping only for another "
+                f"unit and are left unmapped:\n{unmapped.to_string(index=False)}"
+            )
+        row = np.where(
+            unit_row >= 0, unit_row, np.where(other_unit, -1, row)
+        )
+    targets = index_df[FLOW_MAPPING_TARGET_COLS].iloc[
+        np.where(row >= 0, row, 0)
+    ].reset_index(drop=True)
+    targets.loc[row < 0, :] = np.nan
+    return targets
+
+
 def map_emissions_to_fedelemflows(df_with_flows_compartments):
 
-    mapped_df = pd.merge(
-        df_with_flows_compartments,
-        mapping_to_fedelemflows.drop_duplicates(
-            subset=["SourceFlowName", "SourceFlowContext"]
-        ),
-        left_on=["FlowName", "Compartment"],
-        right_on=["SourceFlowName", "SourceFlowContext"],
-        how="left",
+    mapped_df = df_with_flows_compartments.reset_index(drop=True)
+    mapping = lookup_flow_mapping(
+        load_flow_mapping_index(),
+        mapped_df["FlowName"],
+        mapped_df["Compartment"],
     )
+    mapped_df["SourceListName"] = mapping["SourceListName"]
+    mapped_df["FlowUUID"] = mapping["TargetFlowUUID"]
     # If a NewName is present there was a match, replace FlowName and Compartment with new names
-    mapped_df.loc[
-        mapped_df["TargetFlowName"].notnull(), "FlowName"
-    ] = mapped_df["TargetFlowName"]
-    mapped_df.loc[
-        mapped_df["TargetFlowName"].notnull(), "Compartment"
-    ] = mapped_df["TargetFlowContext"]
-    mapped_df.loc[mapped_df["TargetFlowName"].notnull(), "Unit"] = mapped_df[
-        "TargetUnit"
-    ]
-
-    mapped_df = mapped_df.rename(columns={"TargetFlowUUID": "FlowUUID"})
+    matched = mapping["TargetFlowName"].notnull()
+    mapped_df.loc[matched, "FlowName"] = mapping["TargetFlowName"]
+    mapped_df.loc[matched, "Compartment"] = mapping["TargetFlowContext"]
+    mapped_df.loc[matched, "Unit"] = mapping["TargetUnit"]
 
     # If air, soil, or water assigned it directionality of emission. Others will get assigned later as needed
     emission_compartments = ["emission/air", "emission/ground", "emission/water"]
@@ -47,19 +194,6 @@ def map_emissions_to_fedelemflows(df_with_flows_compartments):
         mapped_df["Compartment"].isin(emission_compartments),
         "ElementaryFlowPrimeContext",
     ] = "emission"
-
-    # Drop all unneeded cols
-    mapped_df = mapped_df.drop(
-        columns=[
-            "SourceFlowName",
-            "SourceFlowContext",
-            "SourceUnit",
-            "TargetFlowName",
-            "TargetFlowContext",
-            "TargetFlowContext",
-            "TargetUnit",
-        ]
-    )
     return mapped_df
 
 
@@ -15,6 +15,7 @@ from electricitylci.dqi import lookup_score_with_bound_key
 from scipy.stats import t, norm
 from scipy.special import erfinv
 import ast
+import calendar
 import logging
 from electricitylci.egrid_facilities import egrid_facilities
 from electricitylci.eia923_generation import eia923_primary_fuel
@@ -81,6 +82,12 @@ def add_temporal_correlation_score(db, electricity_lci_target_year):
     return db
 
 
+def _period_cols(df):
+    """Columns that identify a sub-annual time period (e.g., "Month"), if any,
+    in addition to "Year"."""
+    return ["Month"] if "Month" in df.columns else []
+
+
 def aggregate_facility_flows(df):
     """Thus function aggregates flows from the same source (NEI, netl, etc.) within
     a facility. The main problem this solves is that if several emissions
@@ -118,7 +125,7 @@ def aggregate_facility_flows(df):
         "Source",
         "Compartment_path",
         "stage_code"
-    ]
+    ] + _period_cols(df)
 
     def wtd_mean(pdser, total_db, cols):
         try:
@@ -145,7 +152,7 @@ def aggregate_facility_flows(df):
     df_red = df_emissions.drop(df_emissions[df_dupes].index)
     group_db = (
         df_emissions.loc[df_dupes, :]
-        .groupby(groupby_cols, as_index=False).agg(
+        .groupby(groupby_cols, as_index=False, observed=True).agg(
                 {
                         "FlowAmount":"sum",
                         "ReliabilityScore":wm
@@ -249,9 +256,9 @@ def add_data_collection_score(db, elec_df, subregion="BA"):
     region_agg = subregion_col(subregion)
     fuel_agg = ["FuelCategory"]
     if region_agg:
-        groupby_cols = region_agg + fuel_agg + ["Year"]
+        groupby_cols = region_agg + fuel_agg + ["Year"] + _period_cols(db)
     else:
-        groupby_cols = fuel_agg + ["Year"]
+        groupby_cols = fuel_agg + ["Year"] + _period_cols(db)
     temp_df = db.merge(
         right=elec_df,
         left_on=groupby_cols + ["source_string"],
@@ -311,23 +318,25 @@ def calculate_electricity_by_source(db, subregion="BA"):
     db_powerplant=db.loc[power_plant_criteria,:]
     db_nonpower=db.loc[~power_plant_criteria,:]
     region_agg = subregion_col(subregion)
+    period_cols = _period_cols(db)
 
     fuel_agg = ["FuelCategory"]
     if region_agg:
         groupby_cols = (
             region_agg
             + fuel_agg
-            + ["Year", "stage_code", "FlowName", "Compartment"]
+            + ["Year"]
+            + period_cols
+            + ["stage_code", "FlowName", "Compartment"]
         )
-        elec_groupby_cols = region_agg + fuel_agg + ["Year"]
+        elec_groupby_cols = region_agg + fuel_agg + ["Year"] + period_cols
     else:
-        groupby_cols = fuel_agg + [
-            "Year",
+        groupby_cols = fuel_agg + ["Year"] + period_cols + [
             "stage_code",
             "FlowName",
             "Compartment",
         ]
-        elec_groupby_cols = fuel_agg + ["Year"]
+        elec_groupby_cols = fuel_agg + ["Year"] + period_cols
 
     combine_source_by_flow = lambda x: _combine_sources(
         x, db, ["FlowName", "Compartment"], 1
@@ -411,7 +420,9 @@ def calculate_electricity_by_source(db, subregion="BA"):
         ]
         #        total_filter = ~fuelcat_all & src_filter
         sub_db = db.loc[src_filter, :]
-        sub_db.drop_duplicates(subset=fuel_agg + ["eGRID_ID"], inplace=True)
+        sub_db.drop_duplicates(
+            subset=fuel_agg + ["eGRID_ID"] + period_cols, inplace=True
+        )
         sub_db_group = sub_db.groupby(elec_groupby_cols, as_index=False).agg(
             {"Electricity": [np.sum, np.mean], "eGRID_ID": "count"}
         )
@@ -477,7 +488,7 @@ def create_generation_process_df():
     }
     if model_specs.replace_egrid:
         generation_data = build_generation_data().drop_duplicates()
-        cems_df = ampd.generate_plant_emissions(model_specs.eia_gen_year)
+        cems_df = ampd.load_plant_emissions(model_specs.eia_gen_year)
         cems_df.drop(columns=["FlowUUID"], inplace=True)
         emissions_and_waste_for_selected_egrid_facilities = em_other.integrate_replace_emissions(
             cems_df, emissions_and_waste_for_selected_egrid_facilities
@@ -607,6 +618,81 @@ def create_generation_process_df():
     return final_database
 
 
+def create_monthly_generation_process_df(facility_df, year=None):
+    """
+    Spread facility-level annual emissions and generation over the months of
+    the year so that monthly emission factors can be calculated with
+    aggregate_data.
+
+    Every row of the input is expanded along a month axis in a single step.
+    Emissions with a CEMS source ("ampd") follow the plant's monthly CEMS mass
+    emissions for that pollutant, other flows follow the plant's monthly fuel
+    heat input, and generation follows the plant's monthly net generation
+    (all from ampd_plant_emissions.generate_monthly_plant_profiles). Plants
+    without fuel use fall back to their generation profile and plants missing
+    from EIA-923 are split evenly across the year.
+
+    Parameters
+    ----------
+    facility_df : dataframe
+        Facility-level emissions as generated by create_generation_process_df
+        (optionally combined with upstream and other inventories).
+    year : int, optional
+        Year of the monthly data, by default the eia_gen_year of the model
+        configuration.
+
+    Returns
+    -------
+    dataframe
+        The input dataframe with twelve rows for each input row and an added
+        "Month" column (1-12).
+    """
+    import electricitylci.ampd_plant_emissions as ampd
+
+    if year is None:
+        year = model_specs.eia_gen_year
+    months = list(range(1, 13))
+    profiles = ampd.generate_monthly_plant_profiles(year).set_index(
+        ["eGRID_ID", "profile"]
+    )
+    facility_df = facility_df.reset_index(drop=True)
+    plant_ids = (
+        pd.to_numeric(facility_df["eGRID_ID"], errors="coerce")
+        .fillna(-1)
+        .astype(int)
+        .values
+    )
+
+    def profile_shares(profile_names):
+        keys = pd.MultiIndex.from_arrays([plant_ids, profile_names])
+        return profiles.reindex(keys)[months].values
+
+    even_shares = np.full((len(facility_df), len(months)), 1 / len(months))
+    gen_shares = profile_shares(["Electricity"] * len(facility_df))
+    gen_shares = np.where(np.isnan(gen_shares), even_shares, gen_shares)
+    fuel_shares = profile_shares(["Fuel"] * len(facility_df))
+    fuel_shares = np.where(np.isnan(fuel_shares), gen_shares, fuel_shares)
+    cems_flows = (facility_df["Source"] == "ampd") & (
+        facility_df["FlowName"].isin(ampd.CEMS_PROFILE_FLOWS.values())
+    )
+    flow_shares = profile_shares(
+        facility_df["FlowName"].where(cems_flows, "Fuel").values
+    )
+    flow_shares = np.where(np.isnan(flow_shares), fuel_shares, flow_shares)
+
+    monthly_df = facility_df.loc[
+        facility_df.index.repeat(len(months)), :
+    ].reset_index(drop=True)
+    monthly_df["Month"] = np.tile(months, len(facility_df))
+    monthly_df["FlowAmount"] = (
+        monthly_df["FlowAmount"].values * flow_shares.ravel()
+    )
+    monthly_df["Electricity"] = (
+        monthly_df["Electricity"].values * gen_shares.ravel()
+    )
+    return monthly_df
+
+
 def aggregate_data(total_db, subregion="BA"):
     """
     Aggregates facility-level emissions to the specified subregion and
@@ -768,14 +854,16 @@ def aggregate_data(total_db, subregion="BA"):
 
     region_agg = subregion_col(subregion)
     fuel_agg = ["FuelCategory"]
+    period_cols = _period_cols(total_db)
     if region_agg:
         groupby_cols = (
             region_agg
             + fuel_agg
             + ["stage_code", "FlowName", "Compartment", "FlowUUID","Unit"]
+            + period_cols
         )
         elec_df_groupby_cols = (
-            region_agg + fuel_agg + ["Year", "source_string"]
+            region_agg + fuel_agg + ["Year"] + period_cols + ["source_string"]
         )
     else:
         groupby_cols = fuel_agg + [
@@ -784,8 +872,10 @@ def aggregate_data(total_db, subregion="BA"):
             "Compartment",
             "FlowUUID",
             "Unit"
-        ]
-        elec_df_groupby_cols = fuel_agg + ["Year", "source_string"]
+        ] + period_cols
+        elec_df_groupby_cols = (
+            fuel_agg + ["Year"] + period_cols + ["source_string"]
+        )
     if model_specs.replace_egrid:
         primary_fuel_df=eia923_primary_fuel(year=model_specs.eia_gen_year)
         primary_fuel_df.rename(columns={'Plant Id':"eGRID_ID"},inplace=True)
@@ -802,7 +892,7 @@ def aggregate_data(total_db, subregion="BA"):
     total_db, electricity_df = calculate_electricity_by_source(
         total_db, subregion
     )
-    total_db["FlowAmount"].replace(to_replace=0,value=1E-15,inplace=True)
+    total_db["FlowAmount"]=total_db["FlowAmount"].replace(to_replace=0,value=1E-15)
     total_db = add_data_collection_score(total_db, electricity_df, subregion)
     total_db["facility_emission_factor"] = (
         total_db["FlowAmount"] / total_db["Electricity"]
@@ -902,8 +992,8 @@ def aggregate_data(total_db, subregion="BA"):
     )
     # Infinite values generally coming from places with 0 generation. This happens
     # particularly with the Canadian mixes.
-    database_f3["Emission_factor"].replace(to_replace=float("inf"),value=0,inplace=True)
-    database_f3["Emission_factor"].replace(to_replace=float("-inf"),value=0,inplace=True)
+    database_f3["Emission_factor"]=database_f3["Emission_factor"].replace(to_replace=float("inf"),value=0)
+    database_f3["Emission_factor"]=database_f3["Emission_factor"].replace(to_replace=float("-inf"),value=0)
     if region_agg is not None:
         database_f3["GeomMean"], database_f3["GeomSD"] = zip(
             *database_f3[
@@ -970,10 +1060,11 @@ def olcaschema_genprocess(database, upstream_dict={}, subregion="BA"):
 
     region_agg = subregion_col(subregion)
     fuel_agg = ["FuelCategory"]
+    period_cols = _period_cols(database)
     if region_agg:
-        base_cols = region_agg + fuel_agg
+        base_cols = region_agg + fuel_agg + period_cols
     else:
-        base_cols = fuel_agg
+        base_cols = fuel_agg + period_cols
     non_agg_cols = [
         "stage_code",
         "FlowName",
@@ -1140,6 +1231,17 @@ def olcaschema_genprocess(database, upstream_dict={}, subregion="BA"):
             + " - "
             + process_df[region_agg].values
         )
+    if period_cols:
+        month_names = process_df["Month"].astype(int).map(
+            lambda x: calendar.month_name[x]
+        )
+        process_df["description"] = (
+            process_df["description"].str.rstrip(".")
+            + " during "
+            + month_names
+            + "."
+        )
+        process_df["name"] = process_df["name"] + " - " + month_names
     process_df["description"]=(
         process_df["description"]
         + " This process was created with ElectricityLCI " 
@@ -10,6 +10,7 @@ from electricitylci.process_dictionary_writer import *
 from electricitylci.egrid_facilities import egrid_facilities, egrid_subregions
 from electricitylci.model_config import model_specs
 from electricitylci.generation import eia_facility_fuel_region
+from electricitylci.utils import index_processes
 import logging
 
 # Get a subset of the egrid_facilities dataset
@@ -304,7 +305,7 @@ def create_generation_mix_process_df_from_egrid_ref_data(subregion=None):
     # return generation_mix_dict
 
 
-def olcaschema_genmix(database, gen_dict, subregion=None):
+def olcaschema_genmix(database, gen_dict, subregion=None, providers=None):
     if subregion is None:
         subregion = model_specs.regional_aggregation
     generation_mix_dict = {}
@@ -314,6 +315,8 @@ def olcaschema_genmix(database, gen_dict, subregion=None):
     else:
         region = ["US"]
         database["Subregion"] = "US"
+    if providers is None:
+        providers = index_processes(gen_dict)
     for reg in region:
 
         database_reg = database[database["Subregion"] == reg]
@@ -329,14 +332,7 @@ def olcaschema_genmix(database, gen_dict, subregion=None):
                 database_reg["FuelCategory"] == fuelname
             ]
             if database_f1.empty != True:
-                matching_dict = None
-                for generator in gen_dict:
-                    if (
-                        gen_dict[generator]["name"]
-                        == "Electricity - " + fuelname + " - " + reg
-                    ):
-                        matching_dict = gen_dict[generator]
-                        break
+                matching_dict = providers.get((reg, fuelname))
                 if matching_dict is None:
                     logging.warning(
                         f"Trouble matching dictionary for generation mix {fuelname} - {reg}. Skipping this flow for now"
@@ -361,7 +357,7 @@ def olcaschema_genmix(database, gen_dict, subregion=None):
     return generation_mix_dict
 
 
-def olcaschema_usaverage(database, gen_dict, subregion=None, excluded_regions = ['HIMS','HIOA','AKGD','AKMS']):
+def olcaschema_usaverage(database, gen_dict, subregion=None, excluded_regions = ['HIMS','HIOA','AKGD','AKMS'], providers=None):
     if subregion is None:
         subregion = model_specs.regional_aggregation
     generation_mix_dict = {}
@@ -379,6 +375,8 @@ def olcaschema_usaverage(database, gen_dict, subregion=None, excluded_regions =
     us_database = df3
     if "FuelCategory" in us_database.columns:
         fuels = list(pd.unique(us_database["FuelCategory"]))
+    if providers is None:
+        providers = index_processes(gen_dict)
 
     for fuel in fuels:
 
@@ -399,14 +397,7 @@ def olcaschema_usaverage(database, gen_dict, subregion=None, excluded_regions =
                         database_reg["Subregion"] == reg
                     ]
                     if database_f1.empty != True:
-                        matching_dict = None
-                        for generator in gen_dict:
-                            if (
-                                gen_dict[generator]["name"]
-                                == "Electricity - " + fuel + " - " + reg
-                            ):
-                                matching_dict = gen_dict[generator]
-                                break
+                        matching_dict = providers.get((reg, fuel))
                         if matching_dict is None:
                             logging.warning(
                                 f"Trouble matching dictionary for creating fuel mix {fuel} - {reg}.Skipping this flow for now"
@@ -430,7 +421,7 @@ def olcaschema_usaverage(database, gen_dict, subregion=None, excluded_regions =
 
     return generation_mix_dict
 
-def olcaschema_international(database, gen_dict, subregion=None):
+def olcaschema_international(database, gen_dict, subregion=None, providers=None):
     
     intl_database = pd.read_csv(data_dir+'/International_Electricity_Mix.csv')
     database = intl_database
@@ -440,6 +431,8 @@ def olcaschema_international(database, gen_dict, subregion=None):
     else:
         region = ["US"]
         database["Subregion"] = "US"
+    if providers is None:
+        providers = index_processes(gen_dict)
     for reg in region:
 
         database_reg = database[database["Subregion"] == reg]
@@ -455,14 +448,9 @@ def olcaschema_international(database, gen_dict, subregion=None):
                 database_reg["FuelCategory"] == fuelname
             ]
             if database_f1.empty != True:
-                matching_dict = None
-                for generator in gen_dict:
-                    if (
-                        gen_dict[generator]["name"]
-                        == "Electricity; at grid; USaverage - " + fuelname
-                       ):
-                        matching_dict = gen_dict[generator]
-                        break
+                matching_dict = providers.get(
+                    (fuelname, "Electricity; at grid; USaverage")
+                )
                 if matching_dict is None:
                     logging.warning(
                         f"Trouble matching dictionary for us average mix {fuelname} - USaverage. Skipping this flow for now"
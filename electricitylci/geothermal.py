@@ -107,7 +107,7 @@ def generate_upstream_geo(year):
         columns={"compartment": "Compartment", "Plant Id": "plant_id"},
         inplace=True,
     )
-    geo_merged["Compartment"].fillna(geo_merged["Directionality"],inplace=True)
+    geo_merged["Compartment"]=geo_merged["Compartment"].fillna(geo_merged["Directionality"])
     input_dict={"emission":False,"resource":True}
     geo_merged["Directionality"]=geo_merged["Directionality"].map(input_dict)
     geo_merged.rename(columns={"Directionality":"input"},inplace=True)
@@ -0,0 +1,201 @@
+"""
+Hourly balancing authority emission intensities.
+
+EPA CEMS hourly gross load and mass emissions (the monthly 'epacems_hourly'
+files, not the daily files used for the annual inventory) are summed to
+balancing authority and UTC hour and joined with the hourly net generation
+series from the EIA bulk (EBA) download. CEMS files are read in chunks and added into a fixed
+balancing authority x hour accumulator, so memory use does not grow with the
+number of CEMS records.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+import electricitylci.cems_data as cems
+import electricitylci.eia860_facilities as eia860
+from electricitylci.bulk_eia_data import load_eba_cube
+from electricitylci.globals import output_dir
+
+module_logger = logging.getLogger("hourly_emissions.py")
+
+# CEMS operating dates and hours are in local standard time for the whole
+# year, so a fixed offset per state converts them to UTC. States split
+# across time zones use the zone that holds most of their generation.
+CEMS_STATE_UTC_OFFSET = {
+    "AL": -6, "AR": -6, "AZ": -7, "CA": -8, "CO": -7, "CT": -5, "DC": -5,
+    "DE": -5, "FL": -5, "GA": -5, "IA": -6, "ID": -7, "IL": -6, "IN": -5,
+    "KS": -6, "KY": -5, "LA": -6, "MA": -5, "MD": -5, "ME": -5, "MI": -5,
+    "MN": -6, "MO": -6, "MS": -6, "MT": -7, "NC": -5, "ND": -6, "NE": -6,
+    "NH": -5, "NJ": -5, "NM": -7, "NV": -8, "NY": -5, "OH": -5, "OK": -6,
+    "OR": -8, "PA": -5, "RI": -5, "SC": -5, "SD": -6, "TN": -6, "TX": -6,
+    "UT": -7, "VA": -5, "VT": -5, "WA": -8, "WI": -6, "WV": -5, "WY": -7,
+}
+
+HOURLY_CEMS_COLS = [
+    "gross_load_mwh",
+    "heat_content_mmbtu",
+    "co2_mass_tons",
+    "so2_mass_tons",
+    "nox_mass_tons",
+]
+
+HOURLY_INTENSITY_COLS = {
+    "co2_mass_tons": "co2_tons_per_mwh",
+    "so2_mass_tons": "so2_tons_per_mwh",
+    "nox_mass_tons": "nox_tons_per_mwh",
+}
+
+
+def _hours_in_year(year):
+    return int(
+        (pd.Timestamp(year + 1, 1, 1) - pd.Timestamp(year, 1, 1))
+        / pd.Timedelta(hours=1)
+    )
+
+
+def _cems_chunk_to_hourly(chunk, year, utc_offset):
+    """
+    Convert one chunk of an hourly CEMS file to plant-level values in tons
+    and MWh, indexed by the UTC hour of the year.
+
+    Parameters
+    ----------
+    chunk : dataframe
+        Rows from cems_data.read_cems_csv
+    year : int
+        Year of the data, used to find the first hour of the year
+    utc_offset : int
+        Hours between local standard time and UTC for the file's state
+
+    Returns
+    -------
+    tuple
+        (plant ids, hour-of-year indices, 2-D array of HOURLY_CEMS_COLS)
+    """
+    if "op_hour" not in chunk.columns:
+        raise ValueError(
+            "CEMS data has no operating hour column; hourly intensities "
+            "need the hourly (epacems_hourly) files"
+        )
+    op_date = pd.to_datetime(chunk["op_date"], format="%m-%d-%Y").values
+    if "operating_time_hours" in chunk.columns:
+        op_time = chunk["operating_time_hours"].fillna(0).values
+    else:
+        op_time = 1
+    values = np.column_stack([
+        chunk["gross_load_mw"].values * op_time,
+        chunk["heat_content_mmbtu"].values,
+        chunk["co2_mass_tons"].values,
+        chunk["so2_mass_lbs"].values / 2000,
+        chunk["nox_mass_lbs"].values / 2000,
+    ])
+    local_hour = (
+        op_date.astype("datetime64[h]")
+        + chunk["op_hour"].values.astype("timedelta64[h]")
+    )
+    plant_ids = chunk["plant_id_eia"].values
+    utc_hour = local_hour - np.timedelta64(utc_offset, "h")
+    hour_idx = (
+        utc_hour - np.datetime64(f"{year}-01-01T00", "h")
+    ).astype(int)
+    return plant_ids, hour_idx, np.nan_to_num(values)
+
+
+def generate_hourly_emission_intensity(year, chunksize=100000):
+    """
+    Calculate hourly emission intensities for each balancing authority from
+    EPA CEMS emissions and EIA hourly net generation.
+
+    The hourly CEMS files are downloaded if needed. CEMS records are mapped
+    to balancing authorities using EIA-860 and summed into a balancing
+    authority x hour array one chunk at a time, so only chunksize rows of
+    CEMS data are held in memory at once.
+
+    Parameters
+    ----------
+    year : int
+        Year of CEMS and EBA data to use
+    chunksize : int, optional
+        Number of CEMS rows to read at a time, by default 100000
+
+    Returns
+    -------
+    dataframe
+        One row per balancing authority and UTC hour with EBA net generation,
+        CEMS gross load, heat input and CO2/SO2/NOx mass emissions (tons),
+        and the emissions per MWh of net generation. Intensities are NaN for
+        hours without positive net generation.
+    """
+    plant_ba = eia860.eia860_balancing_authority(year)
+    plant_ba = plant_ba.dropna(subset=["Balancing Authority Code"])
+    plant_ba = plant_ba.drop_duplicates(subset=["Plant Id"])
+    ba_codes = sorted(plant_ba["Balancing Authority Code"].unique())
+    ba_idx = pd.Series(range(len(ba_codes)), index=ba_codes)
+    plant_ba_idx = pd.Series(
+        plant_ba["Balancing Authority Code"].map(ba_idx).values,
+        index=plant_ba["Plant Id"].astype(int).values,
+    )
+    n_hours = _hours_in_year(year)
+    n_cells = len(ba_codes) * n_hours
+    totals = np.zeros((len(HOURLY_CEMS_COLS), n_cells))
+
+    states = [s for s in cems.cems_states.keys() if s in CEMS_STATE_UTC_OFFSET]
+    cems.update("epacems_hourly", year, states)
+    for state in states:
+        for month in cems.source_periods["epacems_hourly"]:
+            filename = cems.get_epacems_file(
+                year, month, state, source="epacems_hourly"
+            )
+            module_logger.info(f"Reading {year} - {state} - month {month}")
+            for chunk in cems.read_cems_csv(filename, chunksize=chunksize):
+                plant_ids, hour_idx, values = _cems_chunk_to_hourly(
+                    chunk, year, CEMS_STATE_UTC_OFFSET[state]
+                )
+                row_ba = plant_ba_idx.reindex(plant_ids).values
+                keep = (
+                    ~np.isnan(row_ba) & (hour_idx >= 0) & (hour_idx < n_hours)
+                )
+                cell = row_ba[keep].astype(int) * n_hours + hour_idx[keep]
+                for i in range(len(HOURLY_CEMS_COLS)):
+                    totals[i] += np.bincount(
+                        cell, weights=values[keep, i], minlength=n_cells
+                    )
+
+    module_logger.info("Reading EBA hourly net generation")
+    cube = load_eba_cube(year)
+    cube_idx = pd.Series(range(len(cube["bas"])), index=cube["bas"])
+    net_gen = np.zeros((len(ba_codes), n_hours))
+    in_cube = [ba for ba in ba_codes if ba in cube_idx.index]
+    net_gen[ba_idx[in_cube].values, :] = np.nan_to_num(
+        cube["net_gen"][cube_idx[in_cube].values, :n_hours]
+    )
+    net_gen = net_gen.ravel()
+
+    hourly_df = pd.DataFrame(totals.T, columns=HOURLY_CEMS_COLS)
+    hourly_df.insert(0, "net_generation_mwh", net_gen)
+    hours = pd.date_range(
+        start=f"{year}-01-01", periods=n_hours, freq="60min", tz="UTC"
+    )
+    hourly_df.insert(
+        0, "datetime", hours.take(np.tile(np.arange(n_hours), len(ba_codes)))
+    )
+    hourly_df.insert(
+        0, "Balancing Authority Code", np.repeat(ba_codes, n_hours)
+    )
+    has_gen = hourly_df["net_generation_mwh"] > 0
+    net_gen_mwh = hourly_df["net_generation_mwh"].where(has_gen)
+    for mass_col, intensity_col in HOURLY_INTENSITY_COLS.items():
+        hourly_df[intensity_col] = hourly_df[mass_col] / net_gen_mwh
+    hourly_df = hourly_df.loc[
+        has_gen | (hourly_df["gross_load_mwh"] > 0), :
+    ].reset_index(drop=True)
+    return hourly_df
+
+
+if __name__ == "__main__":
+    year = 2016
+    df = generate_hourly_emission_intensity(year)
+    df.to_csv(f"{output_dir}/hourly_emission_intensity_{year}.csv")
@@ -14,6 +14,9 @@ def main():
     logger = logging.getLogger("main")
     if config.model_specs is None:
         config.model_specs = config.build_model_class()
+    if config.model_specs.offline_bundle:
+        from electricitylci.data_bundle import verify_bundle
+        verify_bundle()
     # There are essentially two paths - with and without upstream (i.e., fuel)
     # processes.
     if config.model_specs.include_upstream_processes is True:
@@ -29,7 +32,7 @@ def main():
         # has to be done here if the information is going to be included in final
         # outputs.
         upstream_dict = electricitylci.write_upstream_dicts_to_jsonld(upstream_dict)
-        generation_process_df = electricitylci.get_generation_process_df(
+        generation_facility_df = electricitylci.get_generation_facility_df(
             upstream_df=upstream_df, upstream_dict=upstream_dict
         )
     else:
@@ -37,10 +40,16 @@ def main():
         # include upstream and Canadian data.
         upstream_dict={}
         upstream_df=None
-        generation_process_df = electricitylci.get_generation_process_df(
+        generation_facility_df = electricitylci.get_generation_facility_df(
             upstream_df=upstream_df
         )
+    generation_process_df = electricitylci.get_generation_process_df(
+        facility_df=generation_facility_df
+    )
     print("write gen process to jsonld")
+    # Index of the processes written so far, keyed on region and fuel or mix
+    # type, for linking each mix to its providers (see utils.index_processes)
+    providers = {}
     if config.model_specs.regional_aggregation in ["FERC","US"]:
         generation_process_dict = electricitylci.write_gen_fuel_database_to_dict(
             generation_process_df, upstream_dict, subregion="BA"
@@ -50,8 +59,34 @@ def main():
             generation_process_df, upstream_dict
         )
     generation_process_dict = electricitylci.write_process_dicts_to_jsonld(
-        generation_process_dict
+        generation_process_dict, providers=providers
     )
+    if config.model_specs.temporal_resolution == "monthly":
+        print("write monthly gen process to jsonld")
+        monthly_generation_process_df = (
+            electricitylci.get_monthly_generation_process_df(
+                generation_facility_df
+            )
+        )
+        if config.model_specs.regional_aggregation in ["FERC","US"]:
+            monthly_generation_process_dict = electricitylci.write_gen_fuel_database_to_dict(
+                monthly_generation_process_df, upstream_dict, subregion="BA"
+            )
+        else:
+            monthly_generation_process_dict = electricitylci.write_gen_fuel_database_to_dict(
+                monthly_generation_process_df, upstream_dict
+            )
+        monthly_generation_process_dict = electricitylci.write_process_dicts_to_jsonld(
+            monthly_generation_process_dict, providers=providers
+        )
+    if config.model_specs.hourly_emission_intensity:
+        print("get hourly emission intensities")
+        hourly_df = electricitylci.get_hourly_emission_intensity_df()
+        hourly_df.to_csv(
+            f"{output_dir}/hourly_emission_intensity_"
+            f"{config.model_specs.eia_gen_year}.csv",
+            index=False,
+        )
     # We force the generation of BA aggregation if we're doing FERC, US, or BA
     # regions. This is because the consumption mixes are based on imports from
     # balancing authority areas.
@@ -62,10 +97,10 @@ def main():
         generation_mix_df = electricitylci.get_generation_mix_process_df()
     print("write gen mix to dict")
     generation_mix_dict = electricitylci.write_generation_mix_database_to_dict(
-        generation_mix_df, generation_process_dict)
+        generation_mix_df, generation_process_dict, providers=providers)
     print("write gen mix to jsonld")
     generation_mix_dict = electricitylci.write_process_dicts_to_jsonld(
-        generation_mix_dict
+        generation_mix_dict, providers=providers
     )
 
     # At this point the two methods diverge from underlying functions enough that
@@ -79,12 +114,13 @@ def main():
         for subreg in cons_mix_df_dict.keys():
             # NEED TO FIND A WAY TO SPECIFY REGION HERE
             cons_mix_dicts[subreg] = electricitylci.write_consumption_mix_to_dict(
-                cons_mix_df_dict[subreg], generation_mix_dict,subregion=subreg
+                cons_mix_df_dict[subreg], generation_mix_dict,subregion=subreg,
+                providers=providers
             )
         print("write consumption mix to jsonld")
         for subreg in cons_mix_dicts.keys():
             cons_mix_dicts[subreg] = electricitylci.write_process_dicts_to_jsonld(
-                cons_mix_dicts[subreg])
+                cons_mix_dicts[subreg], providers=providers)
         print("get distribution mix")
         dist_mix_df_dict={}
         for subreg in cons_mix_dicts.keys():
@@ -94,7 +130,8 @@ def main():
         dist_mix_dicts={}
         for subreg in dist_mix_df_dict.keys():
             dist_mix_dicts[subreg] = electricitylci.write_distribution_mix_to_dict(
-                dist_mix_df_dict[subreg], cons_mix_dicts[subreg],subregion=subreg
+                dist_mix_df_dict[subreg], cons_mix_dicts[subreg],subregion=subreg,
+                providers=providers
             )
         print("write dist mix to jsonld")
         for subreg in dist_mix_dicts.keys():
@@ -103,16 +140,16 @@ def main():
     else:
         print("us average mix to dict")
         usavegfuel_mix_dict = electricitylci.write_fuel_mix_database_to_dict(
-        generation_mix_df, generation_process_dict)
+        generation_mix_df, generation_process_dict, providers=providers)
         print("write us average mix to jsonld")
         usavegfuel_mix_dict = electricitylci.write_process_dicts_to_jsonld(
-            usavegfuel_mix_dict
+            usavegfuel_mix_dict, providers=providers
         )    
         print("international average mix to dict")
         international_mix_dict = electricitylci.write_international_mix_database_to_dict(
-        generation_mix_df, usavegfuel_mix_dict)
+        generation_mix_df, usavegfuel_mix_dict, providers=providers)
         international_mix_dict = electricitylci.write_process_dicts_to_jsonld(
-        international_mix_dict
+        international_mix_dict, providers=providers
         ) 
         # Get surplus and consumption mix dictionary
         sur_con_mix_dict = electricitylci.write_surplus_pool_and_consumption_mix_dict()
@@ -122,14 +159,42 @@ def main():
             generation_mix_dict
         )
         print('write surplus pool consumption mix to jsonld')
-        sur_con_mix_dict = electricitylci.write_process_dicts_to_jsonld(sur_con_mix_dict)
+        sur_con_mix_dict = electricitylci.write_process_dicts_to_jsonld(
+            sur_con_mix_dict, providers=providers
+        )
         print('Filling up UUID of surplus pool consumption mix')
         sur_con_mix_dict = fill_default_provider_uuids(
-            sur_con_mix_dict, sur_con_mix_dict, generation_mix_dict, international_mix_dict
+            sur_con_mix_dict, providers=providers
         )
         sur_con_mix_dict = electricitylci.write_process_dicts_to_jsonld(sur_con_mix_dict)
-        dist_dict = fill_default_provider_uuids(dist_dict, sur_con_mix_dict)
+        dist_dict = fill_default_provider_uuids(dist_dict, providers=providers)
         dist_dict = electricitylci.write_process_dicts_to_jsonld(dist_dict)
+    if config.model_specs.cumulative_inventory:
+        print("calculate cumulative inventories")
+        if config.model_specs.EPA_eGRID_trading is False:
+            mix_dicts = (
+                [generation_mix_dict]
+                + list(cons_mix_dicts.values())
+                + list(dist_mix_dicts.values())
+            )
+        else:
+            mix_dicts = [
+                generation_mix_dict,
+                usavegfuel_mix_dict,
+                international_mix_dict,
+                sur_con_mix_dict,
+                dist_dict,
+            ]
+        inventory_df = electricitylci.get_cumulative_inventory_df(
+            upstream_dict,
+            generation_process_dict,
+            *mix_dicts,
+            targets=[p["name"] for d in mix_dicts for p in d.values()],
+        )
+        inventory_df.to_csv(
+            f"{output_dir}/cumulative_inventory_"
+            f"{config.model_specs.eia_gen_year}.csv"
+        )
     logger.info(
         f'JSON-LD files have been saved in the "output" folder with the full path '
         f'{config.model_specs.namestr}'
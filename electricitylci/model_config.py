@@ -69,6 +69,17 @@ def check_model_specs(model_specs):
                 f"use eia_gen_year to calculate fuel use. The json-ld file "
                 f"will not import correctly."
         )
+    temporal_resolution = model_specs.get("temporal_resolution", "annual")
+    if temporal_resolution not in ["annual", "monthly"]:
+        raise ConfigurationError(
+            f"temporal_resolution ({temporal_resolution}) must be 'annual' "
+            f"or 'monthly'"
+        )
+    if temporal_resolution == "monthly" and not model_specs["replace_egrid"]:
+        raise ConfigurationError(
+            "Monthly generation processes are built from EIA-923 and CEMS "
+            "monthly data and require replace_egrid to be True"
+        )
 
 class ModelSpecs:
     
@@ -104,6 +115,28 @@ class ModelSpecs:
         self.fuel_name = pd.read_csv(join(data_dir, self.fuel_name_file))
         self.post_process_generation_emission_factors = model_specs["post_process_generation_emission_factors"]
         self.gen_mix_from_model_generation_data=False
+        # "annual" or "monthly" - monthly also writes per-month generation
+        # processes alongside the annual ones.
+        self.temporal_resolution = model_specs.get(
+            "temporal_resolution", "annual"
+        )
+        # Also write hourly balancing authority emission intensities from
+        # CEMS and EIA hourly net generation.
+        self.hourly_emission_intensity = model_specs.get(
+            "hourly_emission_intensity", False
+        )
+        # Memory (MB) the dataset cache may hold before it spills the least
+        # recently used input datasets to disk.
+        self.dataset_cache_memory_mb = model_specs.get(
+            "dataset_cache_memory_mb", 2048
+        )
+        # Read inputs only from the data bundle (see data_bundle.py).
+        self.offline_bundle = model_specs.get("offline_bundle", False)
+        # Also write the cumulative inventories of the mix and distribution
+        # processes, calculated in memory (see technosphere.py).
+        self.cumulative_inventory = model_specs.get(
+            "cumulative_inventory", False
+        )
         self.namestr = (
             f"{output_dir}/{model_name}_jsonld_"
             f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
@@ -3,8 +3,10 @@
 import io
 import zipfile
 import os
+import hashlib
 from os.path import join
 from electricitylci.globals import data_dir
+from electricitylci.data_bundle import require_network
 
 import requests
 import pandas as pd
@@ -25,6 +27,7 @@ def download_unzip(url, unzip_path):
         Destination to unzip the data
 
     """
+    require_network(url)
     r = requests.get(url)
     content_type = r.headers["Content-Type"]
     if "zip" not in content_type and "-stream" not in content_type:
@@ -55,6 +58,39 @@ def find_file_in_folder(folder_path, file_pattern_match, return_name=True):
         return (file_path, file_name)
 
 
+def type_columns(df, text_cols=()):
+    """
+    Give every column of a parsed spreadsheet a fixed type, so the saved
+    table reads back the same way every time.
+
+    Parameters
+    ----------
+    df : dataframe
+        Parsed sheet, changed in place
+    text_cols : iterable, optional
+        Identifier columns that are always text (e.g. "Plant Id")
+
+    Returns
+    -------
+    dataframe
+        df, where columns whose values are all numbers are numeric and every
+        other object column is text
+    """
+    for col in df.columns:
+        values = df[col]
+        if col in text_cols or values.dtype == object:
+            text = values.where(values.isnull(), values.astype(str))
+            if col in text_cols:
+                df[col] = text
+                continue
+            numeric = pd.to_numeric(values, errors="coerce")
+            if numeric.count() == values.count():
+                df[col] = numeric
+            else:
+                df[col] = text
+    return df
+
+
 def create_ba_region_map(
     match_fn="BA code match.csv", region_col="ferc_region"
 ):
@@ -87,7 +123,66 @@ def create_ba_region_map(
     return map_series
 
 
-def fill_default_provider_uuids(dict_to_fill, *args):
+def provider_key(name):
+    """
+    Key a provider process on its region and fuel or mix type.
+
+    Process names give the type of the process first and the region last
+    (e.g. "Electricity - COAL - SERC" or "Electricity; at grid; generation
+    mix - SERC"). Generation processes are typed by their fuel, every other
+    process by the part of the name before the region.
+
+    Parameters
+    ----------
+    name: str
+        Process name
+
+    Returns
+    -------
+    tuple
+        (region, fuel or mix type), e.g. ("SERC", "COAL") or
+        ("SERC", "Electricity; at grid; generation mix"). For the US average
+        fuel mixes the fuel takes the place of the region, e.g.
+        ("COAL", "Electricity; at grid; USaverage").
+    """
+    mix_type, _, region = name.partition(" - ")
+    if mix_type == "Electricity":
+        mix_type, _, region = region.partition(" - ")
+    return region, mix_type
+
+
+def index_processes(*process_dicts, index=None):
+    """
+    Index openLCA schema processes for linking providers.
+
+    Build the index once, as the processes are written, and look providers
+    up in it instead of scanning every process for each exchange.
+
+    Parameters
+    ----------
+    *process_dicts: dictionary
+        Any number of dictionaries of processes, as written by
+        olca_jsonld_writer.write
+    index: dictionary, optional
+        An index to add the processes to, by default a new one
+
+    Returns
+    -------
+    dictionary
+        (region, fuel or mix type) (see provider_key): process. Processes
+        without a UUID have not been written and are left out. If several
+        processes have the same key, the first one found is kept.
+    """
+    if index is None:
+        index = {}
+    for process_dict in process_dicts:
+        for process in process_dict.values():
+            if isinstance(process.get("uuid"), str):
+                index.setdefault(provider_key(process["name"]), process)
+    return index
+
+
+def fill_default_provider_uuids(dict_to_fill, *args, providers=None):
     """
     Fills in UUIDs.
     
@@ -105,6 +200,9 @@ def fill_default_provider_uuids(dict_to_fill, *args):
     *args: dictionary
         Any number of dictionaries to search for matching processes
         for the UUIDs
+    providers : dictionary, optional
+        Index of the processes that have been written (see
+        index_processes). If given, it is searched instead of args.
 
     Returns
     -------
@@ -112,31 +210,72 @@ def fill_default_provider_uuids(dict_to_fill, *args):
         The dict_to_fill input with UUIDs filled in where matching
         processes were found.
     """
-    found = False
     dict_list = list(args)
     list_of_dicts = [isinstance(x,dict) for x in dict_list]
     print("Attempting to find UUIDs for default providers...")
     if all(list_of_dicts):
+        if providers is None:
+            providers = index_processes(*args)
         for key in dict_to_fill.keys():
             for exch in dict_to_fill[key]['exchanges']:
                 if exch['input'] is True and isinstance(exch['provider'],dict):
-                    found=False
-                    for src_dict in args:
-                        for src_key in src_dict.keys():
-                            if src_dict[src_key]["name"]==exch["provider"]["name"] and isinstance(src_dict[src_key]["uuid"],str):
-                                exch["provider"]["@id"]=src_dict[src_key]["uuid"]
-                                module_logger.debug(f"UUID for {exch['provider']} found")
-                                found = True
-                                break;
-                        if found:
-                            break;
-                    if not found:
+                    process = providers.get(
+                        provider_key(exch["provider"]["name"])
+                    )
+                    if process is not None:
+                        exch["provider"]["@id"]=process["uuid"]
+                        module_logger.debug(f"UUID for {exch['provider']} found")
+                    else:
                         module_logger.info(f"UUID for {exch['provider']} not found")
     else:
         module_logger.warning(f"All arguments into function must be dictionaries")
     return dict_to_fill
 
 
+# Model settings that filter the plants in the EIA-923 generation data (see
+# eia923_generation.build_generation_data)
+GENERATION_FILTER_SETTINGS = [
+    "include_only_egrid_facilities_with_positive_generation",
+    "filter_on_efficiency",
+    "egrid_facility_efficiency_filters",
+    "filter_on_min_plant_percent_generation_from_primary_fuel",
+    "keep_mixed_plant_category",
+    "min_plant_percent_generation_from_primary_fuel_category",
+]
+
+
+def settings_key(input_files=(), extra=()):
+    """
+    Hash the inputs of a saved intermediate result, for use in its file name.
+
+    Parameters
+    ----------
+    input_files : iterable, optional
+        Paths of input files; their names, sizes and modification times are
+        hashed
+    extra : iterable, optional
+        Other values the result depends on (e.g. table format versions)
+
+    Returns
+    -------
+    str
+        16 character hex digest of the generation filter settings of the
+        model (GENERATION_FILTER_SETTINGS), the input files and extra
+    """
+    from electricitylci.model_config import model_specs
+
+    settings = [
+        getattr(model_specs, name) for name in GENERATION_FILTER_SETTINGS
+    ]
+    for path in input_files:
+        stat = os.stat(path)
+        settings.append(
+            (os.path.basename(path), stat.st_size, int(stat.st_mtime))
+        )
+    settings.extend(extra)
+    return hashlib.sha1(repr(settings).encode()).hexdigest()[:16]
+
+
 def make_valid_version_num(foo):
     """
     Strips letters from a string to keep only digits and periods to try to make the version
@@ -14,7 +14,7 @@ setup(
         'fedelemflowlist @ git+https://github.com/USEPA/Federal-LCA-Commons-Elementary-Flow-List@v1.0.2#egg=fedelemflowlist',
         'StEWI @ git+https://github.com/USEPA/standardizedinventories@v0.9.3#egg=StEWI',
         'numpy>=1.14',
-        'pandas>=0.24',
+        'pandas>=1.5',
         'olca-ipc>=0.0.6',
         'openpyxl>=2.5',
         'matplotlib>=2.2',
@@ -22,7 +22,8 @@ setup(
         'sympy>=1.2',
         'xlrd>=1.1',
         'pyyaml>=5.1',
-        'requests>=2.2'
+        'requests>=2.2',
+        'scipy>=1.1'
         ],
     long_description=open('README.md').read(),
     classifiers=[